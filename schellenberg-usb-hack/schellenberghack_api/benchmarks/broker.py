@@ -0,0 +1,170 @@
+"""
+Minimal in-process MQTT 3.1.1 broker stand-in for benchmarks.
+
+Supports what the API and the benchmark clients use: CONNECT, PUBLISH
+(QoS 0/1, retained messages), SUBSCRIBE/UNSUBSCRIBE with ``+``/``#``
+wildcards, PINGREQ and DISCONNECT. Messages are delivered with QoS 0.
+"""
+
+import asyncio
+import struct
+import time
+from typing import Callable
+
+
+def _encode_length(length: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        out.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(out)
+
+
+def _string(data: bytes) -> bytes:
+    return struct.pack("!H", len(data)) + data
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for index, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if index >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[index]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+class _Session:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.filters: set[str] = set()
+
+    def publish(self, topic: str, payload: bytes, retain: bool = False):
+        body = _string(topic.encode()) + payload
+        self.writer.write(
+            bytes([0x30 | int(retain)]) + _encode_length(len(body)) + body
+        )
+
+
+class MiniBroker:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.sessions: set[_Session] = set()
+        self.retained: dict[str, bytes] = {}
+        self.published = 0
+        # Called with (topic, payload, monotonic time) for every PUBLISH
+        self.on_publish: Callable[[str, bytes, float], None] | None = None
+        self._server: asyncio.Server | None = None
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            for session in list(self.sessions):
+                session.writer.close()
+
+    async def _read_packet(
+        self, reader: asyncio.StreamReader
+    ) -> tuple[int, bytes]:
+        header = (await reader.readexactly(1))[0]
+        length, multiplier = 0, 1
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        return header, await reader.readexactly(length)
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        session = _Session(writer)
+        self.sessions.add(session)
+        try:
+            while True:
+                header, body = await self._read_packet(reader)
+                packet_type = header >> 4
+                if packet_type == 1:  # CONNECT
+                    writer.write(b"\x20\x02\x00\x00")
+                elif packet_type == 3:  # PUBLISH
+                    self._handle_publish(writer, header, body)
+                elif packet_type == 8:  # SUBSCRIBE
+                    self._handle_subscribe(session, body)
+                elif packet_type == 10:  # UNSUBSCRIBE
+                    offset = 2
+                    while offset < len(body):
+                        (size,) = struct.unpack_from("!H", body, offset)
+                        session.filters.discard(
+                            body[offset + 2:offset + 2 + size].decode()
+                        )
+                        offset += 2 + size
+                    writer.write(b"\xb0\x02" + body[:2])
+                elif packet_type == 12:  # PINGREQ
+                    writer.write(b"\xd0\x00")
+                elif packet_type == 14:  # DISCONNECT
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.sessions.discard(session)
+            writer.close()
+
+    def _handle_publish(
+        self, writer: asyncio.StreamWriter, header: int, body: bytes
+    ):
+        qos = (header >> 1) & 0x03
+        retain = bool(header & 0x01)
+        (size,) = struct.unpack_from("!H", body)
+        topic = body[2:2 + size].decode()
+        offset = 2 + size
+        if qos:
+            packet_id = body[offset:offset + 2]
+            offset += 2
+            # PUBACK for QoS 1, PUBREC for QoS 2 (PUBREL/PUBCOMP ignored)
+            writer.write((b"\x40\x02" if qos == 1 else b"\x50\x02")
+                         + packet_id)
+        payload = body[offset:]
+        self.published += 1
+        if self.on_publish:
+            self.on_publish(topic, payload, time.monotonic())
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+        for session in self.sessions:
+            if any(topic_matches(f, topic) for f in session.filters):
+                session.publish(topic, payload)
+
+    def _handle_subscribe(self, session: _Session, body: bytes):
+        packet_id = body[:2]
+        offset = 2
+        granted = bytearray()
+        new_filters = []
+        while offset < len(body):
+            (size,) = struct.unpack_from("!H", body, offset)
+            topic_filter = body[offset + 2:offset + 2 + size].decode()
+            offset += 3 + size
+            session.filters.add(topic_filter)
+            new_filters.append(topic_filter)
+            granted.append(0)
+        payload = packet_id + bytes(granted)
+        session.writer.write(
+            b"\x90" + _encode_length(len(payload)) + payload
+        )
+        for topic, retained in self.retained.items():
+            if any(topic_matches(f, topic) for f in new_filters):
+                session.publish(topic, retained, retain=True)
@@ -0,0 +1,111 @@
+"""
+Import-time profile of the API startup.
+
+Runs ``python -X importtime -c "import <module>"`` in a fresh interpreter
+and reports the total wall time plus the modules with the highest
+cumulative and self import time. With ``--settings-size N`` it also times
+the first ``get_settings()`` call against a temporary registry of N
+senders, which is the cost the lazy settings provider moved out of import.
+
+Usage:
+    python benchmarks/import_profile.py [--module schellenberghack_api.main]
+                                        [--top 20] [--json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def profile_imports(module: str, env: dict[str, str]) -> dict:
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    wall = time.perf_counter() - started
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({
+            "module": name.strip(),
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+        })
+    return {
+        "wall_s": wall,
+        "total_self_us": sum(m["self_us"] for m in modules),
+        "modules": modules,
+    }
+
+
+def time_settings_load(size: int, env: dict[str, str]) -> float:
+    """Seconds for the first get_settings() with ``size`` senders."""
+    workdir = Path(tempfile.mkdtemp(prefix="schellenberg-import-"))
+    path = workdir / "settings.json"
+    path.write_text(json.dumps({
+        "senders": [
+            {"device_id": f"{index:06X}",
+             "connected_devices": [{"enumerator": "01"}]}
+            for index in range(size)
+        ],
+    }))
+    code = (
+        "import time\n"
+        "from schellenberghack.settings import get_settings\n"
+        "started = time.perf_counter()\n"
+        "get_settings()\n"
+        "print(time.perf_counter() - started)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True,
+        env=env | {"SETTINGS_FILE": str(path)}, check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--module", default="schellenberghack_api.main")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--settings-size", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    # Keep the profiled import from touching the real registry
+    env = os.environ | {
+        "SETTINGS_FILE": str(Path(tempfile.mkdtemp()) / "settings.json"),
+        "PYTHONDONTWRITEBYTECODE": "1",
+    }
+    report = profile_imports(args.module, env)
+    if args.settings_size:
+        report["settings_load_s"] = time_settings_load(
+            args.settings_size, env
+        )
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"import {args.module}: {report['wall_s'] * 1000:.1f} ms wall, "
+          f"{report['total_self_us'] / 1000:.1f} ms in module bodies")
+    if "settings_load_s" in report:
+        print(f"first get_settings() with {args.settings_size} senders: "
+              f"{report['settings_load_s'] * 1000:.1f} ms")
+    for key in ("cumulative_us", "self_us"):
+        print(f"\ntop {args.top} by {key}:")
+        ranked = sorted(report["modules"], key=lambda m: m[key],
+                        reverse=True)
+        for entry in ranked[:args.top]:
+            print(f"{entry[key] / 1000:>10.1f} ms  {entry['module']}")
+
+
+if __name__ == "__main__":
+    main()
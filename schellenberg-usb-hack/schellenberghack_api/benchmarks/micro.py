@@ -0,0 +1,466 @@
+"""
+Micro-benchmarks for the schellenberghack core library and the hot helpers
+of the Home Assistant worker.
+
+Each case reports the best time per call (ns) over several repeats.
+Registry-dependent cases run at several registry sizes (number of known
+senders, each with one connected device). The heap held per known device
+is reported alongside, in bytes.
+
+Usage:
+    python benchmarks/micro.py                     # run and print
+    python benchmarks/micro.py --save baseline     # write to baselines/
+    python benchmarks/micro.py --compare baseline  # diff against a baseline
+    python benchmarks/micro.py --filter settings --sizes 10,1000
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+from typing import Callable
+
+BASELINES = Path(__file__).parent / "baselines"
+DEFAULT_SIZES = (10, 1_000, 100_000)
+SELF_ID = "ABCDEF"
+WORKDIR = Path(tempfile.gettempdir())
+_files = itertools.count()
+
+# name -> (sized, factory). A factory receives the registry size (or None)
+# and returns the callable to time.
+CASES: dict[str, tuple[bool, Callable[[int | None], Callable[[], object]]]]
+CASES = {}
+
+
+def case(name: str, sized: bool = False):
+    def register(factory):
+        CASES[name] = (sized, factory)
+        return factory
+    return register
+
+
+def _sender_id(index: int) -> str:
+    return f"{index + 1:06X}"
+
+
+def populate(settings, size: int) -> None:
+    """Fill ``settings`` with ``size`` senders of one device each."""
+    from schellenberghack.devices import Device, SenderDevice
+
+    senders = [
+        SenderDevice(
+            device_id=_sender_id(index),
+            connected_devices={Device(enumerator="01", name=f"dev {index}")},
+        )
+        for index in range(size - 1)
+    ]
+    senders.append(SenderDevice(
+        device_id=SELF_ID,
+        name="self",
+        connected_devices={Device(enumerator="A5", name="Living Room")},
+    ))
+    settings.replace_registry(senders, SELF_ID)
+
+
+def use_temporary_registry() -> None:
+    """Point the process-wide settings at a scratch directory."""
+    from schellenberghack.settings import configure_settings
+
+    global WORKDIR
+    WORKDIR = Path(tempfile.mkdtemp(prefix="schellenberg-bench-"))
+    configure_settings(WORKDIR / "settings.json")
+
+
+def make_settings(size: int):
+    from schellenberghack.settings import Settings
+
+    settings = Settings.from_file(WORKDIR / f"settings-{next(_files)}.json")
+    populate(settings, size)
+    return settings
+
+
+def make_sqlite_settings(size: int):
+    from schellenberghack.settings import Settings
+    from schellenberghack.storage import SqliteStore
+
+    store = SqliteStore(WORKDIR / f"settings-{next(_files)}.db")
+    settings = Settings.from_store(store)
+    populate(settings, size)
+    return settings
+
+
+def make_global_settings(size: int):
+    from schellenberghack.settings import get_settings
+
+    settings = get_settings()
+    populate(settings, size)
+    return settings
+
+
+# --- message / command ------------------------------------------------------
+
+@case("message.from_bytes", sized=True)
+def _from_bytes(size):
+    from schellenberghack.message import SchellenbergMessageReceived
+
+    make_global_settings(size)
+    frame = f"ss01{_sender_id(size // 2)}0100bb20CB".encode()
+    return lambda: SchellenbergMessageReceived.from_bytes(frame)
+
+
+@case("message.outgoing_bytes")
+def _outgoing_bytes(_):
+    from schellenberghack.commands import Command
+    from schellenberghack.message import OutgoingSchellenbergMessage
+
+    message = OutgoingSchellenbergMessage(enumerator="A5", command=Command.UP)
+    return lambda: bytes(message)
+
+
+@case("command.from_code")
+def _from_code(_):
+    from schellenberghack.commands import Command
+
+    return lambda: Command.from_code(0x3B)
+
+
+# --- settings lookups -------------------------------------------------------
+
+@case("settings.self_sender", sized=True)
+def _self_sender(size):
+    settings = make_settings(size)
+    return lambda: settings.self_sender
+
+
+@case("settings.get_sender_by_id", sized=True)
+def _get_sender_by_id(size):
+    settings = make_settings(size)
+    sender_id = _sender_id(size // 2)
+    return lambda: settings.get_sender_by_id(sender_id)
+
+
+@case("settings.get_device_by_sender_and_enumerator", sized=True)
+def _get_device(size):
+    settings = make_settings(size)
+    sender_id = _sender_id(size // 2)
+    return lambda: settings.get_device_by_sender_and_enumerator(
+        sender_id, "01"
+    )
+
+
+# --- settings mutations -----------------------------------------------------
+
+@case("settings.add_device", sized=True)
+def _add_device(size):
+    from schellenberghack.devices import Device
+
+    settings = make_settings(size)
+    sender_id = _sender_id(size // 2)
+    return lambda: settings.add_device(sender_id, Device(enumerator="01"))
+
+
+@case("settings.touch_device", sized=True)
+def _touch_device(size):
+    from schellenberghack.devices import device_key
+
+    settings = make_settings(size)
+    key = device_key(int(_sender_id(size // 2), 16), 0x01)
+    return lambda: settings.touch_device(key)
+
+
+@case("settings.touch_device_unknown", sized=True)
+def _touch_device_unknown(size):
+    # Ever new senders, as in a dense neighbourhood: all quarantined
+    settings = make_settings(size)
+    keys = itertools.cycle(range(0x800000 << 8, 0x810000 << 8, 0x100))
+    counters = itertools.count()
+    return lambda: settings.touch_device(next(keys), next(counters))
+
+
+@case("settings.pair_and_remove_device", sized=True)
+def _pair_remove(size):
+    settings = make_settings(size)
+
+    def run():
+        settings.pair_device("B6", "Kitchen")
+        settings.remove_device(SELF_ID, "B6")
+    return run
+
+
+@case("settings.rename_sender", sized=True)
+def _rename_sender(size):
+    settings = make_settings(size)
+    sender_id = _sender_id(size // 2)
+    return lambda: settings.rename_sender(sender_id, "Remote")
+
+
+@case("settings.rename_receiver", sized=True)
+def _rename_receiver(size):
+    settings = make_settings(size)
+    sender_id = _sender_id(size // 2)
+    return lambda: settings.rename_receiver(sender_id, "01", "Bedroom")
+
+
+@case("settings.apply_changes_40", sized=True)
+def _apply_changes(size):
+    from schellenberghack.settings import RegistryChange
+
+    settings = make_settings(size)
+    names = itertools.cycle(("Kitchen", "Bedroom"))
+
+    def run():
+        name = next(names)
+        settings.apply_changes(
+            RegistryChange("rename", SELF_ID, f"{number:02X}", name)
+            for number in range(1, 41)
+        )
+    # A 40-shutter house, provisioned in one transaction
+    settings.apply_changes(
+        RegistryChange("add", SELF_ID, f"{number:02X}")
+        for number in range(1, 41)
+    )
+    return run
+
+
+@case("settings.rename_receiver_40", sized=True)
+def _rename_receiver_40(size):
+    settings = make_settings(size)
+    for number in range(1, 41):
+        settings.pair_device(f"{number:02X}")
+    names = itertools.cycle(("Kitchen", "Bedroom"))
+
+    def run():
+        name = next(names)
+        for number in range(1, 41):
+            settings.rename_receiver(SELF_ID, f"{number:02X}", name)
+    return run
+
+
+# --- persistence ------------------------------------------------------------
+
+@case("settings.save", sized=True)
+def _save(size):
+    settings = make_settings(size)
+    return settings.save
+
+
+@case("settings.from_file", sized=True)
+def _from_file(size):
+    from schellenberghack.settings import Settings
+
+    path = make_settings(size).path
+    assert path is not None
+    return lambda: Settings.from_file(path)
+
+
+# --- sqlite backend ---------------------------------------------------------
+
+@case("sqlite.pair_and_remove_device", sized=True)
+def _sqlite_pair_remove(size):
+    settings = make_sqlite_settings(size)
+
+    def run():
+        settings.pair_device("B6", "Kitchen")
+        settings.remove_device(SELF_ID, "B6")
+    return run
+
+
+@case("sqlite.rename_sender", sized=True)
+def _sqlite_rename_sender(size):
+    settings = make_sqlite_settings(size)
+    sender_id = _sender_id(size // 2)
+    return lambda: settings.rename_sender(sender_id, "Remote")
+
+
+@case("sqlite.rename_receiver", sized=True)
+def _sqlite_rename_receiver(size):
+    settings = make_sqlite_settings(size)
+    sender_id = _sender_id(size // 2)
+    return lambda: settings.rename_receiver(sender_id, "01", "Bedroom")
+
+
+@case("sqlite.from_store", sized=True)
+def _from_store(size):
+    from schellenberghack.settings import Settings
+
+    store = make_sqlite_settings(size).store
+    assert store is not None
+    return lambda: Settings.from_store(store)
+
+
+@case("sqlite.append_events_100")
+def _append_events(_):
+    from schellenberghack.storage import SqliteStore
+
+    store = SqliteStore(WORKDIR / f"events-{next(_files)}.db")
+    rows = [(1.7e9 + i, 0x123456, 1, 1, i, 0, 200) for i in range(100)]
+    return lambda: store.append_events(rows)
+
+
+# --- home assistant worker --------------------------------------------------
+
+@case("homeassistant.make_slug")
+def _make_slug(_):
+    from schellenberghack_api.homeassistant import HomeAssistantWorker
+
+    worker = HomeAssistantWorker()
+    return lambda: worker._make_slug("Wohnzimmer Tür.links_Süd")
+
+
+@case("homeassistant.update_device_mapping", sized=True)
+def _update_device_mapping(size):
+    from schellenberghack_api.homeassistant import HomeAssistantWorker
+
+    make_global_settings(size)
+    worker = HomeAssistantWorker()
+    return worker.update_device_mapping
+
+
+# --- link statistics --------------------------------------------------------
+
+@case("linkstats.record", sized=True)
+def _linkstats_record(size):
+    from schellenberghack.message import SchellenbergMessageReceived
+    from schellenberghack_api.linkstats import LinkStats
+
+    make_global_settings(size)
+    # Presses of up to 256 senders in turn, each heard three times
+    senders = min(size, 256)
+    messages = itertools.cycle([
+        SchellenbergMessageReceived.from_bytes(
+            f"ss01{_sender_id(press % senders)}01"
+            f"{press // senders:04X}00CB".encode()
+        )
+        for press in range(senders * 4)
+        for _ in range(3)
+    ])
+    stats = LinkStats()
+    return lambda: stats.record(next(messages))
+
+
+# --- memory -----------------------------------------------------------------
+
+def registry_bytes_per_device(size: int) -> float:
+    """Heap held by a registry of ``size`` senders, per known device."""
+    import gc
+    import tracemalloc
+
+    from schellenberghack.settings import Settings
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    settings = Settings()
+    populate(settings, size)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del settings
+    return (after - before) / size
+
+
+# --- runner -----------------------------------------------------------------
+
+def measure(func: Callable[[], object], repeat: int) -> float:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best / number * 1e9
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes: tuple[int, ...], name_filter: str | None,
+        repeat: int) -> dict:
+    use_temporary_registry()
+    results: dict[str, float] = {}
+    for name, (sized, factory) in CASES.items():
+        if name_filter and name_filter not in name:
+            continue
+        for size in sizes if sized else (None,):
+            key = name if size is None else f"{name}[{size}]"
+            # Keep the library's progress prints out of the timings
+            with open(os.devnull, "w") as devnull, \
+                    contextlib.redirect_stdout(devnull):
+                results[key] = measure(factory(size), repeat)
+            print(f"{key:60} {results[key]:>16,.0f} ns", file=sys.stderr)
+    memory: dict[str, float] = {}
+    if not name_filter or name_filter in "memory.registry":
+        for size in sizes:
+            key = f"memory.registry_bytes_per_device[{size}]"
+            memory[key] = registry_bytes_per_device(size)
+            print(f"{key:60} {memory[key]:>16,.0f} B", file=sys.stderr)
+    return {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results_ns": results,
+        "memory_bytes": memory,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> bool:
+    regressed = False
+    print(f"{'case':60} {'baseline':>14} {'current':>14} {'ratio':>7}")
+    measured = current["results_ns"] | current.get("memory_bytes", {})
+    known = baseline["results_ns"] | baseline.get("memory_bytes", {})
+    for key, now in measured.items():
+        before = known.get(key)
+        if before is None:
+            print(f"{key:60} {'-':>14} {now:>14,.0f}")
+            continue
+        ratio = now / before
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag, regressed = " REGRESSION", True
+        print(f"{key:60} {before:>14,.0f} {now:>14,.0f} "
+              f"{ratio:>6.2f}x{flag}")
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+    parser.add_argument("--filter", default=None)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    sizes = tuple(int(size) for size in args.sizes.split(","))
+    current = run(sizes, args.filter, args.repeat)
+
+    if args.save:
+        BASELINES.mkdir(exist_ok=True)
+        (BASELINES / f"{args.save}.json").write_text(
+            json.dumps(current, indent=2) + "\n"
+        )
+    if args.compare:
+        baseline = json.loads(
+            (BASELINES / f"{args.compare}.json").read_text()
+        )
+        if compare(current, baseline, args.tolerance):
+            sys.exit(1)
+    elif not args.save:
+        print(json.dumps(current, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Standard against performance runtime profile on the fan-out and discovery
+paths.
+
+Each profile runs in a fresh interpreter with ``RUNTIME_PROFILE`` set, so
+the codec and event loop are picked exactly as in the add-on; a missing
+orjson or uvloop shows up as the fallback in the report.
+
+fanout     frames through ``fanout_received_messages`` to protocol 1
+           WebSocket clients, protocol 2 subscribers and the Home
+           Assistant worker (device discovery mode, link telemetry on)
+discovery  ``publish_all_discovery_configs()`` for the whole registry, in
+           entity and device mode
+
+MQTT and WebSocket sends go to null sinks, so the numbers are the
+serialization and scheduling cost alone.
+
+Usage:
+    python benchmarks/runtime_profiles.py [--devices 200] [--frames 5000]
+                                          [--clients 10] [--json]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+PROFILES = ("standard", "performance")
+REPEAT = 5
+
+
+class _NullClient:
+    """aiomqtt.Client stand-in that only counts the payload bytes."""
+
+    def __init__(self):
+        self.bytes = 0
+
+    async def publish(self, topic, payload=None, qos=0, retain=False):
+        self.bytes += len(payload or "")
+
+
+class _NullWebSocket:
+    def __init__(self):
+        self.bytes = 0
+
+    async def send_text(self, text: str):
+        self.bytes += len(text)
+
+
+def populate_house(devices: int) -> None:
+    """
+    The stick paired to ``devices`` shutters, each also taught to a remote
+    of its own that the frames come from.
+    """
+    from micro import SELF_ID, _sender_id
+    from schellenberghack.devices import Device, SenderDevice
+    from schellenberghack.settings import get_settings
+
+    names = [f"Shutter {index}" for index in range(devices)]
+    senders = [
+        SenderDevice(
+            device_id=_sender_id(index),
+            connected_devices={Device(enumerator="01", name=name)},
+        )
+        for index, name in enumerate(names)
+    ]
+    senders.append(SenderDevice(
+        device_id=SELF_ID,
+        name="self",
+        connected_devices={
+            Device(enumerator=f"{index + 1:02X}", name=name)
+            for index, name in enumerate(names)
+        },
+    ))
+    get_settings().replace_registry(senders, SELF_ID)
+
+
+def _frames(count: int, senders: int) -> list[bytes]:
+    from micro import _sender_id
+
+    commands = ("01", "02", "00")
+    return [
+        f"ss01{_sender_id(index % senders)}{commands[index % 3]}"
+        f"{index // senders & 0xFFFF:04X}00{0x80 + index % 64:02X}".encode()
+        for index in range(count)
+    ]
+
+
+async def measure_discovery(mode: str) -> float:
+    from schellenberghack_api.homeassistant import HomeAssistantWorker
+
+    worker = HomeAssistantWorker(discovery_mode=mode)
+    worker.client = _NullClient()
+    # The first round also migrates the entity configs in device mode
+    await worker.publish_all_discovery_configs()
+    best = float("inf")
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        await worker.publish_all_discovery_configs()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+async def measure_fanout(frames: list[bytes], clients: int) -> float:
+    from schellenberghack.message import SchellenbergMessageReceived
+    from schellenberghack_api import main
+    from schellenberghack_api.history import EventHistory
+    from schellenberghack_api.homeassistant import HomeAssistantWorker
+    from schellenberghack_api.linkstats import LinkStats
+    from schellenberghack_api.stream import EventStream
+    from schellenberghack_api.worker import ReceiveWorker
+
+    state = main.app.state
+    state.receive_worker = ReceiveWorker(None)
+    state.link_stats = LinkStats()
+    state.ha_worker = HomeAssistantWorker(
+        discovery_mode="device", link_stats=state.link_stats,
+        coalesce_window=0,
+    )
+    state.ha_worker.client = _NullClient()
+    await state.ha_worker.publish_all_discovery_configs()
+    state.websocket_clients = {_NullWebSocket() for _ in range(clients)}
+    state.history = EventHistory()
+    state.event_log = None
+    state.event_stream = EventStream()
+    messages = [
+        SchellenbergMessageReceived.from_bytes(frame) for frame in frames
+    ]
+
+    async def subscriber(last: int):
+        sink = _NullWebSocket()
+        async for item in state.event_stream.subscribe():
+            await sink.send_text(item.encode())
+            if item.seq >= last:
+                return
+
+    fanout = asyncio.create_task(main.fanout_received_messages())
+    best = float("inf")
+    for _ in range(REPEAT):
+        last = state.event_stream.last_seq + len(messages)
+        subscribers = [
+            asyncio.create_task(subscriber(last)) for _ in range(clients)
+        ]
+        await asyncio.sleep(0)
+        started = time.perf_counter()
+        for message in messages:
+            state.receive_worker.receivedMessages.put_nowait(message)
+        await asyncio.gather(*subscribers)
+        while not state.receive_worker.receivedMessages.empty():
+            await asyncio.sleep(0)
+        best = min(best, time.perf_counter() - started)
+    fanout.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await fanout
+    return best
+
+
+async def measure(devices: int, frames: int, clients: int) -> dict:
+    from schellenberghack_api.runtime import describe
+
+    populate_house(devices)
+    results = {
+        "discovery_entity_s": await measure_discovery("entity"),
+        "discovery_device_s": await measure_discovery("device"),
+        "fanout_s": await measure_fanout(
+            _frames(frames, devices), clients
+        ),
+    }
+    results["fanout_frames_per_s"] = frames / results["fanout_s"]
+    results["runtime"] = describe()
+    return results
+
+
+def child(args: argparse.Namespace) -> None:
+    from micro import use_temporary_registry
+    from schellenberghack_api.runtime import run
+
+    use_temporary_registry()
+    # Keep the workers' per-frame prints out of the timings
+    with open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull):
+        results = run(measure(args.devices, args.frames, args.clients))
+    print(json.dumps(results))
+
+
+def run_profile(profile: str, args: argparse.Namespace) -> dict:
+    result = subprocess.run(
+        [sys.executable, __file__, "--child",
+         "--devices", str(args.devices), "--frames", str(args.frames),
+         "--clients", str(args.clients)],
+        capture_output=True, text=True, check=True,
+        env=os.environ | {
+            "RUNTIME_PROFILE": profile,
+            "MOCK_SERIAL": "true",
+        },
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--devices", type=int, default=200,
+                        help="shutters paired to the stick, at most 254")
+    parser.add_argument("--frames", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--child", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+        return
+
+    report = {profile: run_profile(profile, args) for profile in PROFILES}
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    standard, performance = (report[profile] for profile in PROFILES)
+    for profile in PROFILES:
+        print(f"{profile:12} {report[profile]['runtime']}")
+    print(f"\n{args.devices} devices, {args.frames} frames, "
+          f"{args.clients} clients per protocol\n")
+    print(f"{'case':24} {'standard':>12} {'performance':>12} {'speedup':>8}")
+    for key in ("discovery_entity_s", "discovery_device_s", "fanout_s"):
+        print(f"{key[:-2]:24} {standard[key] * 1000:>9.1f} ms "
+              f"{performance[key] * 1000:>9.1f} ms "
+              f"{standard[key] / performance[key]:>7.2f}x")
+    print(f"{'fanout frames/s':24} {standard['fanout_frames_per_s']:>12,.0f} "
+          f"{performance['fanout_frames_per_s']:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
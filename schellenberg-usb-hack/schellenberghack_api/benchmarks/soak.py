@@ -0,0 +1,386 @@
+"""
+Soak benchmark of the full MQTT -> radio -> state pipeline.
+
+Starts the API (uvicorn, real ReceiveWorker/SendWorker) against the PTY
+stick emulator and an in-process MQTT broker stand-in, then drives a
+configurable workload:
+
+- MQTT commands to ``schellenberg/<device>/set``; latency is measured until
+  the emulator sees the frame on the serial line.
+- Inbound remote frames injected by the emulator; latency is measured until
+  the matching ``schellenberg/<device>/state`` publish reaches the broker.
+- WebSocket clients on ``/api/devices/events``.
+- Optionally HTTP clients polling ``/api/devices/all`` as background load;
+  ``transmit_gap`` (stick idle time while commands are queued) shows
+  whether that load reaches the radio timing, e.g. with and without
+  ``--radio-process``.
+
+Event-loop lag and RSS are sampled over the run. The result is written as
+JSON; ``--compare`` fails with exit code 1 when a p99 latency regressed by
+more than ``--tolerance`` against a previous result.
+
+Usage:
+    python benchmarks/soak.py --devices 40 --duration 30 --output soak.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import deque
+from pathlib import Path
+
+from broker import MiniBroker
+
+SELF_ID = "ABCDEF"
+REMOTE_ID = "123456"
+
+
+def percentiles(values: list[float]) -> dict[str, float | int | None]:
+    if not values:
+        return {"count": 0, "p50": None, "p90": None, "p99": None,
+                "max": None}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": ordered[-1],
+    }
+
+
+def read_rss_kb() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def free_port() -> int:
+    import socket
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Soak:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.command_latencies: list[float] = []
+        self.frame_latencies: list[float] = []
+        self.loop_lag: list[float] = []
+        self.rss: list[tuple[float, int]] = []
+        self.ws_messages = 0
+        self.commands_sent = 0
+        self.frames_injected = 0
+        self.frames_lost = 0
+        self.api_requests = 0
+        # From the end of one transmission to the start of the next
+        self.transmit_gaps: list[float] = []
+        self.last_transmit_end: float | None = None
+        # enumerator (hex) -> send times of queued MQTT commands
+        self.pending_commands: dict[str, deque[float]] = {}
+        # device name -> (inject time, expected state payload)
+        self.pending_frames: dict[str, tuple[float, bytes]] = {}
+
+    def setup_registry(self, workdir: Path):
+        from schellenberghack.devices import Device, SenderDevice
+        from schellenberghack.settings import configure_settings
+
+        settings = configure_settings(workdir / "settings.json")
+        devices = {
+            Device(enumerator=f"{index + 1:02X}", name=f"bench-{index:03d}")
+            for index in range(self.args.devices)
+        }
+        settings.replace_registry(
+            [
+                SenderDevice(device_id=SELF_ID, name="self",
+                             connected_devices=devices),
+                SenderDevice(device_id=REMOTE_ID, name="remote",
+                             connected_devices=devices),
+            ],
+            SELF_ID,
+        )
+
+    def on_transmit(self, line: bytes, now: float):
+        queue = self.pending_commands.get(line[2:4].decode())
+        if queue:
+            sent = queue.popleft()
+            self.command_latencies.append(now - sent)
+            # Only when the command already waited for the previous one
+            last_end = self.last_transmit_end
+            if last_end is not None and sent <= last_end <= now:
+                self.transmit_gaps.append(now - last_end)
+        repeats = int(line[4:5], 16) + 1
+        self.last_transmit_end = now + self.args.airtime * repeats
+
+    def on_publish(self, topic: str, payload: bytes, now: float):
+        if not topic.endswith("/state"):
+            return
+        name = topic.split("/")[1]
+        pending = self.pending_frames.get(name)
+        if pending and pending[1] == payload:
+            del self.pending_frames[name]
+            self.frame_latencies.append(now - pending[0])
+
+    async def command_load(self, client, names: list[str]):
+        if not names or self.args.command_rate <= 0:
+            return
+        interval = 1 / self.args.command_rate
+        payloads = ("OPEN", "CLOSE")
+        index = 0
+        while True:
+            name = names[index % len(names)]
+            enumerator = f"{int(name.split('-')[1]) + 1:02X}"
+            # A chatty automation sends the same command several times
+            for _ in range(self.args.burst):
+                self.pending_commands.setdefault(enumerator, deque()).append(
+                    time.monotonic()
+                )
+                await client.publish(
+                    f"schellenberg/{name}/set",
+                    payloads[(index // len(names)) % 2],
+                )
+                self.commands_sent += 1
+            index += 1
+            await asyncio.sleep(interval)
+
+    async def frame_load(self, emulator, names: list[str]):
+        from schellenberghack.commands import Command
+
+        if not names or self.args.frame_rate <= 0:
+            return
+        interval = 1 / self.args.frame_rate
+        up = dict.fromkeys(names, False)
+        index = 0
+        while True:
+            name = names[index % len(names)]
+            index += 1
+            now = time.monotonic()
+            pending = self.pending_frames.get(name)
+            if pending and now - pending[0] < 5:
+                await asyncio.sleep(interval)
+                continue
+            if pending:
+                self.frames_lost += 1
+            up[name] = not up[name]
+            command = Command.UP if up[name] else Command.DOWN
+            expected = b"opening" if up[name] else b"closing"
+            frame = emulator.make_frame(
+                REMOTE_ID, int(name.split("-")[1]) + 1, command
+            )
+            self.pending_frames[name] = (now, expected)
+            for _ in range(self.args.repeats):
+                emulator.inject(frame)
+            self.frames_injected += 1
+            await asyncio.sleep(interval)
+
+    async def websocket_client(self, url: str):
+        import websockets
+
+        async with websockets.connect(url) as ws:
+            async for _ in ws:
+                self.ws_messages += 1
+
+    async def api_client(self, url: str):
+        import httpx
+
+        async with httpx.AsyncClient() as client:
+            while True:
+                await client.get(url)
+                self.api_requests += 1
+
+    async def sample_loop_lag(self):
+        interval = 0.05
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            self.loop_lag.append(max(0.0, loop.time() - expected))
+
+    async def sample_rss(self, started: float):
+        while True:
+            self.rss.append((round(time.monotonic() - started, 1),
+                             read_rss_kb()))
+            await asyncio.sleep(1)
+
+    async def run(self) -> dict:
+        import aiomqtt
+        import uvicorn
+
+        from schellenberghack_api.emulator import StickEmulator
+
+        args = self.args
+        workdir = Path(tempfile.mkdtemp(prefix="schellenberg-soak-"))
+        self.setup_registry(workdir)
+
+        broker = MiniBroker()
+        broker.on_publish = self.on_publish
+        mqtt_port = await broker.start()
+
+        emulator = StickEmulator(device_id=SELF_ID, airtime=args.airtime)
+        emulator.on_transmit = self.on_transmit
+        os.environ.update(
+            SERIAL=emulator.start(),
+            MQTT_HOST="127.0.0.1",
+            MQTT_PORT=str(mqtt_port),
+        )
+        os.environ.pop("MOCK_SERIAL", None)
+        if args.radio_process:
+            os.environ.update(
+                RADIO_PROCESS="true",
+                RADIO_SOCKET=str(workdir / "radio.sock"),
+            )
+
+        from schellenberghack_api.main import app
+
+        http_port = free_port()
+        server = uvicorn.Server(uvicorn.Config(
+            app, host="127.0.0.1", port=http_port,
+            log_level="warning", lifespan="on",
+        ))
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+        while not any("schellenberg/+/set" in s.filters
+                      for s in broker.sessions):
+            await asyncio.sleep(0.05)
+        # Inbound frames are only mapped to names after the first command
+        app.state.ha_worker.update_device_mapping()
+
+        names = [f"bench-{i:03d}" for i in range(args.devices)]
+        half = len(names) // 2
+        started = time.monotonic()
+        async with aiomqtt.Client("127.0.0.1", mqtt_port) as client:
+            tasks = [
+                asyncio.create_task(self.command_load(client, names[:half])),
+                asyncio.create_task(self.frame_load(emulator, names[half:])),
+                asyncio.create_task(self.sample_loop_lag()),
+                asyncio.create_task(self.sample_rss(started)),
+            ] + [
+                asyncio.create_task(self.websocket_client(
+                    f"ws://127.0.0.1:{http_port}/api/devices/events"
+                ))
+                for _ in range(args.ws_clients)
+            ] + [
+                asyncio.create_task(self.api_client(
+                    f"http://127.0.0.1:{http_port}/api/devices/all"
+                ))
+                for _ in range(args.api_clients)
+            ]
+            await asyncio.sleep(args.duration)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        elapsed = time.monotonic() - started
+
+        publish_stats = dict(app.state.ha_worker.publish_stats)
+        server.should_exit = True
+        await server_task
+        emulator.stop()
+        await broker.stop()
+
+        return {
+            "config": vars(args) | {"output": None, "compare": None},
+            "elapsed_s": elapsed,
+            "throughput": {
+                "commands_sent_per_s": self.commands_sent / elapsed,
+                "commands_transmitted_per_s":
+                    len(self.command_latencies) / elapsed,
+                "frames_injected_per_s": self.frames_injected / elapsed,
+                "states_published_per_s":
+                    len(self.frame_latencies) / elapsed,
+                "mqtt_publishes": broker.published,
+                "state_publishes": publish_stats,
+                "websocket_messages": self.ws_messages,
+                "frames_lost": self.frames_lost,
+                "api_requests_per_s": self.api_requests / elapsed,
+            },
+            "latency_s": {
+                "command_to_serial": percentiles(self.command_latencies),
+                "frame_to_state": percentiles(self.frame_latencies),
+                "transmit_gap": percentiles(self.transmit_gaps),
+            },
+            "loop_lag_s": percentiles(self.loop_lag),
+            "rss_kb": self.rss,
+        }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for key, current in result["latency_s"].items():
+        before = baseline.get("latency_s", {}).get(key, {}).get("p99")
+        now = current["p99"]
+        if before and now and now > before * (1 + tolerance):
+            regressions.append(
+                f"{key} p99 {now * 1000:.1f}ms > {before * 1000:.1f}ms"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--command-rate", type=float, default=2.0)
+    parser.add_argument("--burst", type=int, default=1,
+                        help="MQTT commands sent back to back per command")
+    parser.add_argument("--frame-rate", type=float, default=10.0)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--ws-clients", type=int, default=5)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--airtime", type=float, default=0.005)
+    parser.add_argument("--api-clients", type=int, default=0,
+                        help="HTTP clients polling /api/devices/all")
+    parser.add_argument("--radio-process", action="store_true",
+                        help="run the radio core in its own process")
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--compare", type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument(
+        "--verbose", action="store_true", help="keep the API's log output"
+    )
+    args = parser.parse_args()
+    if not 2 <= args.devices <= 255:
+        parser.error("--devices must be between 2 and 255")
+    if args.api_clients:
+        try:
+            import httpx  # noqa: F401
+        except ImportError:
+            parser.error("--api-clients needs httpx, install the bench "
+                         "extra: pip install -e '.[bench]'")
+
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(
+            sys.stdout if args.verbose else devnull
+        ):
+            result = asyncio.run(Soak(args).run())
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        args.output.write_text(text)
+    else:
+        print(text)
+
+    if args.compare:
+        regressions = compare(
+            result, json.loads(args.compare.read_text()), args.tolerance
+        )
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,8 @@ from queue import Queue
 import serial
 
 from .commands import Command
-from .devices import SenderDevice
 from .message import OutgoingSchellenbergMessage, SchellenbergMessageReceived
-from .settings import SETTINGS
+from .settings import get_settings
 
 QUEUE: Queue[OutgoingSchellenbergMessage] = Queue()
 TRANSMITTER_LOCK = threading.Lock()
@@ -68,10 +67,11 @@ def stdin_reader() -> None:
             )
             QUEUE.put(command)
         elif user_input in Command.__members__:
-            if SETTINGS.self_sender is None:
+            self_sender = get_settings().self_sender
+            if self_sender is None:
                 print("No self sender device found. Cannot send command.")
                 continue
-            available_devices = list(SETTINGS.self_sender.connected_devices)
+            available_devices = list(self_sender.connected_devices)
             print(f"Available devices: {list(enumerate(available_devices))}")
             try:
                 device_index = int(input("Device index: ").strip())
@@ -91,8 +91,9 @@ def stdin_reader() -> None:
 
 
 def cli() -> None:
+    settings = get_settings()
     with serial.Serial(
-        "COM3", SETTINGS.baud_rate, timeout=SETTINGS.timeout
+        "COM3", settings.baud_rate, timeout=settings.timeout
     ) as ser:
         ser.write(b"hello\n")
         print(f"Connected to {ser.name}")
@@ -101,10 +102,9 @@ def cli() -> None:
 
         ser.write(b"sr\n")
         own_id = str(ser.readline().strip()[2:], "ascii")
-        SETTINGS.self_sender_id = own_id
-        SETTINGS.senders.add(SenderDevice(device_id=own_id, name="self"))
+        settings.set_self_sender(own_id)
         print(f"{own_id=}")
-        SETTINGS.save()
+        settings.save()
 
         readerThread = threading.Thread(
             target=reader, args=(ser,), daemon=True
@@ -117,3 +117,10 @@ def cli() -> None:
         writerThread.start()
 
         stdin_reader()
+
+
+def __getattr__(name: str):
+    # ``from schellenberghack import SETTINGS`` keeps working, lazily
+    if name == "SETTINGS":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
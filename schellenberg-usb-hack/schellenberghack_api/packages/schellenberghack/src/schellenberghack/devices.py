@@ -1,15 +1,42 @@
-from pydantic import BaseModel, field_validator
+from types import MappingProxyType
+from typing import Mapping, ValuesView
+
+from pydantic import BaseModel, ConfigDict, field_validator
+
+# Shared hex strings for enumerators, so records do not each format one
+ENUMERATORS = tuple(f"{number:02X}" for number in range(0x100))
+
+
+def parse_enumerator(value: str) -> int:
+    number = int(value, 16)
+    if not (0 <= number <= 0xFF):
+        raise ValueError("Enumerator must be between 0 and 255 (0xFF)")
+    return number
+
+
+def parse_device_id(value: str) -> int:
+    number = int(value, 16)
+    if not (0 <= number <= 0xFFFFFF):
+        raise ValueError("Device ID must be between 0x0 and 0xFFFFFF")
+    return number
+
+
+def device_key(sender: int, enumerator: int) -> int:
+    """Pack a 24-bit sender ID and an 8-bit enumerator into one int."""
+    return sender << 8 | enumerator
 
 
 class Device(BaseModel):
+    # Immutable so registry snapshots can be shared between threads
+    model_config = ConfigDict(frozen=True)
+
     enumerator: str  # hex
     name: str | None = None
 
     @field_validator("enumerator")
     @classmethod
     def validate_enumerator(cls, value: str) -> str:
-        if not (0 <= int(value, 16) <= 0xFF):
-            raise ValueError("Enumerator must be between 0 and 255 (0xFF)")
+        parse_enumerator(value)
         return value
 
     def __eq__(self, other: object) -> bool:
@@ -22,29 +49,30 @@ class Device(BaseModel):
 
 
 class SenderDevice(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     device_id: str  # hex between 0x0 and 0xFFFFFF
     name: str | None = None
-    connected_devices: set[Device] = set()
+    connected_devices: frozenset[Device] = frozenset()
 
     @classmethod
     def from_id(cls, device_id: str, create: bool = False) -> "SenderDevice":
-        from .settings import SETTINGS
+        from .settings import get_settings
 
-        existing_device = SETTINGS.get_sender_by_id(device_id)
+        settings = get_settings()
+        existing_device = settings.get_sender_by_id(device_id)
         if existing_device:
-            return existing_device
+            return existing_device.to_model()
         if not create:
             raise ValueError(f"No device found with ID {device_id}")
-        new = cls(device_id=device_id)
-        SETTINGS.senders.add(new)
-        SETTINGS.save()
-        return new
+        # An explicit request, so it skips the quarantine that senders
+        # heard over the air go through (see Settings.touch_device)
+        return settings.promote_sender(device_id).to_model()
 
     @field_validator("device_id")
     @classmethod
     def validate_device_id(cls, value: str) -> str:
-        if not (0 <= int(value, 16) <= 0xFFFFFF):
-            raise ValueError("Device ID must be between 0x0 and 0xFFFFFF")
+        parse_device_id(value)
         return value
 
     def __eq__(self, other: object) -> bool:
@@ -54,3 +82,119 @@ class SenderDevice(BaseModel):
 
     def __hash__(self) -> int:
         return hash(self.device_id)
+
+
+class DeviceRecord:
+    """
+    Registry entry of a receiver. ``key`` packs the sender ID and the
+    enumerator, see ``device_key()``. Never mutated once published.
+    """
+
+    __slots__ = ("key", "name")
+
+    def __init__(self, key: int, name: str | None = None):
+        self.key = key
+        self.name = name
+
+    @property
+    def sender(self) -> int:
+        return self.key >> 8
+
+    @property
+    def number(self) -> int:
+        return self.key & 0xFF
+
+    @property
+    def enumerator(self) -> str:
+        return ENUMERATORS[self.key & 0xFF]
+
+    def renamed(self, name: str | None) -> "DeviceRecord":
+        return DeviceRecord(self.key, name)
+
+    def to_model(self) -> Device:
+        # Already validated when it entered the registry
+        return Device.model_construct(
+            enumerator=self.enumerator, name=self.name
+        )
+
+    def __repr__(self) -> str:
+        return f"DeviceRecord({self.key:08X}, name={self.name!r})"
+
+
+_NO_DEVICES: Mapping[int, DeviceRecord] = MappingProxyType({})
+
+
+class SenderRecord:
+    """
+    Registry entry of a sender, keyed by its ID as an int. ``devices`` maps
+    enumerator numbers to records. Neither is mutated once published (a
+    plain dict is leaner than a read-only proxy per sender); the ``with_*``
+    methods return a changed copy.
+    """
+
+    __slots__ = ("key", "device_id", "name", "devices")
+
+    def __init__(
+        self,
+        key: int,
+        name: str | None = None,
+        devices: Mapping[int, DeviceRecord] = _NO_DEVICES,
+    ):
+        self.key = key
+        self.device_id = f"{key:06X}"
+        self.name = name
+        self.devices = devices
+
+    @property
+    def connected_devices(self) -> ValuesView[DeviceRecord]:
+        return self.devices.values()
+
+    def get_device(self, enumerator: int) -> DeviceRecord | None:
+        return self.devices.get(enumerator)
+
+    def with_name(self, name: str | None) -> "SenderRecord":
+        return SenderRecord(self.key, name, self.devices)
+
+    def with_device(self, device: DeviceRecord) -> "SenderRecord":
+        devices = dict(self.devices)
+        devices[device.number] = device
+        return SenderRecord(self.key, self.name, devices)
+
+    def without_device(self, enumerator: int) -> "SenderRecord":
+        devices = dict(self.devices)
+        del devices[enumerator]
+        return SenderRecord(self.key, self.name, devices)
+
+    @classmethod
+    def from_model(cls, sender: SenderDevice) -> "SenderRecord":
+        key = parse_device_id(sender.device_id)
+        devices = {}
+        for device in sender.connected_devices:
+            number = parse_enumerator(device.enumerator)
+            devices[number] = DeviceRecord(
+                device_key(key, number), device.name
+            )
+        return cls(key, sender.name, devices)
+
+    def to_dict(self) -> dict[str, object]:
+        return {
+            "device_id": self.device_id,
+            "name": self.name,
+            "connected_devices": [
+                {"enumerator": device.enumerator, "name": device.name}
+                for device in self.devices.values()
+            ],
+        }
+
+    def to_model(self) -> SenderDevice:
+        return SenderDevice.model_construct(
+            device_id=self.device_id,
+            name=self.name,
+            connected_devices=frozenset(
+                device.to_model() for device in self.devices.values()
+            ),
+        )
+
+    def __repr__(self) -> str:
+        return (f"SenderRecord({self.device_id}, name={self.name!r}, "
+                f"devices={list(self.devices.values())})")
@@ -1,12 +1,12 @@
 from dataclasses import dataclass
 from enum import Enum
-from typing import Callable, Literal
+from typing import Callable, Iterable, Literal
 
 import serial
 
 from .commands import Command
-from .devices import Device, SenderDevice
-from .settings import SETTINGS
+from .devices import ENUMERATORS, SenderRecord, device_key
+from .settings import get_settings
 
 
 class DeviceState(Enum):
@@ -18,10 +18,24 @@ class DeviceState(Enum):
     UNKNOWN = "unknown"
 
 
+class HandlePosition(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    TILTED = "tilted"
+
+
+# Reported by window handle sensors, on device enumerator 0x14
+HANDLE_POSITIONS = {
+    Command.WINDOW_HANDLE_POSITION_0: HandlePosition.CLOSED,
+    Command.WINDOW_HANDLE_POSITION_90: HandlePosition.OPEN,
+    Command.WINDOW_HANDLE_POSITION_180: HandlePosition.TILTED,
+}
+
+
 @dataclass
 class SchellenbergMessageReceived:
     prefix: Literal["ss"]
-    sender: SenderDevice
+    sender: SenderRecord
     receiver: str  # hex
     command: Command
     counter: int
@@ -56,34 +70,84 @@ class SchellenbergMessageReceived:
 
     @classmethod
     def from_bytes(cls, data: bytes) -> "SchellenbergMessageReceived":
-        if len(data) != 20 or not data.startswith(b"ss"):
-            raise ValueError(f"Invalid Schellenberg message format: {data}")
-
-        receiver_enumerator = int(data[2:4], 16)
-        device_id = int(data[4:10], 16)
-        command_code = int(data[10:12], 16)
-        counter = int(data[12:16], 16)
-        local_counter = int(data[16:18], 16)
-        signal_strength = int(data[18:20], 16)
-
-        sender = SenderDevice.from_id(
-            device_id=f"{device_id:06X}", create=True
-        )
-        SETTINGS.add_device(
-            sender.device_id, Device(enumerator=f"{receiver_enumerator:02X}")
+        return cls.from_fields(*parse_frame(data), original_bytes=data)
+
+    @classmethod
+    def from_fields(
+        cls,
+        receiver_enumerator: int,
+        device_id: int,
+        command_code: int,
+        counter: int,
+        local_counter: int,
+        signal_strength: int,
+        original_bytes: bytes | None = None,
+    ) -> "SchellenbergMessageReceived":
+        """From the fields of ``parse_frame()``."""
+        # Registers a new device, quarantines an unknown sender, else a
+        # plain lookup
+        sender = get_settings().touch_device(
+            device_key(device_id, receiver_enumerator), counter
         )
         return cls(
             prefix="ss",
             sender=sender,
-            receiver=f"{receiver_enumerator:02X}",
+            receiver=ENUMERATORS[receiver_enumerator],
             command=Command.from_code(command_code),
             counter=counter,
             local_counter=local_counter,
             signal_strength=signal_strength,
-            original_bytes=data,
+            original_bytes=original_bytes,
         )
 
 
+def parse_frame(data: bytes) -> tuple[int, int, int, int, int, int]:
+    """
+    (receiver enumerator, device ID, command code, counter, local counter,
+    signal strength) of a received frame, without touching the registry.
+    """
+    if len(data) != 20 or not data.startswith(b"ss"):
+        raise ValueError(f"Invalid Schellenberg message format: {data}")
+    return (
+        int(data[2:4], 16),
+        int(data[4:10], 16),
+        int(data[10:12], 16),
+        int(data[12:16], 16),
+        int(data[16:18], 16),
+        int(data[18:20], 16),
+    )
+
+
+# Encoded outgoing frames by (enumerator, retries, command); bounded, as
+# enumerators can come from API input
+_FRAMES: dict[tuple[str, int, Command], bytes] = {}
+MAX_ENCODED_FRAMES = 4096
+# What the remotes send, prepared per paired device by preencode_frames()
+COMMON_COMMANDS = (Command.UP, Command.DOWN, Command.STOP)
+DEFAULT_RETRIES = 9
+
+
+def encode_frame(enumerator: str, num_retries: int, command: Command) -> bytes:
+    key = (enumerator, num_retries, command)
+    frame = _FRAMES.get(key)
+    if frame is None:
+        frame = (
+            f"ss{enumerator}{num_retries:X}{command.value:02X}0000\n"
+        ).encode(encoding="ascii")
+        if len(_FRAMES) < MAX_ENCODED_FRAMES:
+            _FRAMES[key] = frame
+    return frame
+
+
+def preencode_frames(
+    enumerators: Iterable[str], num_retries: int = DEFAULT_RETRIES
+) -> None:
+    """Encode the common commands for ``enumerators`` ahead of sending."""
+    for enumerator in enumerators:
+        for command in COMMON_COMMANDS:
+            encode_frame(enumerator, num_retries, command)
+
+
 @dataclass
 class OutgoingSchellenbergMessage:
     """
@@ -96,15 +160,12 @@ class OutgoingSchellenbergMessage:
 
     enumerator: str  # hex
     command: Command
-    num_retries: int = 9
+    num_retries: int = DEFAULT_RETRIES
 
     state_callback: Callable[[DeviceState], None] | None = None
 
     def __bytes__(self) -> bytes:
-        return (
-            f"ss{self.enumerator}{self.num_retries:X}"
-            f"{self.command.value:02X}0000\n".encode(encoding="ascii")
-        )
+        return encode_frame(self.enumerator, self.num_retries, self.command)
 
     def __str__(self) -> str:
         return (
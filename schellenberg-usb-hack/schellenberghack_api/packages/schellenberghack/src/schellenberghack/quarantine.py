@@ -0,0 +1,85 @@
+import os
+import time
+from collections import OrderedDict
+
+from .devices import DeviceRecord, SenderRecord
+
+DEFAULT_QUARANTINE_SIZE = int(os.getenv("QUARANTINE_SIZE", "256"))
+DEFAULT_PROMOTE_AFTER = int(os.getenv("QUARANTINE_PROMOTE_AFTER", "3"))
+
+
+class QuarantinedSender:
+    __slots__ = ("record", "sightings", "last_counter", "first_seen",
+                 "last_seen")
+
+    def __init__(self, record: SenderRecord, now: float):
+        # Collects the receivers it addressed, kept on promotion
+        self.record = record
+        self.sightings = 0
+        self.last_counter: int | None = None
+        self.first_seen = now
+        self.last_seen = now
+
+    def to_dict(self) -> dict[str, object]:
+        return {
+            "device_id": self.record.device_id,
+            "sightings": self.sightings,
+            "receivers": sorted(
+                device.enumerator for device in self.record.devices.values()
+            ),
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+        }
+
+
+class SenderQuarantine:
+    """
+    Senders heard over the air that are not in the registry yet: the
+    neighbours' remotes, corrupted IDs and our own remotes before they have
+    been used a few times. Bounded, the least recently heard sender is
+    dropped first. Not persisted.
+
+    A sighting is one transmission: the repeats of a frame share its
+    counter and only count once.
+    """
+
+    def __init__(
+        self,
+        capacity: int = DEFAULT_QUARANTINE_SIZE,
+        promote_after: int = DEFAULT_PROMOTE_AFTER,
+    ):
+        self.capacity = capacity
+        self.promote_after = promote_after
+        self.evicted = 0
+        self._entries: OrderedDict[int, QuarantinedSender] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def sight(self, key: int, counter: int | None = None) -> QuarantinedSender:
+        """Count a frame to the device ``key`` (see ``device_key()``)."""
+        now = time.time()
+        sender = key >> 8
+        entry = self._entries.get(sender)
+        if entry is None:
+            entry = QuarantinedSender(SenderRecord(sender), now)
+            self._entries[sender] = entry
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._entries.move_to_end(sender)
+        if key & 0xFF not in entry.record.devices:
+            entry.record = entry.record.with_device(DeviceRecord(key))
+        if counter is None or counter != entry.last_counter:
+            entry.sightings += 1
+            entry.last_counter = counter
+        entry.last_seen = now
+        return entry
+
+    def pop(self, sender: int) -> QuarantinedSender | None:
+        return self._entries.pop(sender, None)
+
+    def entries(self) -> list[QuarantinedSender]:
+        """Most recently heard first."""
+        return list(reversed(self._entries.values()))
@@ -1,84 +1,445 @@
 import json
+import os
+import threading
+from dataclasses import dataclass
 from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Iterable, Literal, Mapping
 
-from pydantic import BaseModel, field_serializer
+from pydantic import BaseModel, PrivateAttr
 
-from .devices import Device, SenderDevice
+from .devices import (
+    Device,
+    DeviceRecord,
+    SenderDevice,
+    SenderRecord,
+    device_key,
+    parse_device_id,
+    parse_enumerator,
+)
+from .quarantine import QuarantinedSender, SenderQuarantine
+from .storage import SqliteStore, is_sqlite_path
+
+
+@dataclass(frozen=True, slots=True)
+class RegistrySnapshot:
+    """
+    Immutable view of the registry. Readers grab the current snapshot
+    without locking; writers publish a new one.
+    """
+
+    version: int
+    by_key: Mapping[int, SenderRecord]
+    self_sender_key: int | None
+
+    @property
+    def senders(self) -> Iterable[SenderRecord]:
+        return self.by_key.values()
+
+    @property
+    def self_sender_id(self) -> str | None:
+        if self.self_sender_key is None:
+            return None
+        return f"{self.self_sender_key:06X}"
+
+    @property
+    def self_sender(self) -> SenderRecord | None:
+        if self.self_sender_key is None:
+            return None
+        return self.by_key.get(self.self_sender_key)
+
+    def get_sender(self, device_id: str) -> SenderRecord | None:
+        try:
+            return self.by_key.get(int(device_id, 16))
+        except ValueError:
+            return None
+
+    def get_device(
+        self, sender_id: str, enumerator: str
+    ) -> DeviceRecord | None:
+        sender = self.get_sender(sender_id)
+        if sender:
+            try:
+                return sender.get_device(int(enumerator, 16))
+            except ValueError:
+                return None
+
+    def has_device(self, key: int) -> bool:
+        sender = self.by_key.get(key >> 8)
+        return sender is not None and key & 0xFF in sender.devices
+
+    def models(self) -> frozenset[SenderDevice]:
+        """The registry as pydantic models, for responses and saving."""
+        return frozenset(sender.to_model() for sender in self.senders)
+
+
+@dataclass(frozen=True, slots=True)
+class RegistryChange:
+    """
+    One step of ``Settings.apply_changes()``, on the device ``enumerator``
+    of the sender, or on the sender itself without one:
+
+    add     the sender or device unless known, then name it if ``name``
+    rename  name the known sender or device ``name``
+    remove  forget the device
+    """
+
+    action: Literal["add", "rename", "remove"]
+    sender_id: str
+    enumerator: str | None = None
+    name: str | None = None
 
 
 class Settings(BaseModel):
     baud_rate: int = 9600
     timeout: int = 10
-    senders: set[SenderDevice] = set()
+    # Only used to load and save; at runtime the registry lives in the
+    # snapshot as SenderRecord/DeviceRecord
+    senders: frozenset[SenderDevice] = frozenset()
     self_sender_id: str | None = None
 
-    @property
-    def self_sender(self) -> SenderDevice | None:
-        return next(
-            filter(lambda s: s.device_id == self.self_sender_id, self.senders),
-            None,
+    # Copy-on-write: writers serialize on the lock and replace the snapshot
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+    _snapshot: RegistrySnapshot = PrivateAttr()
+    # Where save() writes to, None keeps the settings in memory only
+    _path: Path | None = PrivateAttr(default=None)
+    # SQLite backend, written row by row; None writes the JSON file
+    _store: SqliteStore | None = PrivateAttr(default=None)
+    # Unknown senders wait here until promoted, guarded by _lock
+    _quarantine: SenderQuarantine = PrivateAttr(
+        default_factory=SenderQuarantine
+    )
+
+    def model_post_init(self, context: Any) -> None:
+        by_key = {}
+        for sender in self.senders:
+            record = SenderRecord.from_model(sender)
+            by_key[record.key] = record
+        self._snapshot = RegistrySnapshot(
+            0,
+            MappingProxyType(by_key),
+            (parse_device_id(self.self_sender_id)
+             if self.self_sender_id is not None else None),
         )
+        self.senders = frozenset()
+
+    def snapshot(self) -> RegistrySnapshot:
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        """Bumped by every mutation of the registry, never persisted."""
+        return self._snapshot.version
 
-    def get_sender_by_id(self, device_id: str) -> SenderDevice | None:
-        return next(
-            filter(lambda s: s.device_id == device_id, self.senders), None
+    def _publish(
+        self,
+        by_key: dict[int, SenderRecord],
+        self_sender_key: int | None = None,
+    ) -> None:
+        """Swap in a new snapshot. Must be called with the lock held."""
+        current = self._snapshot
+        if self_sender_key is None:
+            self_sender_key = current.self_sender_key
+        self._snapshot = RegistrySnapshot(
+            current.version + 1,
+            MappingProxyType(by_key),
+            self_sender_key,
         )
+        self.self_sender_id = self._snapshot.self_sender_id
+
+    def _replace_sender(self, sender: SenderRecord) -> None:
+        """Publish a snapshot with ``sender`` added or replaced."""
+        by_key = dict(self._snapshot.by_key)
+        by_key[sender.key] = sender
+        self._publish(by_key)
+
+    def _meta(self) -> dict[str, Any]:
+        return self.model_dump(mode="json", exclude={"senders"})
+
+    def _persist(
+        self,
+        sender: SenderRecord | None = None,
+        devices: Iterable[DeviceRecord] = (),
+        removed: Iterable[int] = (),
+    ) -> None:
+        """
+        Write a change, with the lock held: only the rows it touched with
+        SQLite, the whole file otherwise.
+        """
+        if self._store is None:
+            self.save()
+        else:
+            self._store.apply(sender, devices, removed)
+
+    @property
+    def self_sender(self) -> SenderRecord | None:
+        return self._snapshot.self_sender
+
+    def get_sender_by_id(self, device_id: str) -> SenderRecord | None:
+        return self._snapshot.get_sender(device_id)
 
     def get_device_by_sender_and_enumerator(
         self, sender_id: str, enumerator: str
-    ) -> Device | None:
-        sender = self.get_sender_by_id(sender_id)
-        if sender:
-            return next(
-                filter(
-                    lambda d: d.enumerator == enumerator,
-                    sender.connected_devices,
-                ),
-                None,
+    ) -> DeviceRecord | None:
+        return self._snapshot.get_device(sender_id, enumerator)
+
+    def replace_registry(
+        self,
+        senders: Iterable[SenderDevice | SenderRecord],
+        self_sender_id: str | None = None,
+    ) -> None:
+        """Replace all senders at once, e.g. for imports and benchmarks."""
+        by_key = {}
+        for sender in senders:
+            if isinstance(sender, SenderDevice):
+                sender = SenderRecord.from_model(sender)
+            by_key[sender.key] = sender
+        with self._lock:
+            self._publish(
+                by_key,
+                (parse_device_id(self_sender_id)
+                 if self_sender_id is not None else None),
+            )
+            if self._store is None:
+                self.save()
+            else:
+                self._store.replace(self._snapshot.senders, self._meta())
+
+    def add_sender(self, sender: SenderRecord) -> SenderRecord:
+        """Add ``sender`` unless a sender with that ID is already known."""
+        with self._lock:
+            existing = self._snapshot.by_key.get(sender.key)
+            if existing:
+                return existing
+            self._replace_sender(sender)
+            self._persist(sender, sender.devices.values())
+            return sender
+
+    def set_self_sender(self, device_id: str, name: str = "self") -> None:
+        key = parse_device_id(device_id)
+        with self._lock:
+            self.add_sender(SenderRecord(key, name))
+            if self._snapshot.self_sender_key != key:
+                self._publish(dict(self._snapshot.by_key), key)
+                self.save()
+
+    def touch_device(
+        self, key: int, counter: int | None = None
+    ) -> SenderRecord:
+        """
+        Sender of the device ``key`` (see ``device_key()``), registering a
+        new device of a known sender. Unknown senders are quarantined and
+        only join the registry after enough sightings; until then the
+        returned record is not part of the registry.
+        """
+        # Checked without the lock first: almost every frame is a no-op
+        sender = self._snapshot.by_key.get(key >> 8)
+        if sender is not None and key & 0xFF in sender.devices:
+            return sender
+        with self._lock:
+            sender = self._snapshot.by_key.get(key >> 8)
+            if sender is None:
+                quarantine = self._quarantine
+                entry = quarantine.sight(key, counter)
+                if entry.sightings < quarantine.promote_after:
+                    return entry.record
+                quarantine.pop(entry.record.key)
+                print(f"[REGISTRY] Promoting sender "
+                      f"{entry.record.device_id} after "
+                      f"{entry.sightings} sightings")
+                self._replace_sender(entry.record)
+                self._persist(entry.record, entry.record.devices.values())
+                return entry.record
+            if key & 0xFF not in sender.devices:
+                device = DeviceRecord(key)
+                sender = sender.with_device(device)
+                self._replace_sender(sender)
+                self._persist(devices=(device,))
+            return sender
+
+    def quarantined(self) -> list[QuarantinedSender]:
+        with self._lock:
+            return self._quarantine.entries()
+
+    @property
+    def quarantine(self) -> SenderQuarantine:
+        return self._quarantine
+
+    def promote_sender(self, device_id: str) -> SenderRecord:
+        """
+        Add a sender to the registry on the user's request, with the
+        receivers it was heard addressing if it is quarantined.
+        """
+        key = parse_device_id(device_id)
+        with self._lock:
+            entry = self._quarantine.pop(key)
+            return self.add_sender(
+                entry.record if entry else SenderRecord(key)
             )
 
     def add_device(self, sender_id: str, device: Device) -> None:
         sender = self.get_sender_by_id(sender_id)
         if sender:
-            sender.connected_devices.add(device)
-            self.save()
+            self.touch_device(
+                device_key(sender.key, parse_enumerator(device.enumerator))
+            )
 
     def pair_device(self, enumerator: str, name: str | None = None) -> None:
         print(f"[PAIR] Pairing device with enumerator {enumerator}")
-        if not self.self_sender:
-            raise ValueError("Self sender device not initialized")
-        self.self_sender.connected_devices.add(
-            Device(enumerator=enumerator, name=name)
-        )
-        self.save()
+        number = parse_enumerator(enumerator)
+        with self._lock:
+            sender = self.self_sender
+            if not sender:
+                raise ValueError("Self sender device not initialized")
+            if number in sender.devices:
+                # Keep the existing entry, as a set.add() would
+                return
+            device = DeviceRecord(device_key(sender.key, number), name)
+            self._replace_sender(sender.with_device(device))
+            self._persist(devices=(device,))
 
     def remove_device(self, sender_id: str, enumerator: str) -> None:
-        if sender := self.get_sender_by_id(sender_id):
-            sender.connected_devices.remove(Device(enumerator=enumerator))
-            self.save()
+        with self._lock:
+            if sender := self.get_sender_by_id(sender_id):
+                number = int(enumerator, 16)
+                if number not in sender.devices:
+                    raise KeyError(enumerator)
+                self._replace_sender(sender.without_device(number))
+                self._persist(removed=(device_key(sender.key, number),))
 
     def rename_sender(
         self, sender_id: str, new_name: str
-    ) -> SenderDevice | None:
-        sender = self.get_sender_by_id(sender_id)
-        if sender:
-            sender.name = new_name
-            self.save()
-        return sender
+    ) -> SenderRecord | None:
+        with self._lock:
+            sender = self.get_sender_by_id(sender_id)
+            if sender:
+                sender = sender.with_name(new_name)
+                self._replace_sender(sender)
+                self._persist(sender)
+            return sender
 
     def rename_receiver(
         self, sender_id: str, enumerator: str, new_name: str
-    ) -> Device | None:
-        device = self.get_device_by_sender_and_enumerator(
-            sender_id, enumerator
-        )
-        if device:
-            device.name = new_name
-            self.save()
-        return device
+    ) -> DeviceRecord | None:
+        with self._lock:
+            sender = self.get_sender_by_id(sender_id)
+            device = self.get_device_by_sender_and_enumerator(
+                sender_id, enumerator
+            )
+            if sender and device:
+                device = device.renamed(new_name)
+                self._replace_sender(sender.with_device(device))
+                self._persist(devices=(device,))
+            return device
+
+    def apply_changes(self, changes: Iterable[RegistryChange]) -> set[int]:
+        """
+        Apply ``changes`` in order as one transaction: a single new
+        snapshot and a single write, or neither if a change fails. Returns
+        the keys of the senders changed. Raises ValueError naming the first
+        change that failed.
+        """
+        with self._lock:
+            by_key = dict(self._snapshot.by_key)
+            # Rows to write, the latest version of each
+            senders: dict[int, SenderRecord] = {}
+            devices: dict[int, DeviceRecord] = {}
+            removed: set[int] = set()
+            changed: set[int] = set()
+            for index, change in enumerate(changes):
+                try:
+                    sender = self._apply_change(
+                        change, by_key, senders, devices, removed
+                    )
+                except ValueError as e:
+                    raise ValueError(
+                        f"Change {index} ({change.action} "
+                        f"{change.sender_id}/{change.enumerator or ''}): {e}"
+                    ) from e
+                by_key[sender.key] = sender
+                changed.add(sender.key)
+            if not changed:
+                return changed
+            self._publish(by_key)
+            for key in changed:
+                self._quarantine.pop(key)
+            if self._store is None:
+                self.save()
+            else:
+                self._store.apply(
+                    senders=senders.values(),
+                    devices=devices.values(),
+                    removed=removed,
+                )
+            return changed
+
+    @staticmethod
+    def _apply_change(
+        change: RegistryChange,
+        by_key: dict[int, SenderRecord],
+        senders: dict[int, SenderRecord],
+        devices: dict[int, DeviceRecord],
+        removed: set[int],
+    ) -> SenderRecord:
+        key = parse_device_id(change.sender_id)
+        sender = by_key.get(key)
+        if change.action not in ("add", "rename", "remove"):
+            raise ValueError(f"Unknown action {change.action!r}")
+        if sender is None:
+            if change.action != "add":
+                raise ValueError("Unknown sender")
+            sender = SenderRecord(key)
+            senders[key] = sender
+        if change.enumerator is None:
+            if change.action == "remove":
+                raise ValueError("Removing needs an enumerator")
+            if change.name is not None or change.action == "rename":
+                sender = sender.with_name(change.name)
+                senders[key] = sender
+            return sender
+
+        number = parse_enumerator(change.enumerator)
+        dkey = device_key(key, number)
+        device = sender.get_device(number)
+        if change.action == "remove":
+            if device is None:
+                raise ValueError("Unknown device")
+            devices.pop(dkey, None)
+            removed.add(dkey)
+            return sender.without_device(number)
+        if device is None:
+            if change.action == "rename":
+                raise ValueError("Unknown device")
+            device = DeviceRecord(dkey)
+        if change.name is not None or change.action == "rename":
+            device = device.renamed(change.name)
+        devices[dkey] = device
+        removed.discard(dkey)
+        return sender.with_device(device)
+
+    @property
+    def path(self) -> Path | None:
+        return self._path
+
+    @property
+    def store(self) -> SqliteStore | None:
+        return self._store
 
     @classmethod
     def from_file(cls, file_path: Path) -> "Settings":
+        settings = cls._read(file_path)
+        settings._path = file_path
+        return settings
+
+    @classmethod
+    def from_store(cls, store: SqliteStore) -> "Settings":
+        settings = cls(**store.load())
+        settings._path = store.path
+        settings._store = store
+        return settings
+
+    @classmethod
+    def _read(cls, file_path: Path) -> "Settings":
         if not file_path.exists():
             return cls()
         with open(file_path, "r") as f:
@@ -89,34 +450,96 @@ class Settings(BaseModel):
                 return cls()
 
     def save(self) -> None:
-        with open(file, "w") as f:
-            json.dump(self.model_dump(mode="json"), f, indent=2)
-
-    @field_serializer("senders")
-    def serialize_senders(
-        self, senders: set[SenderDevice]
-    ) -> list[SenderDevice]:
-        return sorted(
-            senders,
-            key=lambda s: (
-                s.connected_devices,
-                s.name if s.name else "",
-                s.device_id,
-            ),
-        )
+        """
+        Write everything to settings.json. With SQLite the registry rows
+        are already written as they change; only the scalars are saved.
+        """
+        if self._store is not None:
+            with self._lock:
+                self._store.apply(meta=self._meta())
+            return
+        if self._path is None:
+            return
+        with self._lock:
+            # Same layout as model_dump(), without building the models
+            data = self._meta()
+            data["senders"] = [
+                sender.to_dict()
+                for sender in sorted(
+                    self._snapshot.senders, key=lambda s: s.key
+                )
+            ]
+            with open(self._path, "w") as f:
+                json.dump(data, f, indent=2)
 
     def __hash__(self) -> int:
         return hash(
             (
                 self.baud_rate,
                 self.timeout,
-                frozenset(self.senders),
-                self.self_sender,
+                frozenset(self._snapshot.by_key),
+                self.self_sender_id,
             )
         )
 
 
-file = Path("/config/settings.json")
-file.touch()
+DEFAULT_SETTINGS_FILE = Path("/config/settings.json")
+
+_settings: Settings | None = None
+_settings_lock = threading.Lock()
+
+
+def settings_path() -> Path:
+    """
+    Registry location: ``$SETTINGS_FILE`` or /config/settings.json. A
+    .db/.sqlite file selects the SQLite backend.
+    """
+    return Path(os.getenv("SETTINGS_FILE", DEFAULT_SETTINGS_FILE))
+
+
+def _migrate(legacy: Path, store: SqliteStore) -> None:
+    """Import a settings.json into a new database, keeping it aside."""
+    settings = Settings.from_file(legacy)
+    store.replace(settings.snapshot().senders, settings._meta())
+    legacy.rename(legacy.with_name(f"{legacy.name}.migrated"))
+    print(f"[SETTINGS] Migrated {legacy} to {store.path}")
+
+
+def _open(path: Path) -> Settings:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if not is_sqlite_path(path):
+        return Settings.from_file(path)
+    store = SqliteStore(path)
+    legacy = path.with_suffix(".json")
+    if store.is_empty() and legacy.exists():
+        _migrate(legacy, store)
+    return Settings.from_store(store)
+
+
+def configure_settings(path: Path | None = None) -> Settings:
+    """
+    (Re)load the settings from ``path`` (default: ``settings_path()``) and
+    make them the instance returned by ``get_settings()``.
+    """
+    global _settings
+    settings = _open(path or settings_path())
+    with _settings_lock:
+        _settings = settings
+    return settings
+
+
+def get_settings() -> Settings:
+    """The process-wide settings, loaded on first use."""
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = _open(settings_path())
+    return _settings
+
 
-SETTINGS = Settings.from_file(file)
+def __getattr__(name: str) -> Settings:
+    # Backwards compatible ``SETTINGS`` that no longer loads on import
+    if name == "SETTINGS":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
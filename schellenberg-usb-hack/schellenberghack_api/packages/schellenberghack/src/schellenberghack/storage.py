@@ -0,0 +1,217 @@
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Iterable
+
+from .devices import DeviceRecord, SenderRecord
+
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS senders (
+    key INTEGER PRIMARY KEY,
+    name TEXT
+);
+CREATE TABLE IF NOT EXISTS devices (
+    key INTEGER PRIMARY KEY,
+    sender INTEGER NOT NULL,
+    name TEXT
+);
+CREATE INDEX IF NOT EXISTS devices_sender ON devices (sender);
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    sender INTEGER NOT NULL,
+    receiver INTEGER NOT NULL,
+    command INTEGER NOT NULL,
+    counter INTEGER NOT NULL,
+    local_counter INTEGER NOT NULL,
+    signal_strength INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_sender_time ON events (sender, timestamp);
+CREATE INDEX IF NOT EXISTS events_time ON events (timestamp);
+"""
+
+# (timestamp, sender, receiver, command, counter, local_counter, signal)
+EventRow = tuple[float, int, int, int, int, int, int]
+
+
+def is_sqlite_path(path: Path) -> bool:
+    return path.suffix.lower() in SQLITE_SUFFIXES
+
+
+class SqliteStore:
+    """
+    Registry and event log in one SQLite database in WAL mode. Every
+    registry change is a transaction over the few rows it touches;
+    ``replace()`` rewrites everything, for imports and migrations.
+
+    One connection, shared between the event loop and worker threads
+    behind a lock.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # Durable at checkpoints; a power cut loses at most the last commits
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    # --- registry -----------------------------------------------------------
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return not any(
+                self._db.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+                for table in ("meta", "senders")
+            )
+
+    def load(self) -> dict[str, Any]:
+        """The stored settings, in the layout of settings.json."""
+        with self._lock:
+            data: dict[str, Any] = {
+                name: json.loads(value)
+                for name, value in self._db.execute(
+                    "SELECT name, value FROM meta"
+                )
+            }
+            senders: dict[int, dict[str, Any]] = {
+                key: {
+                    "device_id": f"{key:06X}",
+                    "name": name,
+                    "connected_devices": [],
+                }
+                for key, name in self._db.execute(
+                    "SELECT key, name FROM senders"
+                )
+            }
+            for key, sender, name in self._db.execute(
+                "SELECT key, sender, name FROM devices"
+            ):
+                if sender in senders:
+                    senders[sender]["connected_devices"].append({
+                        "enumerator": f"{key & 0xFF:02X}", "name": name,
+                    })
+        data["senders"] = list(senders.values())
+        return data
+
+    def apply(
+        self,
+        sender: SenderRecord | None = None,
+        devices: Iterable[DeviceRecord] = (),
+        removed: Iterable[int] = (),
+        meta: dict[str, Any] | None = None,
+        senders: Iterable[SenderRecord] = (),
+    ) -> None:
+        """Upsert/delete the given rows in one transaction."""
+        if sender is not None:
+            senders = (sender, *senders)
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT INTO senders (key, name) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET name = excluded.name",
+                ((s.key, s.name) for s in senders),
+            )
+            self._db.executemany(
+                "INSERT INTO devices (key, sender, name) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET name = excluded.name",
+                ((d.key, d.sender, d.name) for d in devices),
+            )
+            self._db.executemany(
+                "DELETE FROM devices WHERE key = ?",
+                ((key,) for key in removed),
+            )
+            if meta:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                    ((name, json.dumps(value))
+                     for name, value in meta.items()),
+                )
+
+    def replace(
+        self, senders: Iterable[SenderRecord], meta: dict[str, Any]
+    ) -> None:
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM devices")
+            self._db.execute("DELETE FROM senders")
+            self._db.execute("DELETE FROM meta")
+            for sender in senders:
+                self._db.execute(
+                    "INSERT INTO senders (key, name) VALUES (?, ?)",
+                    (sender.key, sender.name),
+                )
+                self._db.executemany(
+                    "INSERT INTO devices (key, sender, name) VALUES (?, ?, ?)",
+                    ((d.key, d.sender, d.name)
+                     for d in sender.devices.values()),
+                )
+            self._db.executemany(
+                "INSERT INTO meta (name, value) VALUES (?, ?)",
+                ((name, json.dumps(value)) for name, value in meta.items()),
+            )
+
+    # --- event log ----------------------------------------------------------
+
+    def append_events(self, rows: list[EventRow]) -> None:
+        with self._lock, self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT INTO events (timestamp, sender, receiver, command, "
+                "counter, local_counter, signal_strength) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def prune_events(self, before: float) -> int:
+        """Drop events older than ``before``, returns how many."""
+        with self._lock, self._db:
+            return self._db.execute(
+                "DELETE FROM events WHERE timestamp < ?", (before,)
+            ).rowcount
+
+    def query_events(
+        self,
+        sender: int | None = None,
+        receiver: int | None = None,
+        command: int | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        limit: int = 100,
+    ) -> list[tuple[int, float, int, int, int, int, int, int]]:
+        """Newest ``limit`` matching events, returned oldest first."""
+        clauses, params = [], []
+        for column, op, value in (
+            ("sender", "=", sender),
+            ("receiver", "=", receiver),
+            ("command", "=", command),
+            ("timestamp", ">=", since),
+            ("timestamp", "<=", until),
+        ):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, timestamp, sender, receiver, command, counter, "
+                "local_counter, signal_strength FROM events "
+                f"{where} ORDER BY timestamp DESC, seq DESC LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+        rows.reverse()
+        return rows
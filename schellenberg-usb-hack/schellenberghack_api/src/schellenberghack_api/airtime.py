@@ -0,0 +1,125 @@
+import os
+import time
+from collections import deque
+from typing import Callable
+
+# Share of the window the stick may transmit, 1% in the 868 MHz SRD band
+DUTY_CYCLE = float(os.getenv("DUTY_CYCLE_PERCENT", "1")) / 100
+# Share of the budget that bulk traffic leaves to interactive commands
+BULK_RESERVE = float(os.getenv("AIRTIME_RESERVE_PERCENT", "25")) / 100
+WINDOW = 3600.0
+# First guess for a transmission, until some were measured
+DEFAULT_AIRTIME = 0.5
+# How long only STOP may be sent after the stick refused with tE
+REFUSED_BACKOFF = 60.0
+
+PRIORITY_STOP = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BULK = 2
+# Or-ed into a priority: a STOP is queued at that priority too instead of
+# going first, so a batch is sent in its own order
+KEEP_ORDER = 0x80
+
+
+class AirtimeBudget:
+    """
+    Rolling account of the stick's transmit time, measured from ``t1`` to
+    ``t0``, against the duty-cycle limit over the last hour.
+
+    ``delay()`` tells the send worker how long a message of a priority has
+    to wait: STOP never waits, interactive commands wait only when the
+    budget is spent, and bulk traffic already when it would eat into the
+    reserve. Waiting means until enough old transmissions left the window.
+    """
+
+    def __init__(
+        self,
+        duty_cycle: float = DUTY_CYCLE,
+        reserve: float = BULK_RESERVE,
+        window: float = WINDOW,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.window = window
+        self.clock = clock
+        self.limit = window * duty_cycle
+        self.reserve = reserve
+        # (end, duration) of the transmissions within the window
+        self._transmissions: deque[tuple[float, float]] = deque()
+        self._used = 0.0
+        self._started: float | None = None
+        self._blocked_until = 0.0
+        self.average = DEFAULT_AIRTIME
+        self.stats = {"transmissions": 0, "deferred": 0, "refused": 0}
+
+    def transmitter_on(self) -> None:
+        self._started = self.clock()
+
+    def transmitter_off(self) -> None:
+        if self._started is None:
+            return
+        now = self.clock()
+        duration = now - self._started
+        self._started = None
+        self._transmissions.append((now, duration))
+        self._used += duration
+        if self.stats["transmissions"]:
+            self.average += (duration - self.average) / 8
+        else:
+            self.average = duration
+        self.stats["transmissions"] += 1
+
+    def refused(self) -> None:
+        """The stick answered ``tE``, most likely out of duty cycle."""
+        self._started = None
+        self._blocked_until = self.clock() + REFUSED_BACKOFF
+        self.stats["refused"] += 1
+
+    def _expire(self, now: float) -> None:
+        while self._transmissions and (
+            self._transmissions[0][0] <= now - self.window
+        ):
+            self._used -= self._transmissions.popleft()[1]
+        if not self._transmissions:
+            self._used = 0.0
+
+    def used(self) -> float:
+        self._expire(self.clock())
+        return self._used
+
+    def delay(self, priority: int) -> float:
+        """Seconds until a message of ``priority`` may be transmitted."""
+        if priority <= PRIORITY_STOP:
+            return 0.0
+        now = self.clock()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        self._expire(now)
+        cap = self.limit
+        if priority >= PRIORITY_BULK:
+            cap *= 1 - self.reserve
+        excess = self._used + self.average - cap
+        if excess <= 0:
+            return 0.0
+        for end, duration in self._transmissions:
+            excess -= duration
+            if excess <= 0:
+                return end + self.window - now
+        # A single transmission larger than the cap, don't starve it
+        return 0.0
+
+    def usage(self) -> dict[str, float | int]:
+        used = self.used()
+        return {
+            "window_s": self.window,
+            "duty_cycle_percent": self.limit / self.window * 100,
+            "limit_s": round(self.limit, 3),
+            "used_s": round(used, 3),
+            "used_percent": round(used / self.limit * 100, 1)
+            if self.limit else 100.0,
+            "remaining_s": round(max(self.limit - used, 0.0), 3),
+            "average_airtime_s": round(self.average, 3),
+            "blocked_s": round(
+                max(self._blocked_until - self.clock(), 0.0), 1
+            ),
+            **self.stats,
+        }
@@ -0,0 +1,230 @@
+"""
+Binary capture and replay of the raw serial link.
+
+A capture file starts with ``MAGIC`` followed by one record per line seen on
+the serial port:
+
+    <Q  monotonic timestamp in nanoseconds
+    B   direction (DIRECTION_RX / DIRECTION_TX)
+    B   payload length
+    ... payload (the stripped line, e.g. b"t1" or b"ssDEABCDEF0100bb20CB")
+
+Usage:
+    python -m schellenberghack_api.capture <file> [--fast] [--speed N]
+                                           [--settings settings.json]
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import struct
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Iterator
+
+MAGIC = b"SCHCAP1\n"
+RECORD = struct.Struct("<QBB")
+
+DIRECTION_RX = 0
+DIRECTION_TX = 1
+
+# A crash or SIGKILL loses at most this many records or seconds of traffic
+FLUSH_RECORDS = 64
+FLUSH_INTERVAL = 1.0
+# Size at which the capture moves to <file>.1 and starts over, 0 for none
+CAPTURE_MAX_BYTES = int(os.getenv("CAPTURE_MAX_BYTES", str(50 * 2**20)))
+
+
+@dataclass(frozen=True, slots=True)
+class CapturedFrame:
+    timestamp_ns: int
+    direction: int
+    data: bytes
+
+
+class FrameRecorder:
+    """
+    Append-only writer for raw serial lines. Buffered records are flushed
+    every ``FLUSH_RECORDS`` records and at the latest ``FLUSH_INTERVAL``
+    seconds after the first of them, or right away outside an event loop.
+    Past ``max_bytes`` the file is rotated to ``<file>.1``, replacing the
+    previous one.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = CAPTURE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._open()
+        self._pending = 0
+        self._flush_timer: asyncio.TimerHandle | None = None
+
+    def _open(self) -> None:
+        self._file = open(self.path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._size = self._file.tell()
+
+    def _rotate(self) -> None:
+        self.flush()
+        self._file.close()
+        os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        self._open()
+        print(f"[CAPTURE] Rotated {self.path}")
+
+    def record(self, direction: int, data: bytes) -> None:
+        data = data.strip()[:255]
+        if self.max_bytes and self._size + RECORD.size + len(data) \
+                > self.max_bytes:
+            self._rotate()
+        self._file.write(
+            RECORD.pack(time.monotonic_ns(), direction, len(data)) + data
+        )
+        self._size += RECORD.size + len(data)
+        self._pending += 1
+        if self._pending >= FLUSH_RECORDS:
+            self.flush()
+        elif self._flush_timer is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.flush()
+                return
+            self._flush_timer = loop.call_later(FLUSH_INTERVAL, self.flush)
+
+    def record_rx(self, data: bytes) -> None:
+        self.record(DIRECTION_RX, data)
+
+    def record_tx(self, data: bytes) -> None:
+        self.record(DIRECTION_TX, data)
+
+    def flush(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        self._pending = 0
+        if not self._file.closed:
+            self._file.flush()
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+class FrameReplayer:
+    """Reads a capture file and feeds it back with the original timing."""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def frames(self) -> Iterator[CapturedFrame]:
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a capture file: {self.path}")
+            while header := f.read(RECORD.size):
+                if len(header) < RECORD.size:
+                    break  # truncated trailing record
+                timestamp_ns, direction, length = RECORD.unpack(header)
+                data = f.read(length)
+                if len(data) < length:
+                    break
+                yield CapturedFrame(timestamp_ns, direction, data)
+
+    async def replay(
+        self,
+        handler: Callable[[bytes], Awaitable[None]],
+        realtime: bool = True,
+        speed: float = 1.0,
+        include_tx: bool = False,
+    ) -> int:
+        """
+        Feed the captured lines to ``handler``. With ``realtime`` the gaps
+        between records are reproduced (divided by ``speed``), otherwise the
+        frames are fed as fast as the handler accepts them.
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        first_ts: int | None = None
+        count = 0
+        for frame in self.frames():
+            if frame.direction == DIRECTION_TX and not include_tx:
+                continue
+            if first_ts is None:
+                first_ts = frame.timestamp_ns
+            if realtime:
+                offset = (frame.timestamp_ns - first_ts) / 1e9 / speed
+                delay = start + offset - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await handler(frame.data)
+            count += 1
+        return count
+
+
+async def _replay_pipeline(path: Path, realtime: bool, speed: float):
+    from .worker import ReceiveWorker
+
+    # The replayed t1/t0/tE lines go to a budget of the worker's own
+    worker = ReceiveWorker(None, isolated=True)
+
+    async def drain():
+        while True:
+            await worker.receivedMessages.get()
+
+    drainer = asyncio.create_task(drain())
+    started = time.perf_counter()
+    count = await FrameReplayer(path).replay(
+        worker.handle_line, realtime, speed
+    )
+    elapsed = time.perf_counter() - started
+    drainer.cancel()
+    stats = worker.airtime.stats
+    print(
+        f"[REPLAY] {count} lines in {elapsed:.3f}s "
+        f"({count / elapsed if elapsed else 0:.0f} lines/s), "
+        f"{stats['transmissions']} transmissions, "
+        f"{stats['refused']} refused"
+    )
+
+
+def _scratch_settings(source: Path | None) -> None:
+    """
+    Replay into a registry in a scratch directory, started from a copy of
+    ``source`` if given, so the senders it learns never reach the real one.
+    """
+    from schellenberghack.settings import configure_settings
+
+    workdir = Path(tempfile.mkdtemp(prefix="schellenberg-replay-"))
+    target = workdir / (source.name if source else "settings.json")
+    if source:
+        # A SQLite registry may still have changes in its write-ahead log
+        for suffix in ("", "-wal"):
+            if source.with_name(source.name + suffix).exists():
+                shutil.copy(source.with_name(source.name + suffix),
+                            target.with_name(target.name + suffix))
+    configure_settings(target)
+    print(f"[REPLAY] Using a scratch registry in {workdir}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("file", type=Path)
+    parser.add_argument(
+        "--fast", action="store_true", help="ignore the original timing"
+    )
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument(
+        "--settings", type=Path,
+        help="registry to start from, copied and left unchanged",
+    )
+    args = parser.parse_args()
+    _scratch_settings(args.settings)
+    asyncio.run(_replay_pipeline(args.file, not args.fast, args.speed))
+
+
+if __name__ == "__main__":
+    main()
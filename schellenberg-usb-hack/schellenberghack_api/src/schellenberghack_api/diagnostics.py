@@ -0,0 +1,238 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import traceback
+from collections import Counter, deque
+from types import FrameType
+
+# Log the stack of whatever holds the event loop longer than this
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100")) / 1000
+LOOP_LAG_INTERVAL = 0.05
+# Upper bounds of the lag histogram buckets, in ms
+LAG_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+MAX_STALLS = 20
+MAX_PROFILE_SECONDS = 60.0
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes a task that sleeps
+    ``interval`` seconds, into a histogram of lags.
+
+    A watchdog thread checks the task's heartbeat. Once the loop has not
+    come round for ``threshold`` seconds, it logs the loop thread's
+    current stack, which is whatever blocks it, and the stall is kept with
+    its total duration once the loop is back.
+    """
+
+    def __init__(
+        self,
+        threshold: float = LOOP_LAG_THRESHOLD,
+        interval: float = LOOP_LAG_INTERVAL,
+        name: str = "LOOP",
+    ):
+        self.threshold = threshold
+        self.interval = interval
+        self.name = name
+        self.buckets = [0] * (len(LAG_BUCKETS_MS) + 1)
+        self.samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls: deque[dict[str, object]] = deque(maxlen=MAX_STALLS)
+        self.task: asyncio.Task | None = None
+        self._beat = time.monotonic()
+        self._stack: list[str] | None = None
+        self._loop_thread = 0
+        self._stop = threading.Event()
+        self._watchdog: threading.Thread | None = None
+
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self.task = asyncio.create_task(self._run())
+        self._stop.clear()
+        self._watchdog = threading.Thread(
+            target=self._watch, name=f"{self.name.lower()}-watchdog",
+            daemon=True,
+        )
+        self._watchdog.start()
+
+    def record(self, lag: float) -> None:
+        lag_ms = lag * 1000
+        for index, bound in enumerate(LAG_BUCKETS_MS):
+            if lag_ms <= bound:
+                break
+        else:
+            index = len(LAG_BUCKETS_MS)
+        self.buckets[index] += 1
+        self.samples += 1
+        self.total_lag += lag
+        if lag > self.max_lag:
+            self.max_lag = lag
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+            lag = max(now - expected, 0.0)
+            self.record(lag)
+            if lag >= self.threshold:
+                stack, self._stack = self._stack, None
+                print(f"[{self.name}] Event loop was blocked for "
+                      f"{lag * 1000:.0f} ms")
+                self.stalls.append({
+                    "time": time.time(),
+                    "lag_ms": round(lag * 1000, 1),
+                    "stack": stack or [],
+                })
+
+    def _watch(self):
+        reported = 0.0
+        while not self._stop.wait(self.threshold / 4):
+            beat = self._beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.threshold or beat == reported:
+                continue
+            reported = beat
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            self._stack = traceback.format_stack(frame)
+            print(f"[{self.name}] Event loop blocked for more than "
+                  f"{stalled * 1000:.0f} ms in:\n"
+                  + "".join(self._stack).rstrip())
+
+    def report(self) -> dict[str, object]:
+        labels = [f"<={bound}" for bound in LAG_BUCKETS_MS]
+        labels.append(f">{LAG_BUCKETS_MS[-1]}")
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "samples": self.samples,
+            "mean_lag_ms": round(self.total_lag / self.samples * 1000, 3)
+            if self.samples else 0.0,
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "histogram_ms": dict(zip(labels, self.buckets)),
+            "stalls": list(self.stalls),
+        }
+
+    async def exit(self):
+        self._stop.set()
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+
+def _frame_name(frame: FrameType) -> str:
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}.{frame.f_code.co_qualname}"
+
+
+def sample_profile(
+    seconds: float, interval: float = 0.005, limit: int = 30
+) -> dict[str, object]:
+    """
+    Sample the stacks of all other threads every ``interval`` seconds for
+    ``seconds``. Blocks, run it in a thread. Counts are per thread, so an
+    idle thread adds as many samples as a busy one. Stacks come back
+    folded, thread name and root first, as flame graph tools read them.
+    """
+    own = threading.get_ident()
+    stacks: Counter[str] = Counter()
+    own_time: Counter[str] = Counter()
+    total_time: Counter[str] = Counter()
+    threads: Counter[str] = Counter()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            if ident not in names:
+                names = {
+                    thread.ident: thread.name
+                    for thread in threading.enumerate()
+                }
+            thread = names.get(ident, str(ident))
+            calls = []
+            while frame is not None:
+                calls.append(_frame_name(frame))
+                frame = frame.f_back
+            calls.reverse()
+            threads[thread] += 1
+            stacks[";".join([thread, *calls])] += 1
+            if calls:
+                own_time[calls[-1]] += 1
+            for call in set(calls):
+                total_time[call] += 1
+        samples += 1
+        time.sleep(interval)
+    return {
+        "seconds": seconds,
+        "interval_ms": interval * 1000,
+        "samples": samples,
+        "threads": dict(threads.most_common()),
+        "functions": [
+            {
+                "function": name,
+                "own_samples": count,
+                "total_samples": total_time[name],
+            }
+            for name, count in own_time.most_common(limit)
+        ],
+        "stacks": [
+            {"stack": stack, "samples": count}
+            for stack, count in stacks.most_common(limit)
+        ],
+    }
+
+
+async def allocation_snapshot(
+    seconds: float, limit: int = 30, frames: int = 1
+) -> dict[str, object]:
+    """
+    Trace allocations for ``seconds`` and return the largest sources of
+    memory still held at the end. Tracing started here is stopped again.
+    The snapshot and its statistics scale with the heap, so both are taken
+    in a thread rather than on the event loop.
+    """
+    key = "traceback" if frames > 1 else "lineno"
+
+    def take() -> list[tracemalloc.Statistic]:
+        return tracemalloc.take_snapshot().statistics(key)
+
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(frames)
+    try:
+        await asyncio.sleep(seconds)
+        current, peak = tracemalloc.get_traced_memory()
+        statistics = await asyncio.to_thread(take)
+    finally:
+        if started:
+            tracemalloc.stop()
+    return {
+        "seconds": seconds,
+        "traced_bytes": current,
+        "peak_bytes": peak,
+        "top": [
+            {
+                "size_bytes": stat.size,
+                "count": stat.count,
+                "traceback": [
+                    f"{frame.filename}:{frame.lineno}"
+                    for frame in stat.traceback
+                ],
+            }
+            for stat in statistics[:limit]
+        ],
+    }
@@ -0,0 +1,232 @@
+"""
+Pseudo-terminal emulator of the Schellenberg USB stick.
+
+The emulator opens a PTY and speaks the stick protocol on it, so the real
+``ReceiveWorker``/``SendWorker`` and the ``lifespan`` handshake can run
+without hardware:
+
+    hello           ignored
+    !?              replies with the firmware version
+    sr              replies with ``sr<device id>``
+    ss<e><r><cc>..  replies ``t1``, waits ``airtime * (r + 1)``, then ``t0``
+
+Optionally it generates traffic from simulated remotes at a configurable
+rate, with repeats and line noise.
+
+Usage:
+    python -m schellenberghack_api.emulator [--rate N] [--airtime S]
+"""
+
+import argparse
+import os
+import random
+import threading
+import time
+import tty
+from queue import Queue
+from typing import Callable
+
+from schellenberghack.commands import Command
+
+FIRMWARE_VERSION = b"RFTU_V20 F:20180510_DFBD S:SB_V1 emulated"
+
+REMOTE_COMMANDS = (Command.UP, Command.DOWN, Command.STOP)
+
+# Run the real serial code path against an in-process emulator
+EMULATOR_MODE = os.getenv("EMULATOR", "false").lower() in (
+    "true", "1", "yes"
+)
+
+
+class StickEmulator:
+    def __init__(
+        self,
+        device_id: str = "ABCDEF",
+        airtime: float = 0.04,
+        remote_rate: float = 0.0,
+        remote_senders: list[str] | None = None,
+        remote_repeats: int = 3,
+        noise: float = 0.0,
+        seed: int | None = None,
+    ):
+        self.device_id = device_id
+        self.airtime = airtime
+        self.remote_rate = remote_rate
+        self.remote_senders = remote_senders or ["123456", "654321"]
+        self.remote_repeats = remote_repeats
+        self.noise = noise
+        self.random = random.Random(seed)
+        # Called with (line, monotonic time) for every transmit request
+        self.on_transmit: Callable[[bytes, float], None] | None = None
+        # Called with (frame, monotonic time) for every generated frame
+        self.on_frame: Callable[[bytes, float], None] | None = None
+        self.transmissions = 0
+        self.frames_sent = 0
+        self._master: int | None = None
+        self._slave: int | None = None
+        self._write_lock = threading.Lock()
+        self._tx_queue: Queue[bytes | None] = Queue()
+        self._stop = threading.Event()
+        self._counters: dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> "StickEmulator":
+        senders = os.getenv("EMULATOR_REMOTE_SENDERS")
+        return cls(
+            device_id=os.getenv("EMULATOR_DEVICE_ID", "ABCDEF"),
+            airtime=float(os.getenv("EMULATOR_AIRTIME", "0.04")),
+            remote_rate=float(os.getenv("EMULATOR_REMOTE_RATE", "0")),
+            remote_senders=senders.split(",") if senders else None,
+            remote_repeats=int(os.getenv("EMULATOR_REMOTE_REPEATS", "3")),
+            noise=float(os.getenv("EMULATOR_NOISE", "0")),
+        )
+
+    @property
+    def port(self) -> str:
+        if self._slave is None:
+            raise RuntimeError("Emulator not started")
+        return os.ttyname(self._slave)
+
+    def start(self) -> str:
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        for target in (self._read_loop, self._transmit_loop):
+            threading.Thread(target=target, daemon=True).start()
+        if self.remote_rate > 0:
+            threading.Thread(target=self._remote_loop, daemon=True).start()
+        print(f"[EMULATOR] Stick emulator listening on {self.port}")
+        return self.port
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._tx_queue.put(None)
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self._master = self._slave = None
+
+    def write_line(self, line: bytes) -> None:
+        if self._master is None:
+            return
+        with self._write_lock:
+            try:
+                os.write(self._master, line + b"\r\n")
+            except OSError:
+                pass
+
+    def inject(self, frame: bytes) -> None:
+        """Emit a received radio frame as the stick would."""
+        if self.on_frame:
+            self.on_frame(frame, time.monotonic())
+        self.write_line(frame)
+        self.frames_sent += 1
+
+    def make_frame(
+        self,
+        sender_id: str,
+        enumerator: int,
+        command: Command,
+        signal_strength: int = 0xCB,
+    ) -> bytes:
+        counter = self._counters.get(sender_id, 0)
+        self._counters[sender_id] = (counter + 1) & 0xFFFF
+        return (
+            f"ss{enumerator:02X}{sender_id}{command.value:02X}"
+            f"{counter:04X}{counter & 0xFF:02X}{signal_strength:02X}"
+        ).encode("ascii")
+
+    def _read_loop(self) -> None:
+        buffer = b""
+        while not self._stop.is_set() and self._master is not None:
+            try:
+                chunk = os.read(self._master, 1024)
+            except OSError:
+                return
+            if not chunk:
+                return
+            buffer += chunk
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                self._handle_line(line.strip())
+
+    def _handle_line(self, line: bytes) -> None:
+        if not line or line == b"hello":
+            return
+        if line == b"!?":
+            self.write_line(FIRMWARE_VERSION)
+        elif line == b"sr":
+            self.write_line(b"sr" + self.device_id.encode("ascii"))
+        elif line.startswith(b"ss") and len(line) == 11:
+            if self.on_transmit:
+                self.on_transmit(line, time.monotonic())
+            self._tx_queue.put(line)
+        else:
+            print(f"[EMULATOR] Unknown command {line!r}")
+
+    def _transmit_loop(self) -> None:
+        while (line := self._tx_queue.get()) is not None:
+            repeats = int(line[4:5], 16) + 1
+            self.write_line(b"t1")
+            time.sleep(self.airtime * repeats)
+            self.write_line(b"t0")
+            self.transmissions += 1
+
+    def _remote_loop(self) -> None:
+        while not self._stop.wait(self.random.expovariate(self.remote_rate)):
+            frame = self.make_frame(
+                self.random.choice(self.remote_senders),
+                self.random.randrange(0x100),
+                self.random.choice(REMOTE_COMMANDS),
+                self.random.randrange(0x80, 0x100),
+            )
+            for _ in range(self.remote_repeats):
+                if self.random.random() < self.noise:
+                    self.write_line(self._garble(frame))
+                else:
+                    self.inject(frame)
+                time.sleep(self.airtime)
+
+    def _garble(self, frame: bytes) -> bytes:
+        if self.random.random() < 0.5:
+            return frame[: self.random.randrange(len(frame))]
+        position = self.random.randrange(len(frame))
+        return (
+            frame[:position]
+            + bytes([self.random.randrange(0x21, 0x7F)])
+            + frame[position + 1:]
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--device-id", default="ABCDEF")
+    parser.add_argument("--airtime", type=float, default=0.04)
+    parser.add_argument(
+        "--rate", type=float, default=0.0, help="remote frames per second"
+    )
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--noise", type=float, default=0.0)
+    parser.add_argument("--senders", default=None)
+    args = parser.parse_args()
+    emulator = StickEmulator(
+        device_id=args.device_id,
+        airtime=args.airtime,
+        remote_rate=args.rate,
+        remote_senders=args.senders.split(",") if args.senders else None,
+        remote_repeats=args.repeats,
+        noise=args.noise,
+    )
+    port = emulator.start()
+    print(f"Run the API with SERIAL={port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import time
+
+from schellenberghack.commands import Command
+from schellenberghack.message import SchellenbergMessageReceived
+from schellenberghack.storage import EventRow, SqliteStore
+
+DEFAULT_RETENTION_DAYS = float(os.getenv("EVENT_RETENTION_DAYS", "30"))
+FLUSH_INTERVAL = 1.0
+PRUNE_INTERVAL = 3600.0
+
+
+class EventLog:
+    """
+    Durable log of decoded frames in the SQLite store, which survives
+    restarts unlike ``EventHistory``. Frames are buffered and written in
+    batches from a worker thread, so the event loop never waits for the
+    disk. Events older than the retention are pruned hourly.
+    """
+
+    def __init__(
+        self,
+        store: SqliteStore,
+        retention_days: float = DEFAULT_RETENTION_DAYS,
+    ):
+        self.store = store
+        self.retention = retention_days * 86400
+        self.task: asyncio.Task | None = None
+        self._pending: list[EventRow] = []
+
+    def record(self, message: SchellenbergMessageReceived) -> None:
+        self._pending.append((
+            time.time(),
+            message.sender.key,
+            int(message.receiver, 16),
+            message.command.value,
+            message.counter,
+            message.local_counter,
+            message.signal_strength,
+        ))
+
+    def flush(self) -> None:
+        """Write the buffered events, from any thread."""
+        rows, self._pending = self._pending, []
+        if rows:
+            self.store.append_events(rows)
+
+    def prune(self) -> int:
+        removed = self.store.prune_events(time.time() - self.retention)
+        if removed:
+            print(f"[EVENTLOG] Pruned {removed} events")
+        return removed
+
+    async def _run(self):
+        last_prune = 0.0
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await asyncio.to_thread(self.flush)
+                if time.monotonic() - last_prune >= PRUNE_INTERVAL:
+                    last_prune = time.monotonic()
+                    await asyncio.to_thread(self.prune)
+            except Exception as e:
+                print(f"[EVENTLOG] Error writing events: {e}")
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+        print(f"[EVENTLOG] Logging events to {self.store.path}")
+
+    async def exit(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        await asyncio.to_thread(self.flush)
+
+    def query(
+        self,
+        sender: str | None = None,
+        receiver: str | None = None,
+        command: Command | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        limit: int = 100,
+    ) -> list[dict[str, object]]:
+        """Like ``EventHistory.query()``, over the whole retention."""
+        self.flush()
+        rows = self.store.query_events(
+            sender=int(sender, 16) if sender is not None else None,
+            receiver=int(receiver, 16) if receiver is not None else None,
+            command=command.value if command is not None else None,
+            since=since,
+            until=until,
+            limit=limit,
+        )
+        return [
+            {
+                "seq": seq,
+                "timestamp": timestamp,
+                "sender": f"{sender_id:06X}",
+                "receiver": f"{receiver_id:02X}",
+                "command": Command.from_code(command_code).name,
+                "counter": counter,
+                "local_counter": local_counter,
+                "signal_strength": signal_strength,
+            }
+            for (seq, timestamp, sender_id, receiver_id, command_code,
+                 counter, local_counter, signal_strength) in rows
+        ]
@@ -0,0 +1,142 @@
+import os
+import time
+from array import array
+from typing import Iterator
+
+from schellenberghack.commands import Command
+from schellenberghack.message import SchellenbergMessageReceived
+
+DEFAULT_HISTORY_SIZE = int(os.getenv("HISTORY_SIZE", "10000"))
+
+
+class EventHistory:
+    """
+    Fixed-size ring buffer of recently decoded frames.
+
+    Every field lives in its own typed ``array`` so an event costs 26 bytes
+    no matter how busy the band is. Events are addressed by a sequence
+    number; ``seq % capacity`` is the slot. Per-sender lookups follow
+    ``_previous``, which links every slot to the previous event of the same
+    sender, so filtered queries only touch matching events.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_HISTORY_SIZE):
+        if capacity <= 0:
+            raise ValueError("History capacity must be positive")
+        self.capacity = capacity
+        self._timestamps = array("d", bytes(8 * capacity))
+        self._senders = array("I", bytes(4 * capacity))
+        self._receivers = array("B", bytes(capacity))
+        self._commands = array("B", bytes(capacity))
+        self._counters = array("H", bytes(2 * capacity))
+        self._local_counters = array("B", bytes(capacity))
+        self._signals = array("B", bytes(capacity))
+        self._previous = array("q", bytes(8 * capacity))
+        # sender id -> seq of its newest event still in the ring
+        self._latest: dict[int, int] = {}
+        self._next_seq = 0
+
+    def __len__(self) -> int:
+        return min(self._next_seq, self.capacity)
+
+    @property
+    def oldest_seq(self) -> int:
+        return max(0, self._next_seq - self.capacity)
+
+    @property
+    def last_seq(self) -> int:
+        return self._next_seq - 1
+
+    def append(
+        self,
+        sender: int,
+        receiver: int,
+        command: int,
+        counter: int,
+        local_counter: int,
+        signal_strength: int,
+        timestamp: float | None = None,
+    ) -> int:
+        seq = self._next_seq
+        slot = seq % self.capacity
+        if seq >= self.capacity:
+            evicted = self._senders[slot]
+            if self._latest.get(evicted) == seq - self.capacity:
+                del self._latest[evicted]
+        self._timestamps[slot] = time.time() if timestamp is None \
+            else timestamp
+        self._senders[slot] = sender
+        self._receivers[slot] = receiver
+        self._commands[slot] = command
+        self._counters[slot] = counter
+        self._local_counters[slot] = local_counter
+        self._signals[slot] = signal_strength
+        self._previous[slot] = self._latest.get(sender, -1)
+        self._latest[sender] = seq
+        self._next_seq = seq + 1
+        return seq
+
+    def record(self, message: SchellenbergMessageReceived) -> int:
+        return self.append(
+            message.sender.key,
+            int(message.receiver, 16),
+            message.command.value,
+            message.counter,
+            message.local_counter,
+            message.signal_strength,
+        )
+
+    def _candidates(self, sender: int | None) -> Iterator[int]:
+        """Sequence numbers newest first, restricted to ``sender``."""
+        oldest = self.oldest_seq
+        if sender is None:
+            yield from range(self._next_seq - 1, oldest - 1, -1)
+            return
+        seq = self._latest.get(sender, -1)
+        while seq >= oldest:
+            yield seq
+            seq = self._previous[seq % self.capacity]
+
+    def event(self, seq: int) -> dict[str, object]:
+        slot = seq % self.capacity
+        return {
+            "seq": seq,
+            "timestamp": self._timestamps[slot],
+            "sender": f"{self._senders[slot]:06X}",
+            "receiver": f"{self._receivers[slot]:02X}",
+            "command": Command.from_code(self._commands[slot]).name,
+            "counter": self._counters[slot],
+            "local_counter": self._local_counters[slot],
+            "signal_strength": self._signals[slot],
+        }
+
+    def query(
+        self,
+        sender: str | None = None,
+        receiver: str | None = None,
+        command: Command | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        limit: int = 100,
+    ) -> list[dict[str, object]]:
+        """Newest ``limit`` matching events, returned oldest first."""
+        sender_id = int(sender, 16) if sender is not None else None
+        receiver_id = int(receiver, 16) if receiver is not None else None
+        matches: list[int] = []
+        for seq in self._candidates(sender_id):
+            if len(matches) >= limit:
+                break
+            slot = seq % self.capacity
+            timestamp = self._timestamps[slot]
+            # Wall-clock time can step back, so only seq orders the events
+            if since is not None and timestamp < since:
+                continue
+            if until is not None and timestamp > until:
+                continue
+            if receiver_id is not None \
+                    and self._receivers[slot] != receiver_id:
+                continue
+            if command is not None and self._commands[slot] != command.value:
+                continue
+            matches.append(seq)
+        return [self.event(seq) for seq in reversed(matches)]
@@ -2,19 +2,85 @@ import asyncio
 import json
 import os
 import re
+import time
 from asyncio import Event, Queue
-from typing import Any
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, NamedTuple
 
 import aiomqtt
-from schellenberghack import SETTINGS
+from schellenberghack.settings import get_settings, settings_path
 from schellenberghack.commands import Command
-from schellenberghack.devices import Device, SenderDevice
+from schellenberghack.devices import DeviceRecord, SenderRecord
 from schellenberghack.message import (
+    HANDLE_POSITIONS,
     DeviceState,
+    HandlePosition,
     OutgoingSchellenbergMessage,
     SchellenbergMessageReceived,
 )
 
+from .linkstats import LinkStats
+from .runtime import dumps
+
+# Publish only the last state of a burst within this window (0 disables)
+STATE_COALESCE_WINDOW = (
+    float(os.getenv("MQTT_STATE_COALESCE_MS", "200")) / 1000
+)
+
+
+# "entity": one cover config per device (default)
+# "device": one device config per device bundling the cover, link sensors
+#           and device triggers for remote button presses
+DISCOVERY_MODE = os.getenv("HA_DISCOVERY_MODE", "entity").lower()
+
+
+def migration_file_path() -> Path:
+    """Devices moved to device discovery, kept next to the settings."""
+    return settings_path().with_name("discovery_migrated.json")
+
+
+# Remote commands exposed as device triggers: (type, subtype) per command
+REMOTE_TRIGGERS = {
+    Command.UP: ("button_short_press", "open"),
+    Command.DOWN: ("button_short_press", "close"),
+    Command.STOP: ("button_short_press", "stop"),
+    Command.MANUAL_UP: ("button_long_press", "open"),
+    Command.MANUAL_DOWN: ("button_long_press", "close"),
+}
+
+
+class TopicOptions(NamedTuple):
+    qos: int
+    retain: bool
+
+
+# Default (qos, retain) per topic class; triggers must never be retained
+TOPIC_DEFAULTS = {
+    "availability": (1, True),
+    "discovery": (1, True),
+    "state": (1, True),
+    "telemetry": (0, True),
+    "trigger": (1, False),
+}
+
+
+def topic_options_from_env() -> dict[str, TopicOptions]:
+    """
+    QoS and retain per topic class, overridable with e.g.
+    ``MQTT_STATE_QOS=0`` and ``MQTT_STATE_RETAIN=false``.
+    """
+    options = {}
+    for topic_class, (qos, retain) in TOPIC_DEFAULTS.items():
+        prefix = f"MQTT_{topic_class.upper()}_"
+        retain_env = os.getenv(f"{prefix}RETAIN")
+        if retain_env is not None:
+            retain = retain_env.lower() in ("true", "1", "yes")
+        options[topic_class] = TopicOptions(
+            int(os.getenv(f"{prefix}QOS", str(qos))), retain
+        )
+    return options
+
 
 class HomeAssistantWorker:
     """
@@ -29,6 +95,11 @@ class HomeAssistantWorker:
         mqtt_port: int = 1883,
         mqtt_user: str | None = None,
         mqtt_password: str | None = None,
+        topic_options: dict[str, TopicOptions] | None = None,
+        coalesce_window: float = STATE_COALESCE_WINDOW,
+        discovery_mode: str = DISCOVERY_MODE,
+        link_stats: LinkStats | None = None,
+        migration_file: Path | None = None,
     ):
         self.mqtt_host = mqtt_host
         self.mqtt_port = mqtt_port
@@ -40,7 +111,79 @@ class HomeAssistantWorker:
         self.send_queue: Queue[OutgoingSchellenbergMessage] = Queue()
         # Map device_name (slug) to list of (sender_id, enumerator) tuples
         self.device_mapping: dict[str, list[tuple[str, str]]] = {}
+        # And back, for received frames
+        self._device_names: dict[tuple[str, str], str] = {}
         self.device_states: dict[str, DeviceState] = {}
+        # Called with (device_name, state, [(sender_id, enumerator)])
+        self.state_listeners: list[
+            Callable[[str, DeviceState, list[tuple[str, str]]], None]
+        ] = []
+        self.topic_options = topic_options or topic_options_from_env()
+        self.coalesce_window = coalesce_window
+        # Last payload published per topic in this MQTT session
+        self._published: dict[str, str] = {}
+        # States waiting for the end of the coalescing window, and when
+        # each device's state was last sent (loop time)
+        self._pending_states: dict[str, DeviceState] = {}
+        self._state_sent_at: dict[str, float] = {}
+        self._flush_task: asyncio.Task | None = None
+        self.publish_stats = {"published": 0, "coalesced": 0, "unchanged": 0}
+        if discovery_mode not in ("entity", "device"):
+            print(f"[MQTT] Unknown discovery mode {discovery_mode!r}, "
+                  "using 'entity'")
+            discovery_mode = "entity"
+        self.discovery_mode = discovery_mode
+        # Feeds the packet loss sensor in device discovery mode
+        self.link_stats = link_stats
+        # Devices whose per-entity cover config was moved to a device
+        # config, kept in ``migration_file`` so each is migrated once
+        self.migration_file = migration_file
+        self._migrated: set[str] = set()
+        self._migrated_dirty = False
+        self._migrated_task: asyncio.Task | None = None
+        if migration_file:
+            self._load_migrated()
+        # When link telemetry was last sent per device (loop time), and
+        # the last remote counter per (sender key, enumerator): a press
+        # is repeated in several frames but is a single trigger
+        self._link_sent_at: dict[str, float] = {}
+        self._trigger_counters: dict[tuple[int, str], int] = {}
+        # Window handle sensors seen in this run: entity name per sender
+        # key, and the last position of each
+        self.handles: dict[int, str] = {}
+        self.handle_positions: dict[str, HandlePosition] = {}
+
+    def _load_migrated(self):
+        try:
+            names = json.loads(self.migration_file.read_text())
+        except (OSError, ValueError):
+            return
+        if isinstance(names, list):
+            self._migrated.update(str(name) for name in names)
+
+    def _write_migrated(self, text: str) -> None:
+        tmp = self.migration_file.with_name(
+            f"{self.migration_file.name}.tmp"
+        )
+        tmp.write_text(text)
+        os.replace(tmp, self.migration_file)
+
+    async def _save_migrated(self):
+        # One write for a whole discovery round
+        while self._migrated_dirty:
+            self._migrated_dirty = False
+            text = json.dumps(sorted(self._migrated))
+            try:
+                await asyncio.to_thread(self._write_migrated, text)
+            except OSError as e:
+                print(f"[MQTT] Error saving discovery migrations: {e}")
+                break
+        self._migrated_task = None
+
+    def _migrated_changed(self):
+        self._migrated_dirty = True
+        if self.migration_file and self._migrated_task is None:
+            self._migrated_task = asyncio.create_task(self._save_migrated())
 
     def _get_discovery_prefix(self) -> str:
         """Get the Home Assistant discovery prefix."""
@@ -55,36 +198,95 @@ class HomeAssistantWorker:
         slug = slug.strip("-")
         return slug or "unnamed-device"
 
-    def _get_device_name(self, device: Device) -> str:
+    def _get_device_name(self, device: DeviceRecord) -> str:
         if device.name:
             return self._make_slug(device.name)
         return f"device-{device.enumerator}"
 
-    def _get_unique_id(self, sender_id: str, enumerator: str) -> str:
-        return f"schellenberg_{sender_id}_{enumerator}"
+    async def _publish(self, topic_class: str, topic: str, payload: str):
+        if not self.client:
+            return
+        qos, retain = self.topic_options[topic_class]
+        await self.client.publish(
+            topic, payload=payload, qos=qos, retain=retain
+        )
 
-    async def publish_discovery_config(
-        self, sender: SenderDevice, device_name: str
+    async def _publish_states(
+        self, states: dict[str, DeviceState | HandlePosition]
     ):
-        """Publish MQTT autodiscovery config for a single device."""
-        if not self.client:
+        """Publish the states that differ from the last published."""
+        publishes = []
+        for name, state in states.items():
+            topic = f"schellenberg/{name}/state"
+            if self._published.get(topic) == state.value:
+                self.publish_stats["unchanged"] += 1
+                continue
+            self._published[topic] = state.value
+            publishes.append(self._publish("state", topic, state.value))
+        self.publish_stats["published"] += len(publishes)
+        await asyncio.gather(*publishes)
+
+    async def _flush_states_later(self):
+        await asyncio.sleep(self.coalesce_window)
+        self._flush_task = None
+        pending, self._pending_states = self._pending_states, {}
+        now = asyncio.get_running_loop().time()
+        self._state_sent_at.update(dict.fromkeys(pending, now))
+        try:
+            await self._publish_states(pending)
+        except aiomqtt.MqttError as e:
+            # Republished by publish_states() on the next connect
+            print(f"[MQTT] Error publishing states: {e}")
+
+    async def _queue_state(self, device_name: str, state: DeviceState):
+        """
+        Publish a state change right away, unless one for this device went
+        out within the coalescing window: then only the last state of the
+        burst is published when the window ends.
+        """
+        now = asyncio.get_running_loop().time()
+        last = self._state_sent_at.get(device_name)
+        if device_name not in self._pending_states and (
+            last is None or now - last >= self.coalesce_window
+        ):
+            self._state_sent_at[device_name] = now
+            await self._publish_states({device_name: state})
             return
+        if device_name in self._pending_states:
+            self.publish_stats["coalesced"] += 1
+        self._pending_states[device_name] = state
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(
+                self._flush_states_later()
+            )
 
-        discovery_topic = (
-            f"{self._get_discovery_prefix()}/cover/{device_name}/config"
-        )
+    def _notify_state(self, device_name: str, state: DeviceState):
+        devices = self.device_mapping.get(device_name, [])
+        for listener in self.state_listeners:
+            listener(device_name, state, devices)
 
-        # Command and state topics
-        command_topic = f"schellenberg/{device_name}/set"
-        state_topic = f"schellenberg/{device_name}/state"
-        availability_topic = "schellenberg/availability"
+    def _get_unique_id(self, sender_id: str, enumerator: str) -> str:
+        return f"schellenberg_{sender_id}_{enumerator}"
 
-        config: dict[str, Any] = {
+    def _device_info(
+        self, sender: SenderRecord, device_name: str
+    ) -> dict[str, Any]:
+        return {
+            "identifiers": [device_name],
+            "name": device_name,
+            "manufacturer": "Schellenberg",
+            "model": "Cover Device",
+            "sw_version": "1.0.0",
+            "via_device": f"schellenberg_usb_{sender.device_id}",
+        }
+
+    def _cover_config(self, device_name: str) -> dict[str, Any]:
+        return {
             "name": device_name,
             "unique_id": device_name,
-            "command_topic": command_topic,
-            "state_topic": state_topic,
-            "availability_topic": availability_topic,
+            "command_topic": f"schellenberg/{device_name}/set",
+            "state_topic": f"schellenberg/{device_name}/state",
+            "availability_topic": "schellenberg/availability",
             "payload_open": "OPEN",
             "payload_close": "CLOSE",
             "payload_stop": "STOP",
@@ -95,59 +297,217 @@ class HomeAssistantWorker:
             "state_stopped": "stopped",
             "state_unknown": "unknown",
             "optimistic": False,
-            "device": {
-                "identifiers": [device_name],
-                "name": device_name,
-                "manufacturer": "Schellenberg",
-                "model": "Cover Device",
-                "sw_version": "1.0.0",
-                "via_device": f"schellenberg_usb_{sender.device_id}",
+        }
+
+    def _device_bundle(
+        self, sender: SenderRecord, device_name: str
+    ) -> dict[str, Any]:
+        """Device discovery payload: cover, link sensors and triggers."""
+        cover = self._cover_config(device_name)
+        # The cover is the device's main entity and takes its name
+        cover["name"] = None
+        components: dict[str, Any] = {
+            "cover": {"platform": "cover", **cover},
+            **self._link_components(device_name),
+        }
+        for command, (trigger_type, subtype) in REMOTE_TRIGGERS.items():
+            components[f"remote_{command.name.lower()}"] = {
+                "platform": "device_automation",
+                "automation_type": "trigger",
+                "topic": f"schellenberg/{device_name}/remote",
+                "type": trigger_type,
+                "subtype": subtype,
+                "payload": command.name,
+            }
+        return {
+            "device": self._device_info(sender, device_name),
+            "origin": {"name": "schellenberg-usb-hack"},
+            "availability_topic": "schellenberg/availability",
+            "components": components,
+        }
+
+    def _link_components(self, device_name: str) -> dict[str, Any]:
+        return {
+            "signal_strength": {
+                "platform": "sensor",
+                "name": "Signal strength",
+                "unique_id": f"{device_name}_signal_strength",
+                "state_topic": f"schellenberg/{device_name}/signal_strength",
+                "state_class": "measurement",
+                "entity_category": "diagnostic",
+                "icon": "mdi:signal",
+            },
+            "last_seen": {
+                "platform": "sensor",
+                "name": "Last seen",
+                "unique_id": f"{device_name}_last_seen",
+                "state_topic": f"schellenberg/{device_name}/last_seen",
+                "device_class": "timestamp",
+                "entity_category": "diagnostic",
+            },
+            "packet_loss": {
+                "platform": "sensor",
+                "name": "Packet loss",
+                "unique_id": f"{device_name}_packet_loss",
+                "state_topic": f"schellenberg/{device_name}/packet_loss",
+                "unit_of_measurement": "%",
+                "state_class": "measurement",
+                "entity_category": "diagnostic",
+                "icon": "mdi:signal-off",
             },
         }
 
-        await self.client.publish(
-            discovery_topic,
-            payload=json.dumps(config),
-            qos=1,
-            retain=True,
-        )
-        self.device_states[device_name] = DeviceState.UNKNOWN
+    async def publish_discovery_config(
+        self, sender: SenderRecord, device_name: str
+    ):
+        """Publish MQTT autodiscovery config for a single device."""
+        if not self.client:
+            return
+
+        prefix = self._get_discovery_prefix()
+        cover_topic = f"{prefix}/cover/{device_name}/config"
+        if self.discovery_mode == "device":
+            migrate = device_name not in self._migrated
+            if migrate:
+                # Hand the existing cover entity over to the device config
+                await self._publish(
+                    "discovery", cover_topic,
+                    dumps({"migrate_discovery": True}),
+                )
+            await self._publish(
+                "discovery",
+                f"{prefix}/device/{device_name}/config",
+                dumps(self._device_bundle(sender, device_name)),
+            )
+            if migrate:
+                await self._publish("discovery", cover_topic, "")
+                self._migrated.add(device_name)
+                self._migrated_changed()
+        else:
+            if device_name in self._migrated:
+                # Back to entity mode, migrate again on the next switch
+                self._migrated.discard(device_name)
+                self._migrated_changed()
+            config = self._cover_config(device_name)
+            config["device"] = self._device_info(sender, device_name)
+            await self._publish("discovery", cover_topic, dumps(config))
+        # Keep a restored or earlier state across reconnects
+        self.device_states.setdefault(device_name, DeviceState.UNKNOWN)
 
         print(f"[MQTT] Published discovery config for {device_name}")
 
+    def _handle_name(self, sender: SenderRecord) -> str:
+        # Suffixed so a handle and a cover with the same name do not share
+        # topics, link sensors or cached publishes
+        if sender.name:
+            return f"{self._make_slug(sender.name)}-handle"
+        return f"window-handle-{sender.device_id.lower()}"
+
+    async def publish_handle_discovery_config(self, key: int, name: str):
+        """Publish MQTT autodiscovery config for a window handle sensor."""
+        if not self.client:
+            return
+
+        device_id = f"{key:06X}"
+        self_sender_id = get_settings().snapshot().self_sender_id
+        device = {
+            "identifiers": [f"schellenberg_handle_{device_id}"],
+            "name": name,
+            "manufacturer": "Schellenberg",
+            "model": "Window Handle",
+        }
+        if self_sender_id:
+            device["via_device"] = f"schellenberg_usb_{self_sender_id}"
+        sensor: dict[str, Any] = {
+            "name": None,
+            "unique_id": f"schellenberg_handle_{device_id}",
+            "state_topic": f"schellenberg/{name}/state",
+            "availability_topic": "schellenberg/availability",
+            "device_class": "enum",
+            "options": [position.value for position in HandlePosition],
+            "icon": "mdi:window-closed-variant",
+        }
+
+        prefix = self._get_discovery_prefix()
+        if self.discovery_mode == "device":
+            sensor.pop("availability_topic")
+            config = {
+                "device": device,
+                "origin": {"name": "schellenberg-usb-hack"},
+                "availability_topic": "schellenberg/availability",
+                "components": {
+                    "position": {"platform": "sensor", **sensor},
+                    **self._link_components(name),
+                },
+            }
+            topic = f"{prefix}/device/{name}/config"
+        else:
+            config = {**sensor, "device": device}
+            topic = f"{prefix}/sensor/{name}/config"
+        await self._publish("discovery", topic, dumps(config))
+
+        print(f"[MQTT] Published discovery config for window handle {name}")
+
     async def publish_all_discovery_configs(self):
         """Publish discovery configs for all paired devices."""
-        if not SETTINGS.self_sender:
+        self.update_device_mapping()
+        self_sender = get_settings().self_sender
+        if not self_sender:
             print("[MQTT] No self sender configured, skipping discovery")
             return
 
-        for device in SETTINGS.self_sender.connected_devices:
-            await self.publish_discovery_config(
-                SETTINGS.self_sender,
-                self._get_device_name(device)
-            )
+        # Pipelined, so a reconnect costs one round-trip, not one per device
+        await asyncio.gather(
+            *(
+                self.publish_discovery_config(
+                    self_sender, self._get_device_name(device)
+                )
+                for device in self_sender.connected_devices
+            ),
+            *(
+                self.publish_handle_discovery_config(key, name)
+                for key, name in self.handles.items()
+            ),
+        )
 
         print(
             f"[MQTT] Published "
-            f"{len(SETTINGS.self_sender.connected_devices)} devices"
+            f"{len(self_sender.connected_devices)} devices"
         )
 
-    def _update_device_mapping(self):
+    async def publish_states(self):
+        """Republish all known states in one batch, for a new session."""
+        if not self.client:
+            return
+        # The broker may have lost what we published before
+        self._published.clear()
+        self._pending_states.clear()
+        states: dict[str, DeviceState | HandlePosition] = {
+            name: state for name, state in self.device_states.items()
+            if state != DeviceState.UNKNOWN
+        }
+        states.update(self.handle_positions)
+        await self._publish_states(states)
+        print(f"[MQTT] Republished {len(states)} device states")
+
+    def update_device_mapping(self):
+        """Rebuild the device name <-> (sender_id, enumerator) mapping."""
         self.device_mapping.clear()
-        for sender in SETTINGS.senders:
+        self._device_names.clear()
+        for sender in get_settings().snapshot().senders:
             for device in sender.connected_devices:
                 device_name = self._get_device_name(device)
                 if device_name not in self.device_mapping:
                     self.device_mapping[device_name] = []
-                self.device_mapping[device_name].append(
-                    (sender.device_id, device.enumerator)
-                )
+                device_tuple = (sender.device_id, device.enumerator)
+                self.device_mapping[device_name].append(device_tuple)
+                self._device_names[device_tuple] = device_name
 
     async def _handle_command(self, message: aiomqtt.Message):
         """Handle incoming MQTT commands."""
         if not self.client:
             raise RuntimeError("[HANDLE_COMMAND] MQTT client not initialized")
-        self._update_device_mapping()
+        self.update_device_mapping()
 
         try:
             topic = str(message.topic)
@@ -181,7 +541,6 @@ class HomeAssistantWorker:
 
             new_state: DeviceState = DeviceState.UNKNOWN
 
-            state_topic = f"schellenberg/{device_name}/state"
             if payload == "OPEN":
                 new_state = DeviceState.OPENING
             elif payload == "CLOSE":
@@ -189,14 +548,13 @@ class HomeAssistantWorker:
             elif payload == "STOP":
                 new_state = DeviceState.STOPPED
 
-            await self.client.publish(topic=state_topic,
-                                      payload=new_state.value,
-                                      qos=1, retain=True)
             self.device_states[device_name] = new_state
+            self._notify_state(device_name, new_state)
+            await self._queue_state(device_name, new_state)
 
+            self_sender = get_settings().self_sender
             for sender_id, enumerator in devices:
-                if not SETTINGS.self_sender \
-                        or SETTINGS.self_sender.device_id != sender_id:
+                if not self_sender or self_sender.device_id != sender_id:
                     continue
 
                 def state_callback(state: DeviceState):
@@ -223,30 +581,19 @@ class HomeAssistantWorker:
             raise RuntimeError("[UPDATE_DEVICE_STATE] MQTT "
                                "client not initialized")
 
-        state_topic = f"schellenberg/{device_name}/state"
-
-        await self.client.publish(
-            state_topic, payload=state.value, qos=1, retain=True
-        )
         self.device_states[device_name] = state
+        self._notify_state(device_name, state)
+        await self._queue_state(device_name, state)
         print(f"[MQTT] Updated {device_name} state to {state}")
 
     async def _extract_device_state(
-        self, message: SchellenbergMessageReceived
+        self, device_name: str, message: SchellenbergMessageReceived
     ):
         """Update device state based on received messages."""
         if not self.client:
             raise RuntimeError("[UPDATE_DEVICE_STATE] MQTT "
                                "client not initialized")
 
-        device_tuple = (message.sender.device_id, message.receiver)
-        device_name = next((name for name, devices
-                            in self.device_mapping.items()
-                            if device_tuple in devices
-                            ), None)
-        if not device_name:
-            return
-
         if message.command in [Command.UP, Command.MANUAL_UP]:
             state = DeviceState.OPENING
         elif message.command in [Command.DOWN, Command.MANUAL_DOWN]:
@@ -260,12 +607,83 @@ class HomeAssistantWorker:
             self.device_states[device_name] = state
             await self.update_device_state(device_name, state)
 
+    async def _update_handle(self, message: SchellenbergMessageReceived):
+        """
+        Publish a window handle position as soon as it changes. The sensor
+        repeats every report in several frames; only the first gets past
+        the last-value check.
+        """
+        position = HANDLE_POSITIONS[message.command]
+        name = self.handles.get(message.sender.key)
+        if name is not None and self.handle_positions.get(name) is position:
+            return
+        if name is None:
+            # Still quarantined, not ours to show yet
+            if message.sender.key not in get_settings().snapshot().by_key:
+                return
+            name = self._handle_name(message.sender)
+            self.handles[message.sender.key] = name
+            await self.publish_handle_discovery_config(
+                message.sender.key, name
+            )
+        self.handle_positions[name] = position
+        await self._publish_states({name: position})
+        if self.discovery_mode == "device":
+            await self._publish_link(name, message)
+        print(f"[MQTT] Window handle {name} is {position.value}")
+
+    async def _publish_link(
+        self, device_name: str, message: SchellenbergMessageReceived
+    ):
+        """
+        Publish signal strength and last seen for the device's sensors, at
+        most once per coalescing window, and remote presses as triggers.
+        """
+        publishes = []
+        now = asyncio.get_running_loop().time()
+        last = self._link_sent_at.get(device_name)
+        if last is None or now - last >= self.coalesce_window:
+            self._link_sent_at[device_name] = now
+            last_seen = datetime.fromtimestamp(time.time(), timezone.utc)
+            link = [
+                ("signal_strength", str(message.signal_strength)),
+                ("last_seen", last_seen.isoformat(timespec="seconds")),
+            ]
+            missed_rate = (
+                self.link_stats.missed_rate(message.sender.key)
+                if self.link_stats else None
+            )
+            if missed_rate is not None:
+                link.append(("packet_loss", f"{missed_rate * 100:.1f}"))
+            for topic, payload in link:
+                topic = f"schellenberg/{device_name}/{topic}"
+                if self._published.get(topic) == payload:
+                    continue
+                self._published[topic] = payload
+                publishes.append(self._publish("telemetry", topic, payload))
+
+        # Frames we sent ourselves are not button presses
+        self_sender_key = get_settings().snapshot().self_sender_key
+        if (message.command in REMOTE_TRIGGERS
+                and message.sender.key != self_sender_key):
+            remote = (message.sender.key, message.receiver)
+            if self._trigger_counters.get(remote) != message.counter:
+                self._trigger_counters[remote] = message.counter
+                publishes.append(self._publish(
+                    "trigger", f"schellenberg/{device_name}/remote",
+                    message.command.name,
+                ))
+
+        self.publish_stats["published"] += len(publishes)
+        await asyncio.gather(*publishes)
+
     async def _mqtt_loop(self):
         """Main MQTT event loop."""
+        availability = self.topic_options["availability"]
         will = aiomqtt.Will("schellenberg/availability",
                             payload="offline",
-                            qos=1,
-                            retain=True)
+                            qos=availability.qos,
+                            retain=availability.retain)
         while not self.exit_event.is_set():
             try:
                 async with aiomqtt.Client(
@@ -276,15 +694,15 @@ class HomeAssistantWorker:
                         will=will
                         ) as client:
                     self.client = client
+                    # Discovery and state batches are pipelined on purpose
+                    client.pending_calls_threshold = 1024
 
-                    await client.publish(
-                        "schellenberg/availability",
-                        payload="online",
-                        qos=1,
-                        retain=True,
+                    await self._publish(
+                        "availability", "schellenberg/availability", "online"
                     )
 
                     await self.publish_all_discovery_configs()
+                    await self.publish_states()
                     await client.subscribe("schellenberg/+/set")
                     print("[MQTT] Subscribed to command topics")
 
@@ -311,14 +729,23 @@ class HomeAssistantWorker:
         """Stop the Home Assistant worker."""
         self.exit_event.set()
 
+        # Publish what is still waiting in the coalescing window
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+            self._flush_task = None
+            pending, self._pending_states = self._pending_states, {}
+            try:
+                await self._publish_states(pending)
+            except Exception:
+                pass
+        if self._migrated_task:
+            await self._migrated_task
+
         # Publish offline status
         if self.client:
             try:
-                await self.client.publish(
-                    "schellenberg/availability",
-                    payload="offline",
-                    qos=1,
-                    retain=True,
+                await self._publish(
+                    "availability", "schellenberg/availability", "offline"
                 )
             except Exception:
                 pass
@@ -334,7 +761,17 @@ class HomeAssistantWorker:
         self, message: SchellenbergMessageReceived
     ):
         """Handle a message received from the Schellenberg device."""
-        await self._extract_device_state(message)
+        if message.command in HANDLE_POSITIONS:
+            await self._update_handle(message)
+            return
+        device_name = self._device_names.get(
+            (message.sender.device_id, message.receiver)
+        )
+        if not device_name:
+            return
+        if self.discovery_mode == "device" and self.client:
+            await self._publish_link(device_name, message)
+        await self._extract_device_state(device_name, message)
 
     def get_send_queue(self) -> Queue[OutgoingSchellenbergMessage]:
         """Get the queue for sending commands to devices."""
@@ -0,0 +1,136 @@
+import os
+import time
+
+from schellenberghack.message import SchellenbergMessageReceived
+
+DEFAULT_MAX_LINKS = int(os.getenv("LINK_STATS_SIZE", "1024"))
+# Larger counter jumps are a reset or a replay rather than lost presses
+MAX_GAP = 64
+# Weight of a new frame in the smoothed signal strength
+SIGNAL_SMOOTHING = 0.125
+
+
+class _Sequence:
+    """Counter sequence of one sender: presses heard and presses missed."""
+
+    __slots__ = ("counter", "presses", "missed", "resets")
+
+    def __init__(self, counter: int):
+        self.counter = counter
+        self.presses = 1
+        self.missed = 0
+        self.resets = 0
+
+    def advance(self, counter: int) -> bool:
+        """Take a frame's counter; True if it starts a new press."""
+        gap = (counter - self.counter) & 0xFFFF
+        if gap == 0:
+            return False
+        self.counter = counter
+        self.presses += 1
+        if gap <= MAX_GAP:
+            self.missed += gap - 1
+        else:
+            self.resets += 1
+        return True
+
+    @property
+    def missed_rate(self) -> float:
+        return self.missed / (self.presses + self.missed)
+
+
+class _Link:
+    """Frames of one sender to one receiver."""
+
+    __slots__ = ("frames", "presses", "signal", "signal_min", "signal_max",
+                 "last_seen")
+
+    def __init__(self, signal_strength: int):
+        self.frames = 0
+        self.presses = 0
+        self.signal = float(signal_strength)
+        self.signal_min = signal_strength
+        self.signal_max = signal_strength
+        self.last_seen = 0.0
+
+
+class LinkStats:
+    """
+    Per-link quality from the frames heard: the share of presses missed,
+    how many of each press's repeated frames arrived, and the signal
+    strength.
+
+    A sender's counter advances once per press across all its receivers,
+    so gaps, and with them missed presses, are counted per sender. Frames,
+    repeats and signal are counted per (sender, receiver) link. At most
+    ``max_links`` links are kept, the least recently heard go first.
+    """
+
+    def __init__(self, max_links: int = DEFAULT_MAX_LINKS):
+        self.max_links = max_links
+        self._links: dict[int, _Link] = {}
+        self._sequences: dict[int, _Sequence] = {}
+
+    def record(self, message: SchellenbergMessageReceived) -> None:
+        sender = message.sender.key
+        key = sender << 8 | int(message.receiver, 16)
+        link = self._links.pop(key, None)
+        if link is None:
+            link = _Link(message.signal_strength)
+            if len(self._links) >= self.max_links:
+                self._evict()
+        # Re-inserted, so the dict stays ordered by last frame
+        self._links[key] = link
+
+        sequence = self._sequences.get(sender)
+        if sequence is None:
+            self._sequences[sender] = _Sequence(message.counter)
+            new_press = True
+        else:
+            new_press = sequence.advance(message.counter)
+
+        signal = message.signal_strength
+        link.frames += 1
+        link.presses += new_press
+        link.signal += (signal - link.signal) * SIGNAL_SMOOTHING
+        if signal < link.signal_min:
+            link.signal_min = signal
+        elif signal > link.signal_max:
+            link.signal_max = signal
+        link.last_seen = time.time()
+
+    def _evict(self) -> None:
+        key = next(iter(self._links))
+        del self._links[key]
+        sender = key >> 8
+        if not any(other >> 8 == sender for other in self._links):
+            self._sequences.pop(sender, None)
+
+    def missed_rate(self, sender: int) -> float | None:
+        sequence = self._sequences.get(sender)
+        return sequence.missed_rate if sequence else None
+
+    def report(self) -> list[dict[str, object]]:
+        """All links, the worst first: most presses missed, then weakest."""
+        rows = []
+        for key, link in self._links.items():
+            sequence = self._sequences[key >> 8]
+            rows.append({
+                "sender": f"{key >> 8:06X}",
+                "receiver": f"{key & 0xFF:02X}",
+                "frames": link.frames,
+                "presses": link.presses,
+                "frames_per_press": round(link.frames / link.presses, 2)
+                if link.presses else None,
+                "sender_presses": sequence.presses,
+                "sender_missed": sequence.missed,
+                "sender_resets": sequence.resets,
+                "missed_rate": round(sequence.missed_rate, 4),
+                "signal_strength": round(link.signal, 1),
+                "signal_min": link.signal_min,
+                "signal_max": link.signal_max,
+                "last_seen": link.last_seen,
+            })
+        rows.sort(key=lambda row: (-row["missed_rate"],
+                                   row["signal_strength"]))
+        return rows
@@ -1,24 +1,51 @@
-from typing import List
+from typing import Callable, List, Literal
 import asyncio
 import os
+import secrets
+import threading
 from contextlib import asynccontextmanager
+from pathlib import Path
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from anyio import from_thread
+from fastapi import (FastAPI, Request, Response, WebSocket,
+                     WebSocketDisconnect)
 from pydantic import BaseModel
-from schellenberghack import SETTINGS
 from schellenberghack.commands import Command
-from schellenberghack.devices import Device, SenderDevice
+from schellenberghack.devices import (Device, SenderDevice, SenderRecord,
+                                      parse_device_id, parse_enumerator)
 from schellenberghack.message import (OutgoingSchellenbergMessage,
-                                      SchellenbergMessageReceived)
+                                      SchellenbergMessageReceived,
+                                      preencode_frames)
+from schellenberghack.settings import (RegistryChange, RegistrySnapshot,
+                                       get_settings)
 from serial import Serial
+from sse_starlette import EventSourceResponse
 
-from .homeassistant import HomeAssistantWorker
+from .airtime import KEEP_ORDER, PRIORITY_BULK, PRIORITY_INTERACTIVE
+from .capture import FrameRecorder, FrameReplayer
+from .diagnostics import (
+    MAX_PROFILE_SECONDS,
+    LoopLagMonitor,
+    allocation_snapshot,
+    sample_profile,
+)
+from .emulator import EMULATOR_MODE, StickEmulator
+from .eventlog import EventLog
+from .history import EventHistory
+from .homeassistant import HomeAssistantWorker, migration_file_path
+from .linkstats import LinkStats
+from .radio import RADIO_PROCESS, RadioProcess
+from .runtime import describe as describe_runtime, dumps, loads
+from .statecache import StateCache
+from .stream import EventStream, StreamFilter
 from .worker import (
     ReceiveWorker,
     SendWorker,
     MockReceiveWorker,
     MockSendWorker,
     MOCK_MODE,
+    SerialIO,
+    stick_handshake,
 )
 
 print("Starting Schellenberg API...")
@@ -28,18 +55,33 @@ async def fanout_received_messages():
     worker: ReceiveWorker = app.state.receive_worker
     ha_worker: HomeAssistantWorker = app.state.ha_worker
     clients: List[WebSocket] = app.state.websocket_clients
+    history: EventHistory = app.state.history
+    event_log: EventLog | None = app.state.event_log
+    event_stream: EventStream = app.state.event_stream
+    link_stats: LinkStats = app.state.link_stats
     while True:
         msg = await worker.receivedMessages.get()
+        history.record(msg)
+        link_stats.record(msg)
+        if event_log:
+            event_log.record(msg)
+        event_stream.publish_frame(msg)
         disconnected: List[WebSocket] = []
+        # Serialized once for all clients
+        text = dumps(msg.to_dict()) if clients else ""
         for ws in clients:
             try:
-                await ws.send_json(msg.to_dict())
+                await ws.send_text(text)
             except Exception:
                 disconnected.append(ws)
         for ws in disconnected:
             clients.remove(ws)
 
-        await ha_worker.handle_received_message(msg)
+        try:
+            await ha_worker.handle_received_message(msg)
+        except RuntimeError as e:
+            # MQTT not connected yet, keep fanning out to WebSocket clients
+            print(f"[FANOUT] {e}")
 
 
 async def mqtt_command_forwarder():
@@ -52,6 +94,10 @@ async def mqtt_command_forwarder():
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    print(f"[RUNTIME] {describe_runtime()}")
+    # Started first, so it also catches a hanging stick handshake
+    app.state.loop_monitor = LoopLagMonitor()
+    app.state.loop_monitor.start()
     if MOCK_MODE:
         print("=" * 60)
         print("RUNNING IN MOCK MODE - No serial connection required")
@@ -61,11 +107,15 @@ async def lifespan(app: FastAPI):
         own_id = "ABCDEF"
         print(f"[MOCK] Using mock device ID: {own_id}")
 
-        SETTINGS.self_sender_id = own_id
-        SETTINGS.senders.add(SenderDevice(device_id=own_id, name="self"))
+        get_settings().set_self_sender(own_id)
 
         websocket_clients: set[WebSocket] = set()
         app.state.websocket_clients = websocket_clients
+        app.state.history = EventHistory()
+        app.state.link_stats = LinkStats()
+        app.state.event_stream = EventStream()
+        store = get_settings().store
+        app.state.event_log = EventLog(store) if store else None
 
         # Use mock workers
         app.state.send_worker = MockSendWorker()
@@ -75,11 +125,27 @@ async def lifespan(app: FastAPI):
             mqtt_port=int(os.getenv("MQTT_PORT", "1883")),
             mqtt_user=os.getenv("MQTT_USER"),
             mqtt_password=os.getenv("MQTT_PASSWORD"),
+            link_stats=app.state.link_stats,
+            migration_file=migration_file_path(),
+        )
+
+        app.state.ha_worker.state_listeners.append(
+            app.state.event_stream.publish_state
+        )
+        app.state.state_cache = StateCache()
+        app.state.ha_worker.device_states.update(
+            app.state.state_cache.load()
+        )
+        app.state.ha_worker.state_listeners.append(
+            app.state.state_cache.update
         )
 
         app.state.send_worker.start()
         app.state.receive_worker.start()
         app.state.ha_worker.start()
+        app.state.state_cache.start()
+        if app.state.event_log:
+            app.state.event_log.start()
 
         asyncio.create_task(fanout_received_messages())
         asyncio.create_task(mqtt_command_forwarder())
@@ -103,51 +169,127 @@ async def lifespan(app: FastAPI):
                 )
         asyncio.create_task(mock_open_close_shutters())
 
+        replay_file = os.getenv("REPLAY_FILE")
+        if replay_file:
+            async def replay_capture():
+                """Feed a recorded capture into the receive pipeline."""
+                async def handler(line: bytes):
+                    try:
+                        message = SchellenbergMessageReceived.from_bytes(line)
+                    except ValueError:
+                        return
+                    await app.state.receive_worker.simulate_incoming_message(
+                        message
+                    )
+                count = await FrameReplayer(Path(replay_file)).replay(
+                    handler,
+                    realtime=os.getenv("REPLAY_REALTIME", "true").lower()
+                    in ("true", "1", "yes"),
+                )
+                print(f"[MOCK] Replayed {count} lines from {replay_file}")
+            asyncio.create_task(replay_capture())
+
         yield
 
         await app.state.ha_worker.exit()
+        await app.state.state_cache.exit()
         await app.state.send_worker.exit()
         await app.state.receive_worker.exit()
-        SETTINGS.save()
+        if app.state.event_log:
+            await app.state.event_log.exit()
+        get_settings().save()
+        await app.state.loop_monitor.exit()
     else:
         # Real serial connection
         serial_port = os.getenv("SERIAL")
+        emulator: StickEmulator | None = None
+        if EMULATOR_MODE:
+            emulator = StickEmulator.from_env()
+            serial_port = emulator.start()
         if not serial_port:
             raise ValueError("SERIAL_PORT environment variable not set")
-        try:
-            ser = Serial(
-                serial_port, SETTINGS.baud_rate, timeout=SETTINGS.timeout
+        settings = get_settings()
+        ser: Serial | None = None
+        radio: RadioProcess | None = None
+        if RADIO_PROCESS:
+            # Serial port and transmitter timing in their own process
+            radio = RadioProcess(
+                serial_port, settings.baud_rate, settings.timeout
             )
-        except Exception as e:
-            print(f"[SERIAL] Error opening serial port \"{serial_port}\": {e}")
-            return
-        ser.write(b"hello\n")
-        print(f"[SERIAL] Connected to {ser.name}")
-        ser.write(b"!?\n")
-        print(str(ser.readline().strip(), "ascii"))
-
-        ser.write(b"sr\n")
-        own_id = str(ser.readline().strip(), "ascii")[2:]
-        print(f"{own_id=}")
+            try:
+                own_id = await radio.start()
+            except (OSError, RuntimeError) as e:
+                print(f"[RADIO] Error starting the radio process: {e}")
+                await radio.stop()
+                await app.state.loop_monitor.exit()
+                return
+        else:
+            try:
+                ser = Serial(
+                    serial_port, settings.baud_rate, timeout=settings.timeout
+                )
+            except Exception as e:
+                print(f"[SERIAL] Error opening serial port "
+                      f"\"{serial_port}\": {e}")
+                await app.state.loop_monitor.exit()
+                return
+            # Off the event loop, its readline() waits for the stick
+            own_id = await asyncio.to_thread(stick_handshake, ser)
 
-        SETTINGS.self_sender_id = own_id
-        SETTINGS.senders.add(SenderDevice(device_id=own_id, name="self"))
+        get_settings().set_self_sender(own_id)
+        self_sender = get_settings().self_sender
+        if self_sender and ser:
+            preencode_frames(
+                device.enumerator
+                for device in self_sender.connected_devices
+            )
 
         websocket_clients: set[WebSocket] = set()
         app.state.websocket_clients = websocket_clients
+        app.state.history = EventHistory()
+        app.state.link_stats = LinkStats()
+        app.state.event_stream = EventStream()
+        store = get_settings().store
+        app.state.event_log = EventLog(store) if store else None
 
-        app.state.send_worker = SendWorker(ser)
-        app.state.receive_worker = ReceiveWorker(ser)
+        recorder: FrameRecorder | None = None
+        if radio:
+            # The radio process records the capture, if any
+            app.state.send_worker = radio.send_worker
+            app.state.receive_worker = radio.receive_worker
+        elif ser:
+            capture_file = os.getenv("CAPTURE_FILE")
+            if capture_file:
+                recorder = FrameRecorder(Path(capture_file))
+                print(f"[CAPTURE] Recording serial traffic to {capture_file}")
+            app.state.send_worker = SendWorker(ser, recorder)
+            app.state.receive_worker = ReceiveWorker(ser, recorder)
         app.state.ha_worker = HomeAssistantWorker(
             mqtt_host=os.getenv("MQTT_HOST", "core-mosquitto"),
             mqtt_port=int(os.getenv("MQTT_PORT", "1883")),
             mqtt_user=os.getenv("MQTT_USER"),
             mqtt_password=os.getenv("MQTT_PASSWORD"),
+            link_stats=app.state.link_stats,
+            migration_file=migration_file_path(),
+        )
+
+        app.state.ha_worker.state_listeners.append(
+            app.state.event_stream.publish_state
+        )
+        app.state.state_cache = StateCache()
+        app.state.ha_worker.device_states.update(
+            app.state.state_cache.load()
+        )
+        app.state.ha_worker.state_listeners.append(
+            app.state.state_cache.update
         )
 
         app.state.send_worker.start()
         app.state.receive_worker.start()
         app.state.ha_worker.start()
+        app.state.state_cache.start()
+        if app.state.event_log:
+            app.state.event_log.start()
 
         asyncio.create_task(fanout_received_messages())
         asyncio.create_task(mqtt_command_forwarder())
@@ -155,10 +297,22 @@ async def lifespan(app: FastAPI):
         yield
 
         await app.state.ha_worker.exit()
+        await app.state.state_cache.exit()
         await app.state.send_worker.exit()
         await app.state.receive_worker.exit()
-        ser.close()
-        SETTINGS.save()
+        if app.state.event_log:
+            await app.state.event_log.exit()
+        if recorder:
+            recorder.close()
+        if ser:
+            SerialIO.of(ser).close()
+            ser.close()
+        if radio:
+            await radio.stop()
+        if emulator:
+            emulator.stop()
+        get_settings().save()
+        await app.state.loop_monitor.exit()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -169,53 +323,289 @@ class AllDevicesResponse(BaseModel):
     self_sender_id: str
 
 
+# Largest batch of commands accepted in one request
+MAX_BATCH_COMMANDS = 256
+
+
+class BatchCommand(BaseModel):
+    sender_id: str
+    enumerator: str
+    command: str
+
+
+class BatchCommandsRequest(BaseModel):
+    commands: list[BatchCommand]
+    bulk: bool = False
+
+
+class RegistryChangeModel(BaseModel):
+    action: Literal["add", "rename", "remove"]
+    sender_id: str
+    enumerator: str | None = None
+    name: str | None = None
+
+
+class RegistryBatchRequest(BaseModel):
+    changes: list[RegistryChangeModel]
+
+
+class RegistryImportRequest(BaseModel):
+    senders: list[SenderDevice]
+    # Replace the whole registry instead of merging into it
+    replace: bool = False
+
+
 @app.get("/health")
 def health_check():
     print("Health check received")
     return {"status": "ok"}
 
 
-@app.get("/api/devices/all")
-def get_devices() -> AllDevicesResponse:
-    if SETTINGS.self_sender_id is None:
-        raise ValueError("Self sender ID is not set")
-    return AllDevicesResponse(
-        senders=SETTINGS.senders, self_sender_id=SETTINGS.self_sender_id
-    )
+# Serialized registry responses by (Settings.version, key), holding one
+# version at a time. Written from threadpool handlers.
+_response_cache: dict[tuple[int, str], bytes] = {}
+_response_cache_version = -1
+_response_cache_lock = threading.Lock()
+RESPONSE_CACHE_SIZE = 1024
+# Distinguishes ETags across restarts, where the version starts over
+_ETAG_PREFIX = os.urandom(4).hex()
 
 
-@app.get("/api/devices/paired")
-def get_paired_devices() -> SenderDevice | None:
-    return SETTINGS.self_sender
+def _registry_response(
+    request: Request,
+    key: str,
+    build: Callable[[RegistrySnapshot], BaseModel | None],
+) -> Response:
+    """
+    Serve a registry read from the per-version cache, answering
+    ``If-None-Match`` with 304 when the client's copy is current. Misses
+    (``null``) are not cached, so arbitrary paths cannot fill the cache.
+    """
+    global _response_cache_version
+    snapshot = get_settings().snapshot()
+    etag = f'"{_ETAG_PREFIX}-{snapshot.version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
 
+    cache_key = (snapshot.version, key)
+    with _response_cache_lock:
+        body = _response_cache.get(cache_key)
+    if body is None:
+        model = build(snapshot)
+        body = model.model_dump_json().encode() if model else b"null"
+        with _response_cache_lock:
+            if snapshot.version != _response_cache_version:
+                _response_cache.clear()
+                _response_cache_version = snapshot.version
+            if model and len(_response_cache) < RESPONSE_CACHE_SIZE:
+                _response_cache[cache_key] = body
+    return Response(body, media_type="application/json", headers=headers)
 
-@app.get("/api/devices/specific/{sender_id}/{enumerator}")
-def device(sender_id: str, enumerator: str) -> Device | None:
-    return SETTINGS.get_device_by_sender_and_enumerator(sender_id, enumerator)
+
+@app.get("/api/devices/all", response_model=AllDevicesResponse)
+def get_devices(request: Request) -> Response:
+    def build(snapshot: RegistrySnapshot) -> AllDevicesResponse:
+        if snapshot.self_sender_id is None:
+            raise ValueError("Self sender ID is not set")
+        return AllDevicesResponse(
+            senders=snapshot.models(), self_sender_id=snapshot.self_sender_id
+        )
+    return _registry_response(request, "all", build)
+
+
+@app.get("/api/devices/paired", response_model=SenderDevice | None)
+def get_paired_devices(request: Request) -> Response:
+    def build(snapshot: RegistrySnapshot) -> SenderDevice | None:
+        sender = snapshot.self_sender
+        return sender.to_model() if sender else None
+    return _registry_response(request, "paired", build)
+
+
+@app.get(
+    "/api/devices/specific/{sender_id}/{enumerator}",
+    response_model=Device | None,
+)
+def device(request: Request, sender_id: str, enumerator: str) -> Response:
+    def build(snapshot: RegistrySnapshot) -> Device | None:
+        device = snapshot.get_device(sender_id, enumerator)
+        return device.to_model() if device else None
+    return _registry_response(
+        request, f"device/{sender_id}/{enumerator}", build
+    )
+
+
+def _announce_sender(sender_id: str) -> None:
+    """Push a registry delta for a sender from a threadpool handler."""
+    sender = get_settings().get_sender_by_id(sender_id)
+    if sender is None:
+        return
+    from_thread.run_sync(
+        app.state.event_stream.publish_registry,
+        sender.to_model().model_dump(mode="json"),
+    )
 
 
 @app.post("/api/devices/specific/{sender_id}/rename")
 def rename_sender(sender_id: str, new_name: str) -> SenderDevice | None:
-    return SETTINGS.rename_sender(sender_id, new_name)
+    sender = get_settings().rename_sender(sender_id, new_name)
+    _announce_sender(sender_id)
+    return sender.to_model() if sender else None
 
 
 @app.post("/api/devices/specific/{sender_id}/{enumerator}/rename")
 def rename_device(
     sender_id: str, enumerator: str, new_name: str
 ) -> Device | None:
-    return SETTINGS.rename_receiver(sender_id, enumerator, new_name)
+    device = get_settings().rename_receiver(sender_id, enumerator, new_name)
+    _announce_sender(sender_id)
+    return device.to_model() if device else None
 
 
 @app.post("/api/devices/specific/{sender_id}/{enumerator}/remove")
 def remove_device(sender_id: str, enumerator: str) -> None:
-    SETTINGS.remove_device(sender_id, enumerator)
+    get_settings().remove_device(sender_id, enumerator)
+    _announce_sender(sender_id)
+
+
+async def _apply_registry_changes(
+    changes: list[RegistryChange],
+) -> dict[str, object]:
+    """
+    Apply changes in one transaction off the event loop, then announce
+    the changed senders and republish discovery if the stick's devices
+    changed.
+    """
+    settings = get_settings()
+    try:
+        changed = await asyncio.to_thread(settings.apply_changes, changes)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    snapshot = settings.snapshot()
+    for key in sorted(changed):
+        sender = snapshot.by_key.get(key)
+        if sender:
+            app.state.event_stream.publish_registry(
+                sender.to_model().model_dump(mode="json")
+            )
+    if snapshot.self_sender_key in changed:
+        ha_worker: HomeAssistantWorker = app.state.ha_worker
+        await ha_worker.publish_all_discovery_configs()
+    return {
+        "status": "success",
+        "message": f"{len(changes)} changes applied to "
+        f"{len(changed)} senders",
+    }
+
+
+@app.post("/api/registry/batch")
+async def registry_batch(request: RegistryBatchRequest) -> dict[str, object]:
+    """
+    Add, rename and remove senders and devices in one transaction, with a
+    single write: either all changes apply or none.
+    """
+    return await _apply_registry_changes([
+        RegistryChange(change.action, change.sender_id.upper(),
+                       change.enumerator, change.name)
+        for change in request.changes
+    ])
+
+
+@app.get("/api/registry/export")
+def registry_export() -> dict[str, object]:
+    """The whole registry, in the layout ``/api/registry/import`` takes."""
+    snapshot = get_settings().snapshot()
+    return {
+        "self_sender_id": snapshot.self_sender_id,
+        "senders": [
+            sender.to_dict()
+            for sender in sorted(snapshot.senders, key=lambda s: s.key)
+        ],
+    }
+
+
+@app.post("/api/registry/import")
+async def registry_import(
+    request: RegistryImportRequest,
+) -> dict[str, object]:
+    """
+    Merge exported senders into the registry, or with ``replace`` swap
+    the registry for them. The stick's own sender is always kept.
+    """
+    settings = get_settings()
+    if request.replace:
+        snapshot = settings.snapshot()
+        senders: list[SenderDevice | SenderRecord] = list(request.senders)
+        own = snapshot.self_sender
+        if own and not any(
+            sender.device_id.upper() == own.device_id
+            for sender in request.senders
+        ):
+            senders.append(own)
+        try:
+            await asyncio.to_thread(
+                settings.replace_registry, senders, snapshot.self_sender_id
+            )
+        except ValueError as e:
+            return {"status": "error", "message": str(e)}
+        for sender in settings.snapshot().senders:
+            app.state.event_stream.publish_registry(
+                sender.to_model().model_dump(mode="json")
+            )
+        ha_worker: HomeAssistantWorker = app.state.ha_worker
+        await ha_worker.publish_all_discovery_configs()
+        return {
+            "status": "success",
+            "message": f"Registry replaced with {len(senders)} senders",
+        }
+    changes = []
+    for sender in request.senders:
+        sender_id = sender.device_id.upper()
+        changes.append(RegistryChange("add", sender_id, name=sender.name))
+        changes.extend(
+            RegistryChange("add", sender_id, device.enumerator, device.name)
+            for device in sender.connected_devices
+        )
+    return await _apply_registry_changes(changes)
+
+
+@app.get("/api/devices/quarantine")
+def get_quarantine() -> dict[str, object]:
+    """Unknown senders heard recently, not (yet) in the registry."""
+    settings = get_settings()
+    quarantine = settings.quarantine
+    return {
+        "status": "success",
+        "capacity": quarantine.capacity,
+        "promote_after": quarantine.promote_after,
+        "evicted": quarantine.evicted,
+        "senders": [entry.to_dict() for entry in settings.quarantined()],
+    }
+
+
+@app.post("/api/devices/quarantine/{sender_id}/promote")
+def promote_sender(sender_id: str) -> SenderDevice | dict[str, str]:
+    try:
+        sender = get_settings().promote_sender(sender_id)
+    except ValueError:
+        return {
+            "status": "error",
+            "message": f"Invalid sender ID: {sender_id}",
+        }
+    _announce_sender(sender_id)
+    return sender.to_model()
 
 
 @app.post("/api/devices/specific/{sender_id}/{enumerator}/command")
 async def send_command(sender_id: str,
                        enumerator: str,
-                       command: str) -> dict[str, str]:
-    """Send a command to a specific device."""
+                       command: str,
+                       bulk: bool = False) -> dict[str, str]:
+    """
+    Send a command to a specific device. ``bulk`` commands, e.g. of
+    scenes, yield airtime to interactive ones when the budget runs low.
+    """
     try:
         # Parse command string to Command enum
         cmd = Command[command.upper()]
@@ -226,18 +616,22 @@ async def send_command(sender_id: str,
             f" Valid commands: {[c.name for c in Command]}",
         }
 
-    device = SETTINGS.get_device_by_sender_and_enumerator(sender_id,
-                                                          enumerator)
+    device = get_settings().get_device_by_sender_and_enumerator(
+        sender_id, enumerator
+    )
     if not device:
         return {
             "status": "error",
             "message": f"Device not found: {sender_id}/{enumerator}",
         }
 
-    # Send command
+    # Send command, to the record's enumerator: the lookup also accepts
+    # e.g. "a" or "00A" for 0A, which would encode a malformed frame
     send_worker: SendWorker = app.state.send_worker
     await send_worker.send(
-        OutgoingSchellenbergMessage(enumerator=enumerator, command=cmd)
+        OutgoingSchellenbergMessage(enumerator=device.enumerator,
+                                    command=cmd),
+        PRIORITY_BULK if bulk else PRIORITY_INTERACTIVE,
     )
 
     return {
@@ -246,20 +640,80 @@ async def send_command(sender_id: str,
     }
 
 
+@app.post("/api/devices/commands")
+async def send_commands(request: BatchCommandsRequest) -> dict[str, object]:
+    """
+    Queue several commands at once, e.g. a scene. All are checked first:
+    one invalid command and none is sent. The batch is sent in its order,
+    a STOP in it included, and commands queued later at the same priority
+    go after it. A STOP sent on its own still goes first, and with
+    ``bulk`` interactive commands may go in between.
+    """
+    if len(request.commands) > MAX_BATCH_COMMANDS:
+        return {
+            "status": "error",
+            "message": f"At most {MAX_BATCH_COMMANDS} commands per batch",
+        }
+    snapshot = get_settings().snapshot()
+    messages = []
+    errors = []
+    for index, item in enumerate(request.commands):
+        try:
+            cmd = Command[item.command.upper()]
+        except KeyError:
+            errors.append(f"{index}: Invalid command: {item.command}")
+            continue
+        device = snapshot.get_device(item.sender_id, item.enumerator)
+        if not device:
+            errors.append(
+                f"{index}: Device not found: "
+                f"{item.sender_id}/{item.enumerator}"
+            )
+            continue
+        # The record's enumerator, as in send_command()
+        messages.append(
+            OutgoingSchellenbergMessage(enumerator=device.enumerator,
+                                        command=cmd)
+        )
+    if errors:
+        return {"status": "error", "message": "; ".join(errors)}
+
+    send_worker: SendWorker = app.state.send_worker
+    priority = PRIORITY_BULK if request.bulk else PRIORITY_INTERACTIVE
+    # send() only enqueues and never suspends, so the batch gets
+    # consecutive places in the queue at one priority
+    priority |= KEEP_ORDER
+    for message in messages:
+        await send_worker.send(message, priority)
+    return {
+        "status": "success",
+        "message": f"{len(messages)} commands queued",
+    }
+
+
 @app.post("/api/devices/specific/{receiver_id}/{enumerator}/pair")
-async def pair_device(receiver_id: str, enumerator: str) -> Device | None:
+async def pair_device(
+    receiver_id: str, enumerator: str
+) -> Device | dict[str, str] | None:
     send_worker: SendWorker = app.state.send_worker
     receive_worker: ReceiveWorker = app.state.receive_worker
-    pairing_message = await receive_worker.wait_for_pairing_message(
-        receiver_id
-    )
+    try:
+        pairing_message = await receive_worker.wait_for_pairing_message(
+            receiver_id
+        )
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
     if not pairing_message:
         return None
-    await send_worker.send(
-        OutgoingSchellenbergMessage(
-            enumerator=enumerator, command=Command.ALLOW_PAIRING
+    # Answered as soon as the transmitter is free, done at its t0
+    try:
+        await send_worker.send_and_wait(
+            OutgoingSchellenbergMessage(
+                enumerator=enumerator, command=Command.ALLOW_PAIRING
+            )
         )
-    )
+    except (TimeoutError, RuntimeError) as e:
+        return {"status": "error", "message": str(e)}
     device = next(
         filter(
             lambda d: d.enumerator == pairing_message.receiver,
@@ -267,22 +721,123 @@ async def pair_device(receiver_id: str, enumerator: str) -> Device | None:
         ),
         None,
     )
-    SETTINGS.pair_device(enumerator, device.name if device else None)
+    settings = get_settings()
+    settings.pair_device(enumerator, device.name if device else None)
+    if settings.self_sender:
+        app.state.event_stream.publish_registry(
+            settings.self_sender.to_model().model_dump(mode="json")
+        )
 
     # Publish autodiscovery config for the new device
     ha_worker: HomeAssistantWorker = app.state.ha_worker
-    new_device = SETTINGS.get_device_by_sender_and_enumerator(
+    new_device = settings.get_device_by_sender_and_enumerator(
         receiver_id, enumerator
     )
-    if new_device and new_device.name and SETTINGS.self_sender:
+    if new_device and new_device.name and settings.self_sender:
         await ha_worker.publish_discovery_config(
-            SETTINGS.self_sender,
+            settings.self_sender,
             new_device.name
         )
 
-    return SETTINGS.get_device_by_sender_and_enumerator(
-        receiver_id, enumerator
-    )
+    return new_device.to_model() if new_device else None
+
+
+@app.get("/api/radio/links")
+def radio_links(limit: int = 100) -> dict[str, object]:
+    """Quality per (sender, receiver) link heard, the worst first."""
+    links = app.state.link_stats.report()
+    return {"count": len(links), "links": links[:limit]}
+
+
+@app.get("/api/radio/airtime")
+async def radio_airtime() -> dict[str, object]:
+    """Transmit time used in the duty-cycle window, and the send queue."""
+    send_worker: SendWorker = app.state.send_worker
+    return await send_worker.status()
+
+
+# Diagnostics need DEBUG_TOKEN in the X-Debug-Token header, and are off
+# without one
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN")
+_profile_lock = asyncio.Lock()
+
+
+def _check_debug_token(request: Request,
+                       response: Response) -> dict[str, str] | None:
+    """The error to answer with, unless the request may use diagnostics."""
+    if not DEBUG_TOKEN:
+        response.status_code = 403
+        return {"status": "error", "message": "Diagnostics are disabled"}
+    token = request.headers.get("x-debug-token", "")
+    if not secrets.compare_digest(token.encode(), DEBUG_TOKEN.encode()):
+        response.status_code = 403
+        return {"status": "error", "message": "Invalid debug token"}
+    return None
+
+
+@app.get("/api/debug/loop")
+def debug_loop(request: Request, response: Response) -> dict[str, object]:
+    """Event loop lag histogram and the stacks of the last stalls."""
+    error = _check_debug_token(request, response)
+    if error:
+        return error
+    return app.state.loop_monitor.report()
+
+
+@app.post("/api/debug/profile")
+async def debug_profile(
+    request: Request,
+    response: Response,
+    seconds: float = 5,
+    interval_ms: float = 5,
+    limit: int = 30,
+) -> dict[str, object]:
+    """
+    Sample the stacks of the running process for ``seconds``, at most
+    one profile at a time.
+    """
+    error = _check_debug_token(request, response)
+    if error:
+        return error
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        return {
+            "status": "error",
+            "message": f"seconds must be in (0, {MAX_PROFILE_SECONDS:.0f}]",
+        }
+    if _profile_lock.locked():
+        return {"status": "error", "message": "A profile is already running"}
+    async with _profile_lock:
+        return await asyncio.to_thread(
+            sample_profile, seconds, max(interval_ms, 1) / 1000, limit
+        )
+
+
+@app.post("/api/debug/tracemalloc")
+async def debug_tracemalloc(
+    request: Request,
+    response: Response,
+    seconds: float = 10,
+    frames: int = 1,
+    limit: int = 30,
+) -> dict[str, object]:
+    """
+    Trace allocations for ``seconds`` and return where the memory still
+    held at the end was allocated.
+    """
+    error = _check_debug_token(request, response)
+    if error:
+        return error
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        return {
+            "status": "error",
+            "message": f"seconds must be in (0, {MAX_PROFILE_SECONDS:.0f}]",
+        }
+    if _profile_lock.locked():
+        return {"status": "error", "message": "A profile is already running"}
+    async with _profile_lock:
+        return await allocation_snapshot(
+            seconds, limit, min(max(frames, 1), 25)
+        )
 
 
 @app.post("/api/homeassistant/republish")
@@ -293,9 +848,110 @@ async def republish_ha_configs():
     return {"status": "success", "message": "Autodiscovery republished"}
 
 
+@app.get("/api/events/history")
+async def event_history(
+    sender: str | None = None,
+    receiver: str | None = None,
+    command: str | None = None,
+    since: float | None = None,
+    until: float | None = None,
+    limit: int = 100,
+    persistent: bool = False,
+) -> dict[str, object]:
+    """
+    Query recently received frames, oldest first. ``persistent`` searches
+    the SQLite event log instead, which survives restarts.
+    """
+    cmd = None
+    if command:
+        try:
+            cmd = Command[command.upper()]
+        except KeyError:
+            return {
+                "status": "error",
+                "message": f"Invalid command: {command}."
+                f" Valid commands: {[c.name for c in Command]}",
+            }
+    try:
+        if sender is not None:
+            parse_device_id(sender)
+    except ValueError:
+        return {"status": "error", "message": f"Invalid sender ID: {sender}"}
+    try:
+        if receiver is not None:
+            parse_enumerator(receiver)
+    except ValueError:
+        return {
+            "status": "error",
+            "message": f"Invalid receiver enumerator: {receiver}",
+        }
+    query = {
+        "sender": sender.upper() if sender else None,
+        "receiver": receiver.upper() if receiver else None,
+        "command": cmd,
+        "since": since,
+        "until": until,
+        "limit": limit,
+    }
+    if not persistent:
+        history: EventHistory = app.state.history
+        return {"status": "success", "events": history.query(**query)}
+    event_log: EventLog | None = app.state.event_log
+    if not event_log:
+        return {
+            "status": "error",
+            "message": "Persistent history needs the SQLite storage",
+        }
+    # A database query, kept off the event loop
+    events = await asyncio.to_thread(event_log.query, **query)
+    return {"status": "success", "events": events}
+
+
+@app.get("/api/devices/stream")
+async def stream_events(
+    request: Request,
+    sender: str | None = None,
+    receiver: str | None = None,
+    command: str | None = None,
+    last_event_id: str | None = None,
+) -> EventSourceResponse:
+    """
+    Server-Sent Events stream of received frames and device state changes.
+    Reconnecting clients resume after the `Last-Event-ID` header (or the
+    `last_event_id` query parameter) from the backlog; after a restart
+    they get the whole backlog.
+    """
+    last_event_id = request.headers.get("last-event-id") or last_event_id
+    event_stream: EventStream = app.state.event_stream
+    resume_seq = event_stream.resume_seq(last_event_id)
+    stream_filter = StreamFilter(
+        sender=sender.upper() if sender else None,
+        receiver=receiver.upper() if receiver else None,
+        command=command.upper() if command else None,
+    )
+
+    async def events():
+        async for item in event_stream.subscribe(resume_seq, stream_filter):
+            yield {
+                "id": event_stream.event_id(item),
+                "event": item.event,
+                "data": dumps(item.data),
+            }
+
+    return EventSourceResponse(events())
+
+
 @app.websocket("/api/devices/events")
-async def websocket_events(websocket: WebSocket):
+async def websocket_events(
+    websocket: WebSocket,
+    protocol: int = 1,
+    senders: str | None = None,
+    devices: str | None = None,
+):
     await websocket.accept()
+    if protocol >= 2:
+        await _websocket_events_v2(websocket, senders, devices)
+        return
     print(f"[WebSocket] Client connected. Total clients: "
           f"{len(app.state.websocket_clients) + 1}", flush=True)
 
@@ -314,3 +970,106 @@ async def websocket_events(websocket: WebSocket):
         app.state.websocket_clients.discard(websocket)
         print(f"[WebSocket] Client removed. Total clients: "
               f"{len(app.state.websocket_clients)}", flush=True)
+
+
+def _split_ids(
+    value: str | list[str] | None, upper: bool
+) -> set[str] | None:
+    if value is None:
+        return None
+    items = value.split(",") if isinstance(value, str) else value
+    return {
+        item.strip().upper() if upper else item.strip()
+        for item in items if item.strip()
+    }
+
+
+def _snapshot_message(stream_filter: StreamFilter) -> str:
+    """Registry and current states, limited to the subscription."""
+    ha_worker: HomeAssistantWorker = app.state.ha_worker
+    event_stream: EventStream = app.state.event_stream
+    registry = get_settings().snapshot()
+    mapping = ha_worker.device_mapping
+    return dumps({
+        "type": "snapshot",
+        "seq": event_stream.last_seq,
+        "self_sender_id": registry.self_sender_id,
+        "senders": [
+            sender.to_model().model_dump(mode="json")
+            for sender in registry.senders
+            if stream_filter.wants_sender(sender.device_id)
+        ],
+        "states": {
+            name: state.value
+            for name, state in ha_worker.device_states.items()
+            if stream_filter.wants_device(name, mapping.get(name, ()))
+        },
+    })
+
+
+async def _websocket_events_v2(
+    websocket: WebSocket, senders: str | None, devices: str | None
+):
+    """
+    Protocol 2: one snapshot, then only the deltas the client subscribed
+    to. Clients change their subscription by sending
+    {"type": "subscribe", "senders": [...] | null, "devices": [...] | null}
+    and receive a fresh snapshot for it.
+    """
+    event_stream: EventStream = app.state.event_stream
+    ha_worker: HomeAssistantWorker = app.state.ha_worker
+    stream_filter = StreamFilter()
+
+    def subscribe(senders, devices):
+        # Device names are resolved against the current registry
+        ha_worker.update_device_mapping()
+        stream_filter.subscribe(
+            _split_ids(senders, upper=True),
+            _split_ids(devices, upper=False),
+            ha_worker.device_mapping,
+        )
+
+    subscribe(senders, devices)
+    send_lock = asyncio.Lock()
+    print("[WebSocket] Protocol 2 client connected", flush=True)
+
+    async def send(text: str):
+        async with send_lock:
+            await websocket.send_text(text)
+
+    async def push_deltas(seq: int):
+        async for item in event_stream.subscribe(seq, stream_filter):
+            await send(item.encode())
+
+    async def read_subscriptions():
+        while True:
+            try:
+                request = loads(await websocket.receive_text())
+            except ValueError:
+                continue
+            if not isinstance(request, dict) \
+                    or request.get("type") != "subscribe":
+                continue
+            subscribe(request.get("senders"), request.get("devices"))
+            await send(_snapshot_message(stream_filter))
+
+    seq = event_stream.last_seq
+    snapshot = _snapshot_message(stream_filter)
+    tasks = [
+        asyncio.create_task(push_deltas(seq)),
+        asyncio.create_task(read_subscriptions()),
+    ]
+    try:
+        await send(snapshot)
+        done, _ = await asyncio.wait(
+            tasks, return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in done:
+            task.result()
+    except WebSocketDisconnect:
+        print("[WebSocket] Protocol 2 client disconnected", flush=True)
+    except Exception as e:
+        print(f"[WebSocket] Error: {e}", flush=True)
+    finally:
+        for task in tasks:
+            task.cancel()
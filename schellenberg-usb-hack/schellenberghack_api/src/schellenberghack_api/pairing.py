@@ -0,0 +1,62 @@
+import asyncio
+
+from schellenberghack.devices import parse_device_id
+from schellenberghack.message import SchellenbergMessageReceived
+
+
+class PairingManager:
+    """
+    Open pairing requests, one future per expected sender. ALLOW_PAIRING
+    frames are handed straight to the request waiting for their sender, so
+    concurrent requests for different remotes never see each other's
+    frames. A second request for a sender that is already being waited
+    for is refused.
+    """
+
+    def __init__(self):
+        self.sessions: dict[
+            int, asyncio.Future[SchellenbergMessageReceived]
+        ] = {}
+        # Counter of the press that completed the last session per sender:
+        # its repeated frames must not complete the next one
+        self._completed: dict[int, int] = {}
+
+    def dispatch(self, message: SchellenbergMessageReceived) -> bool:
+        """Complete the session waiting for the frame's sender, if any."""
+        key = message.sender.key
+        future = self.sessions.get(key)
+        if future is None or future.done():
+            return False
+        if self._completed.get(key) == message.counter:
+            return False
+        self._completed[key] = message.counter
+        future.set_result(message)
+        return True
+
+    async def wait(
+        self, device_id: str, timeout: float = 10
+    ) -> SchellenbergMessageReceived | None:
+        """
+        The next ALLOW_PAIRING frame of ``device_id``, or None after
+        ``timeout`` seconds. Raises ValueError for an invalid ID or if a
+        request for this sender is already open.
+        """
+        key = parse_device_id(device_id)
+        if key in self.sessions:
+            raise ValueError(
+                f"Already waiting for a pairing message from {device_id}"
+            )
+        future = asyncio.get_running_loop().create_future()
+        self.sessions[key] = future
+        print(f"[PAIR] Waiting for pairing message from {device_id}...")
+        try:
+            async with asyncio.timeout(timeout):
+                message = await future
+        except asyncio.TimeoutError:
+            print(f"[PAIR] Timeout waiting for pairing message "
+                  f"from {device_id}")
+            return None
+        finally:
+            del self.sessions[key]
+        print(f"[PAIR] Pairing message received from {device_id}")
+        return message
@@ -0,0 +1,473 @@
+"""
+Radio core in its own process.
+
+With ``RADIO_PROCESS=true`` the serial port, the send queue, the airtime
+budget and the transmitter state live in a child process
+(``python -m schellenberghack_api.radio``), so API requests, pydantic,
+MQTT and garbage collection in the API process can't delay ``t0`` or the
+next transmission. The registry stays in the API process: the radio
+process forwards frames undecoded.
+
+Both talk over a Unix socket in fixed-size binary records, each a type
+byte followed by its fields:
+
+    API -> radio   C  id:u32 enumerator:u8 command:u8 retries:u8 prio:u8
+                   S  id:u32                         status request
+                   W  id:u32                         withdraw a queued C
+    radio -> API   I  device_id:u32                  stick's own ID, first
+                   F  enumerator:u8 sender:u32 command:u8 counter:u16
+                      local_counter:u8 signal:u8     received frame
+                   D  id:u32 result:u8               0 sent, 1 timeout,
+                                                     2 refused
+                   A  id:u32 length:u16 + JSON       status reply
+"""
+
+import asyncio
+import itertools
+import os
+import signal
+import struct
+import sys
+import tempfile
+from pathlib import Path
+
+from schellenberghack.commands import Command
+from schellenberghack.message import (
+    OutgoingSchellenbergMessage,
+    SchellenbergMessageReceived,
+    parse_frame,
+    preencode_frames,
+)
+from serial import Serial
+
+from .airtime import PRIORITY_INTERACTIVE
+from .capture import FrameRecorder
+from .diagnostics import LoopLagMonitor
+from .runtime import dumps, loads, run as run_loop
+from .worker import (
+    ReceiveWorker,
+    SendWorker,
+    SerialIO,
+    _resolve,
+    _send_and_wait,
+    stick_handshake,
+)
+
+RADIO_PROCESS = os.getenv("RADIO_PROCESS", "false").lower() in (
+    "true", "1", "yes"
+)
+CONNECT_TIMEOUT = 10.0
+# Delay before restarting a crashed radio process, doubled per failed
+# attempt up to the maximum
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 30.0
+
+RECORDS = {
+    b"C": struct.Struct("!cIBBBB"),
+    b"S": struct.Struct("!cI"),
+    b"W": struct.Struct("!cI"),
+    b"I": struct.Struct("!cI"),
+    b"F": struct.Struct("!cBIBHBB"),
+    b"D": struct.Struct("!cIB"),
+    b"A": struct.Struct("!cIH"),
+}
+SENT, TIMED_OUT, REFUSED = 0, 1, 2
+
+
+def radio_socket_path() -> Path:
+    return Path(os.getenv(
+        "RADIO_SOCKET",
+        os.path.join(tempfile.gettempdir(), "schellenberg-radio.sock"),
+    ))
+
+
+async def read_record(
+    reader: asyncio.StreamReader,
+) -> tuple[tuple, bytes | None]:
+    """The next record's fields, and the payload of a status reply."""
+    kind = await reader.readexactly(1)
+    record = RECORDS.get(kind)
+    if record is None:
+        raise ValueError(f"Unknown record type {kind!r}")
+    fields = record.unpack(kind + await reader.readexactly(record.size - 1))
+    payload = None
+    if kind == b"A":
+        payload = await reader.readexactly(fields[2])
+    return fields, payload
+
+
+# --- radio process -----------------------------------------------------------
+
+class _ForwardingReceiveWorker(ReceiveWorker):
+    """Handles the transmitter lines itself, forwards frames undecoded."""
+
+    def __init__(self, serial: Serial, core: "RadioCore",
+                 recorder: FrameRecorder | None = None):
+        super().__init__(serial, recorder)
+        self.core = core
+
+    async def handle_frame(self, response: bytes):
+        try:
+            fields = parse_frame(response)
+        except ValueError as e:
+            print(f"[RADIO] Error parsing message: {e} ({response})")
+            return
+        self.core.write(RECORDS[b"F"].pack(b"F", *fields))
+
+
+class RadioCore:
+    """The child process: serial port and send queue behind the socket."""
+
+    def __init__(self, ser: Serial, path: Path,
+                 recorder: FrameRecorder | None = None):
+        self.ser = ser
+        self.path = path
+        self.device_id = stick_handshake(ser)
+        # Commands arrive by enumerator only, so prepare all of them
+        preencode_frames(f"{enumerator:02X}" for enumerator in range(256))
+        self.send_worker = SendWorker(ser, recorder)
+        self.receive_worker = _ForwardingReceiveWorker(ser, self, recorder)
+        self.writer: asyncio.StreamWriter | None = None
+        # Commands not reported on yet, by the API process's ID
+        self._messages: dict[int, OutgoingSchellenbergMessage] = {}
+
+    def write(self, data: bytes) -> None:
+        if self.writer is None or self.writer.is_closing():
+            return
+        self.writer.write(data)
+
+    async def _send(self, message_id: int,
+                    message: OutgoingSchellenbergMessage, priority: int):
+        result = SENT
+        try:
+            # Deferred by the airtime budget until sent or withdrawn
+            await self.send_worker.send_and_wait(message, None, priority)
+        except TimeoutError:
+            result = TIMED_OUT
+        except RuntimeError:
+            result = REFUSED
+        finally:
+            self._messages.pop(message_id, None)
+        self.write(RECORDS[b"D"].pack(b"D", message_id, result))
+
+    async def _status(self, request_id: int):
+        payload = dumps(await self.send_worker.status()).encode()
+        self.write(RECORDS[b"A"].pack(b"A", request_id, len(payload)))
+        self.write(payload)
+
+    async def _serve(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter):
+        if self.writer is not None:
+            self.writer.close()
+        self.writer = writer
+        self.write(RECORDS[b"I"].pack(b"I", int(self.device_id, 16)))
+        print("[RADIO] API connected")
+        try:
+            while True:
+                fields, _ = await read_record(reader)
+                if fields[0] == b"C":
+                    _, message_id, enumerator, command, retries, prio = fields
+                    message = OutgoingSchellenbergMessage(
+                        enumerator=f"{enumerator:02X}",
+                        command=Command.from_code(command),
+                        num_retries=retries,
+                    )
+                    self._messages[message_id] = message
+                    asyncio.create_task(self._send(message_id, message, prio))
+                elif fields[0] == b"S":
+                    asyncio.create_task(self._status(fields[1]))
+                elif fields[0] == b"W":
+                    if message := self._messages.get(fields[1]):
+                        self.send_worker.withdraw(message)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            print("[RADIO] API disconnected")
+        except ValueError as e:
+            print(f"[RADIO] Protocol error: {e}")
+        finally:
+            if self.writer is writer:
+                self.writer = None
+            writer.close()
+
+    async def run(self):
+        self.path.unlink(missing_ok=True)
+        server = await asyncio.start_unix_server(self._serve, self.path)
+        # Where a blocked loop delays t0 handling and the next frame
+        monitor = LoopLagMonitor(name="RADIO")
+        monitor.start()
+        self.send_worker.start()
+        self.receive_worker.start()
+        print(f"[RADIO] Radio core listening on {self.path}")
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop.set)
+        async with server:
+            await stop.wait()
+        await self.send_worker.exit()
+        await self.receive_worker.exit()
+        await monitor.exit()
+        self.path.unlink(missing_ok=True)
+
+
+def main() -> None:
+    serial_port = os.environ["SERIAL"]
+    ser = Serial(
+        serial_port,
+        int(os.getenv("RADIO_BAUD_RATE", "115200")),
+        timeout=float(os.getenv("RADIO_SERIAL_TIMEOUT", "1")),
+    )
+    capture_file = os.getenv("CAPTURE_FILE")
+    recorder = FrameRecorder(Path(capture_file)) if capture_file else None
+    try:
+        run_loop(RadioCore(ser, radio_socket_path(), recorder).run())
+    finally:
+        if recorder:
+            recorder.close()
+        SerialIO.of(ser).close()
+        ser.close()
+
+
+# --- API process -------------------------------------------------------------
+
+class RemoteSendWorker:
+    """SendWorker interface, queueing into the radio process."""
+
+    def __init__(self, radio: "RadioProcess"):
+        self.radio = radio
+        self._ids = itertools.count(1)
+        self._messages: dict[int, OutgoingSchellenbergMessage] = {}
+        self._transmitted: dict[int, asyncio.Future[None]] = {}
+
+    def start(self):
+        pass
+
+    async def send(
+        self,
+        message: OutgoingSchellenbergMessage,
+        priority: int = PRIORITY_INTERACTIVE,
+    ):
+        message_id = next(self._ids) & 0xFFFFFFFF
+        self._messages[message_id] = message
+        try:
+            self.radio.write(RECORDS[b"C"].pack(
+                b"C", message_id, int(message.enumerator, 16),
+                message.command.value, message.num_retries, priority,
+            ))
+        except RuntimeError as e:
+            print(f"[RADIO] Dropping {message}: {e}")
+            del self._messages[message_id]
+            _resolve(self._transmitted, message, e)
+
+    async def send_and_wait(
+        self,
+        message: OutgoingSchellenbergMessage,
+        timeout: float | None = 30,
+        priority: int = PRIORITY_INTERACTIVE,
+    ):
+        await _send_and_wait(self, message, timeout, priority)
+
+    def withdraw(self, message: OutgoingSchellenbergMessage) -> None:
+        # Still reported on with D, as timed out unless it already went out
+        for message_id, pending in self._messages.items():
+            if pending is message:
+                try:
+                    self.radio.write(RECORDS[b"W"].pack(b"W", message_id))
+                except RuntimeError:
+                    pass
+                return
+
+    def done(self, message_id: int, result: int):
+        message = self._messages.pop(message_id, None)
+        if message is None:
+            return
+        if result == SENT:
+            message.post_run()
+            _resolve(self._transmitted, message)
+        elif result == TIMED_OUT:
+            _resolve(self._transmitted, message, TimeoutError(
+                f"Timeout transmitting {message}"
+            ))
+        else:
+            _resolve(self._transmitted, message, RuntimeError(
+                f"Stick refused {message}"
+            ))
+
+    def fail_pending(self, error: Exception):
+        """Fail the messages the radio process has not reported on."""
+        messages, self._messages = self._messages, {}
+        for message in messages.values():
+            _resolve(self._transmitted, message, error)
+
+    async def status(self) -> dict[str, object]:
+        return await self.radio.status()
+
+    async def exit(self):
+        pass
+
+
+class RemoteReceiveWorker(ReceiveWorker):
+    """ReceiveWorker interface, fed with the radio process's frames."""
+
+    def __init__(self):
+        super().__init__(None)
+
+    def start(self):
+        pass
+
+
+class RadioProcess:
+    """Starts the radio core as a child process and connects to it."""
+
+    def __init__(self, serial_port: str, baud_rate: int, timeout: float,
+                 path: Path | None = None):
+        self.serial_port = serial_port
+        self.baud_rate = baud_rate
+        self.timeout = timeout
+        self.path = path or radio_socket_path()
+        self.process: asyncio.subprocess.Process | None = None
+        self.writer: asyncio.StreamWriter | None = None
+        self.send_worker = RemoteSendWorker(self)
+        self.receive_worker = RemoteReceiveWorker()
+        self.task: asyncio.Task | None = None
+        self._status_ids = itertools.count(1)
+        self._status: dict[int, asyncio.Future[dict[str, object]]] = {}
+
+    def write(self, data: bytes) -> None:
+        if self.writer is None or self.writer.is_closing():
+            raise RuntimeError("Radio process not connected")
+        self.writer.write(data)
+
+    async def start(self) -> str:
+        """
+        Start the process, returns the stick's own device ID. The process
+        is restarted, with backoff, whenever the connection to it drops.
+        """
+        reader, device_id = await self._spawn()
+        self.task = asyncio.create_task(self._supervise(reader))
+        return device_id
+
+    async def _spawn(self) -> tuple[asyncio.StreamReader, str]:
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "schellenberghack_api.radio",
+            env={
+                **os.environ,
+                "SERIAL": self.serial_port,
+                "RADIO_SOCKET": str(self.path),
+                "RADIO_BAUD_RATE": str(self.baud_rate),
+                "RADIO_SERIAL_TIMEOUT": str(self.timeout),
+            },
+        )
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + CONNECT_TIMEOUT
+        while True:
+            if self.process.returncode is not None:
+                raise RuntimeError(
+                    f"Radio process exited with {self.process.returncode}"
+                )
+            try:
+                reader, self.writer = await asyncio.open_unix_connection(
+                    self.path
+                )
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if loop.time() > deadline:
+                    raise RuntimeError("Radio process did not start")
+                await asyncio.sleep(0.1)
+        (_, device_id), _ = await read_record(reader)
+        print(f"[RADIO] Connected to radio process {self.process.pid}")
+        return reader, f"{device_id:06X}"
+
+    async def _supervise(self, reader: asyncio.StreamReader):
+        loop = asyncio.get_running_loop()
+        delay = RESTART_DELAY
+        while True:
+            connected_at = loop.time()
+            await self._read(reader)
+            self._disconnected()
+            if loop.time() - connected_at > MAX_RESTART_DELAY:
+                delay = RESTART_DELAY
+            while True:
+                print(f"[RADIO] Restarting the radio process in "
+                      f"{delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RESTART_DELAY)
+                await self._terminate()
+                try:
+                    reader, _ = await self._spawn()
+                    break
+                except (OSError, RuntimeError, ValueError,
+                        asyncio.IncompleteReadError) as e:
+                    print(f"[RADIO] Error restarting the radio process: {e}")
+
+    def _disconnected(self):
+        """Fail what waits for the lost process."""
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        error = RuntimeError("Radio process disconnected")
+        self.send_worker.fail_pending(error)
+        for future in self._status.values():
+            if not future.done():
+                future.set_exception(error)
+        self._status.clear()
+
+    async def _read(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                fields, payload = await read_record(reader)
+                kind = fields[0]
+                if kind == b"F":
+                    try:
+                        message = SchellenbergMessageReceived.from_fields(
+                            *fields[1:]
+                        )
+                    except (ValueError, IndexError) as e:
+                        print(f"[RADIO] Error decoding frame: {e}")
+                        continue
+                    await self.receive_worker.handle_message(message)
+                elif kind == b"D":
+                    self.send_worker.done(fields[1], fields[2])
+                elif kind == b"A" and payload is not None:
+                    future = self._status.pop(fields[1], None)
+                    if future and not future.done():
+                        future.set_result(loads(payload))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            print("[RADIO] Radio process disconnected")
+        except ValueError as e:
+            print(f"[RADIO] Protocol error: {e}")
+
+    async def status(self) -> dict[str, object]:
+        request_id = next(self._status_ids) & 0xFFFFFFFF
+        future = asyncio.get_running_loop().create_future()
+        self._status[request_id] = future
+        try:
+            self.write(RECORDS[b"S"].pack(b"S", request_id))
+            async with asyncio.timeout(5):
+                return await future
+        finally:
+            self._status.pop(request_id, None)
+
+    async def stop(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        await self._terminate()
+
+    async def _terminate(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        if self.process and self.process.returncode is None:
+            self.process.terminate()
+            try:
+                async with asyncio.timeout(5):
+                    await self.process.wait()
+            except TimeoutError:
+                self.process.kill()
+
+
+if __name__ == "__main__":
+    main()
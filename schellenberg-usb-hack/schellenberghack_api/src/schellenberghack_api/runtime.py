@@ -0,0 +1,71 @@
+"""
+Runtime profile, ``RUNTIME_PROFILE=standard|performance``.
+
+The performance profile serializes WebSocket, SSE, MQTT and radio socket
+payloads with orjson and runs the radio process on uvloop; the API process
+gets uvloop from uvicorn's ``--loop`` option. Either package missing falls
+back to the standard library. REST responses are left to FastAPI, which
+already serializes typed endpoints with pydantic.
+"""
+
+import asyncio
+import json
+import os
+from typing import Any, Callable, Coroutine, TypeVar
+
+PROFILES = ("standard", "performance")
+RUNTIME_PROFILE = os.getenv("RUNTIME_PROFILE", "standard").lower()
+if RUNTIME_PROFILE not in PROFILES:
+    print(f"[RUNTIME] Unknown profile {RUNTIME_PROFILE!r}, using standard")
+    RUNTIME_PROFILE = "standard"
+PERFORMANCE = RUNTIME_PROFILE == "performance"
+
+T = TypeVar("T")
+
+_orjson = None
+if PERFORMANCE:
+    try:
+        import orjson as _orjson
+    except ImportError:
+        print("[RUNTIME] orjson not installed, serializing with json")
+
+_new_event_loop: Callable[[], asyncio.AbstractEventLoop] | None = None
+if PERFORMANCE:
+    try:
+        import uvloop
+        _new_event_loop = uvloop.new_event_loop
+    except ImportError:
+        print("[RUNTIME] uvloop not installed, running on asyncio")
+
+JSON_CODEC = "orjson" if _orjson else "json"
+
+
+if _orjson is not None:
+    _OPTIONS = _orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any) -> str:
+        return _orjson.dumps(obj, option=_OPTIONS).decode()
+
+    loads = _orjson.loads
+
+else:
+    # Compact like orjson, so only the backend depends on the profile
+    def dumps(obj: Any) -> str:
+        return json.dumps(obj, separators=(",", ":"))
+
+    loads = json.loads
+
+
+def run(main: Coroutine[Any, Any, T]) -> T:
+    """``asyncio.run()`` on the profile's event loop."""
+    with asyncio.Runner(loop_factory=_new_event_loop) as runner:
+        return runner.run(main)
+
+
+def describe() -> str:
+    """Profile, event loop and codec actually in use, for the log."""
+    try:
+        loop = type(asyncio.get_running_loop()).__module__.split(".")[0]
+    except RuntimeError:
+        loop = "uvloop" if _new_event_loop else "asyncio"
+    return f"{RUNTIME_PROFILE} profile, {loop} event loop, {JSON_CODEC}"
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import os
+from pathlib import Path
+
+from schellenberghack.message import DeviceState
+from schellenberghack.settings import settings_path
+
+FLUSH_INTERVAL = 5.0
+
+# A restart outlives any movement, assume it completed
+_SETTLED = {
+    DeviceState.OPENING: DeviceState.OPEN,
+    DeviceState.CLOSING: DeviceState.CLOSED,
+}
+
+
+def state_file_path() -> Path:
+    """``$STATE_FILE`` or states.json next to the settings."""
+    state_file = os.getenv("STATE_FILE")
+    if state_file:
+        return Path(state_file)
+    return settings_path().with_name("states.json")
+
+
+class StateCache:
+    """
+    Last known state per device (Home Assistant slug), kept across
+    restarts. Registered as a state listener of the Home Assistant worker;
+    changes are written at most every ``FLUSH_INTERVAL`` seconds.
+    """
+
+    def __init__(self, path: Path | None = None):
+        self.path = path or state_file_path()
+        self.states: dict[str, DeviceState] = {}
+        self.task: asyncio.Task | None = None
+        self._dirty = False
+
+    def load(self) -> dict[str, DeviceState]:
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+        for name, value in data.items():
+            try:
+                state = DeviceState(value)
+            except ValueError:
+                continue
+            self.states[name] = _SETTLED.get(state, state)
+        print(f"[STATE] Restored {len(self.states)} device states")
+        return dict(self.states)
+
+    def update(self, device_name: str, state: DeviceState, devices=None):
+        if self.states.get(device_name) != state:
+            self.states[device_name] = state
+            self._dirty = True
+
+    def _take(self) -> str | None:
+        """Serialize pending changes, on the event loop."""
+        if not self._dirty:
+            return None
+        self._dirty = False
+        return json.dumps(
+            {name: state.value for name, state in self.states.items()},
+            indent=2,
+        )
+
+    def _write(self, text: str) -> None:
+        tmp = self.path.with_name(f"{self.path.name}.tmp")
+        tmp.write_text(text)
+        os.replace(tmp, self.path)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            text = self._take()
+            if text is None:
+                continue
+            try:
+                await asyncio.to_thread(self._write, text)
+            except OSError as e:
+                print(f"[STATE] Error saving device states: {e}")
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def exit(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        text = self._take()
+        if text is not None:
+            try:
+                self._write(text)
+            except OSError as e:
+                print(f"[STATE] Error saving device states: {e}")
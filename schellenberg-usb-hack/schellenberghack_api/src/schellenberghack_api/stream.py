@@ -0,0 +1,217 @@
+import asyncio
+import os
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Iterable, Mapping
+
+from schellenberghack.message import DeviceState, SchellenbergMessageReceived
+
+from .runtime import dumps
+
+DEFAULT_BACKLOG_SIZE = int(os.getenv("STREAM_BACKLOG_SIZE", "1000"))
+
+
+@dataclass(slots=True)
+class StreamEvent:
+    seq: int
+    event: str  # "frame", "state" or "registry"
+    data: dict[str, object]
+    # (sender_id, enumerator) pairs the event concerns, used for filtering
+    devices: tuple[tuple[str, str], ...] = ()
+    command: str | None = None
+    _encoded: str | None = None
+
+    def matches(
+        self,
+        sender: str | None = None,
+        receiver: str | None = None,
+        command: str | None = None,
+    ) -> bool:
+        if command is not None and self.command != command:
+            return False
+        if sender is None and receiver is None:
+            return True
+        return any(
+            (sender is None or sender == device_sender)
+            and (receiver is None or receiver == enumerator)
+            for device_sender, enumerator in self.devices
+        )
+
+    def encode(self) -> str:
+        """WebSocket delta message, serialized once for all clients."""
+        if self._encoded is None:
+            self._encoded = dumps(
+                {"type": self.event, "seq": self.seq, "data": self.data}
+            )
+        return self._encoded
+
+
+@dataclass(slots=True)
+class StreamFilter:
+    sender: str | None = None
+    receiver: str | None = None
+    command: str | None = None
+    # Subscriptions: sender IDs and device names (HA slugs) to watch,
+    # None meaning everything
+    senders: set[str] | None = None
+    names: set[str] | None = None
+    # (sender_id, enumerator) pairs of ``names`` and their senders,
+    # resolved when subscribing
+    devices: set[tuple[str, str]] = field(default_factory=set)
+    device_senders: set[str] = field(default_factory=set)
+
+    def subscribe(
+        self,
+        senders: set[str] | None,
+        names: set[str] | None,
+        device_mapping: Mapping[str, list[tuple[str, str]]],
+    ) -> None:
+        """Watch ``senders`` and the devices called ``names``."""
+        self.senders = senders
+        self.names = names
+        self.devices = {
+            device
+            for name in names or ()
+            for device in device_mapping.get(name, ())
+        }
+        self.device_senders = {sender for sender, _ in self.devices}
+
+    @property
+    def subscribed(self) -> bool:
+        return self.senders is not None or self.names is not None
+
+    def wants_sender(self, sender_id: str) -> bool:
+        return not self.subscribed or sender_id in self.device_senders \
+            or self.senders is not None and sender_id in self.senders
+
+    def wants_device(
+        self, name: str, devices: Iterable[tuple[str, str]]
+    ) -> bool:
+        if not self.subscribed or self.names is not None \
+                and name in self.names:
+            return True
+        return self.senders is not None \
+            and any(sender in self.senders for sender, _ in devices)
+
+    def matches(self, event: StreamEvent) -> bool:
+        if not event.matches(self.sender, self.receiver, self.command):
+            return False
+        if not self.subscribed:
+            return True
+        if event.event == "state" and self.names is not None \
+                and event.data.get("device") in self.names:
+            return True
+        for sender, enumerator in event.devices:
+            if self.senders is not None and sender in self.senders:
+                return True
+            if (sender, enumerator) in self.devices:
+                return True
+            # Registry events concern a whole sender
+            if not enumerator and sender in self.device_senders:
+                return True
+        return False
+
+
+class EventStream:
+    """
+    Sequence-numbered broadcast of radio frames and device state changes.
+
+    The last ``backlog_size`` events are kept so clients can resume after a
+    reconnect from the last sequence number they saw. Sequence numbers
+    restart with the process, so event IDs handed out carry a random
+    per-process ``epoch`` to tell them apart.
+    """
+
+    def __init__(self, backlog_size: int = DEFAULT_BACKLOG_SIZE):
+        self.backlog: deque[StreamEvent] = deque(maxlen=backlog_size)
+        self.epoch = os.urandom(4).hex()
+        self._next_seq = 0
+        self._published = asyncio.Event()
+
+    @property
+    def last_seq(self) -> int:
+        return self._next_seq - 1
+
+    def publish(
+        self,
+        event: str,
+        data: dict[str, object],
+        devices: tuple[tuple[str, str], ...] = (),
+        command: str | None = None,
+    ) -> StreamEvent:
+        item = StreamEvent(self._next_seq, event, data, devices, command)
+        self._next_seq += 1
+        self.backlog.append(item)
+        # Wake every waiting subscriber, then arm a fresh event
+        self._published.set()
+        self._published = asyncio.Event()
+        return item
+
+    def publish_frame(self, message: SchellenbergMessageReceived):
+        return self.publish(
+            "frame",
+            message.to_dict(),
+            ((message.sender.device_id, message.receiver),),
+            message.command.name,
+        )
+
+    def publish_state(
+        self,
+        device_name: str,
+        state: DeviceState,
+        devices: list[tuple[str, str]],
+    ):
+        return self.publish(
+            "state",
+            {"device": device_name, "state": state.value},
+            tuple(devices),
+        )
+
+    def publish_registry(self, sender_data: dict[str, object]):
+        """Announce an added, renamed or changed sender."""
+        sender_id = str(sender_data["device_id"])
+        return self.publish(
+            "registry", {"sender": sender_data}, ((sender_id, ""),)
+        )
+
+    def event_id(self, item: StreamEvent) -> str:
+        return f"{self.epoch}-{item.seq}"
+
+    def resume_seq(self, event_id: str | None) -> int | None:
+        """
+        Sequence number to resume after for a client's last event ID, None
+        for a new client. An ID of an earlier process, or one this process
+        has not handed out yet, replays the whole backlog.
+        """
+        if not event_id:
+            return None
+        epoch, _, seq = event_id.rpartition("-")
+        if epoch and epoch != self.epoch or not seq.isdigit() \
+                or int(seq) > self.last_seq:
+            return -1
+        return int(seq)
+
+    def since(self, last_seq: int) -> list[StreamEvent]:
+        """Events newer than ``last_seq`` still held in the backlog."""
+        if not self.backlog or last_seq >= self.last_seq:
+            return []
+        start = max(0, last_seq + 1 - self.backlog[0].seq)
+        return [self.backlog[i] for i in range(start, len(self.backlog))]
+
+    async def subscribe(
+        self,
+        last_seq: int | None = None,
+        stream_filter: StreamFilter | None = None,
+    ) -> AsyncIterator[StreamEvent]:
+        """
+        Yield matching events after ``last_seq`` (or only new ones when it
+        is ``None``), first from the backlog, then live.
+        """
+        cursor = self.last_seq if last_seq is None else last_seq
+        while True:
+            published = self._published
+            for item in self.since(cursor):
+                cursor = item.seq
+                if stream_filter is None or stream_filter.matches(item):
+                    yield item
+            await published.wait()
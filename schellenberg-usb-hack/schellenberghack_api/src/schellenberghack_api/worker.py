@@ -1,27 +1,198 @@
 import asyncio
+import itertools
 import os
-from asyncio import Event, Lock, Queue
+import weakref
+from asyncio import Event, Lock, PriorityQueue, Queue
+from concurrent.futures import ThreadPoolExecutor
 
 from schellenberghack.commands import Command
 from schellenberghack.message import (
     OutgoingSchellenbergMessage,
     SchellenbergMessageReceived,
 )
-from serial import Serial
+from serial import Serial, SerialTimeoutException
+
+from .airtime import (KEEP_ORDER, PRIORITY_INTERACTIVE, PRIORITY_STOP,
+                      AirtimeBudget)
+from .capture import FrameRecorder
+from .pairing import PairingManager
 
 transmitterLock = Lock()
 finished_transmission = Event()
+transmission_refused = Event()
+# Fed by the stick's t1/t0/tE, consulted before every transmission
+airtime = AirtimeBudget()
 
 # Mock mode flag
 MOCK_MODE = os.getenv("MOCK_SERIAL", "false").lower() in ("true", "1", "yes")
+# Longest a frame may take to reach the driver before the send fails
+WRITE_TIMEOUT = float(os.getenv("SERIAL_WRITE_TIMEOUT", "2"))
+
+
+def _resolve(
+    futures: dict[int, asyncio.Future[None]],
+    message: OutgoingSchellenbergMessage,
+    error: Exception | None = None,
+) -> None:
+    future = futures.pop(id(message), None)
+    if future is None or future.done():
+        return
+    if error is None:
+        future.set_result(None)
+    else:
+        future.set_exception(error)
+
+
+class SerialIO:
+    """
+    The blocking calls on a serial port, each direction on a thread of
+    its own, so the event loop never waits for the tty. A single thread
+    would queue every write behind a ``readline()`` that blocks for up
+    to the port's read timeout.
+
+    Send and receive worker of a port share one instance, see ``of()``.
+    """
+
+    _ports: "weakref.WeakKeyDictionary[Serial, SerialIO]" = (
+        weakref.WeakKeyDictionary()
+    )
+
+    def __init__(self, ser: Serial, write_timeout: float = WRITE_TIMEOUT):
+        self.ser = ser
+        self.write_timeout = write_timeout
+        # Also bounds the writing thread if the USB endpoint stalls
+        ser.write_timeout = write_timeout
+        self._reader = ThreadPoolExecutor(1, "serial-read")
+        self._writer = ThreadPoolExecutor(1, "serial-write")
+
+    @classmethod
+    def of(cls, ser: Serial) -> "SerialIO":
+        io = cls._ports.get(ser)
+        if io is None:
+            io = cls._ports[ser] = cls(ser)
+        return io
+
+    def _readline(self) -> bytes:
+        return self.ser.readline().strip()
+
+    async def readline(self) -> bytes:
+        """The next stripped line, or b"" after the read timeout."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._reader, self._readline
+        )
+
+    async def write(self, data: bytes) -> None:
+        """
+        Return once ``data`` was handed to the driver. Raises TimeoutError
+        after ``write_timeout`` seconds and OSError if the port failed.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            async with asyncio.timeout(self.write_timeout):
+                await loop.run_in_executor(self._writer, self.ser.write, data)
+        except SerialTimeoutException as e:
+            raise TimeoutError(str(e)) from e
+
+    def close(self):
+        self._reader.shutdown(wait=False, cancel_futures=True)
+        self._writer.shutdown(wait=False, cancel_futures=True)
+
+
+def stick_handshake(ser: Serial) -> str:
+    """Greet the stick and return its own device ID."""
+    ser.write(b"hello\n")
+    print(f"[SERIAL] Connected to {ser.name}")
+    ser.write(b"!?\n")
+    print(str(ser.readline().strip(), "ascii"))
+
+    ser.write(b"sr\n")
+    own_id = str(ser.readline().strip(), "ascii")[2:]
+    print(f"{own_id=}")
+    return own_id
+
+
+async def _send_and_wait(
+    worker, message: OutgoingSchellenbergMessage, timeout: float | None,
+    priority: int,
+):
+    future = asyncio.get_running_loop().create_future()
+    worker._transmitted[id(message)] = future
+    try:
+        await worker.send(message, priority)
+        async with asyncio.timeout(timeout) as deadline:
+            await future
+    except TimeoutError:
+        if not deadline.expired():
+            raise
+        # Nobody waits for it any more, so it must not go out late
+        worker._transmitted.pop(id(message), None)
+        worker.withdraw(message)
+        raise TimeoutError(f"Timeout waiting to send {message}") from None
+    finally:
+        worker._transmitted.pop(id(message), None)
+
+
+class _Scheduler:
+    """
+    Send queue ordered by priority, then arrival. A message the airtime
+    budget can't afford yet goes back into the queue until the budget
+    allows it or something more urgent arrives.
+    """
+
+    def __init__(self):
+        self.queue: PriorityQueue[
+            tuple[int, int, OutgoingSchellenbergMessage]
+        ] = PriorityQueue()
+        self._order = itertools.count()
+        self._enqueued = Event()
+
+    def put(self, message: OutgoingSchellenbergMessage, priority: int):
+        if priority & KEEP_ORDER:
+            priority &= ~KEEP_ORDER
+        elif message.command == Command.STOP:
+            priority = PRIORITY_STOP
+        self.queue.put_nowait((priority, next(self._order), message))
+        self._enqueued.set()
+
+    def withdraw(self, message: OutgoingSchellenbergMessage) -> bool:
+        """Take a message out of the queue, False if it already left."""
+        entries = []
+        while not self.queue.empty():
+            entries.append(self.queue.get_nowait())
+        for entry in entries:
+            if entry[2] is not message:
+                self.queue.put_nowait(entry)
+        return len(entries) != self.queue.qsize()
+
+    async def get(self) -> OutgoingSchellenbergMessage:
+        while True:
+            entry = await self.queue.get()
+            delay = airtime.delay(entry[0])
+            if delay <= 0:
+                return entry[2]
+            airtime.stats["deferred"] += 1
+            print(f"[AIRTIME] Deferring {entry[2]} for {delay:.1f} s, "
+                  f"{airtime.used():.1f}/{airtime.limit:.0f} s used")
+            self._enqueued.clear()
+            self.queue.put_nowait(entry)
+            try:
+                async with asyncio.timeout(delay):
+                    await self._enqueued.wait()
+            except TimeoutError:
+                pass
 
 
 class SendWorker:
-    def __init__(self, serial: Serial):
+    def __init__(self, serial: Serial, recorder: FrameRecorder | None = None):
         self.ser = serial
+        self.io = SerialIO.of(serial)
+        self.recorder = recorder
         self.exit_event = Event()
-        self.queue: Queue[OutgoingSchellenbergMessage] = Queue()
+        self.scheduler = _Scheduler()
+        self.queue = self.scheduler.queue
         self.task = None
+        # Futures of messages whose transmission someone waits for
+        self._transmitted: dict[int, asyncio.Future[None]] = {}
 
     def start(self):
         self.task = asyncio.create_task(self._run())
@@ -29,27 +200,96 @@ class SendWorker:
     async def _run(self):
         try:
             while self.ser.is_open and not self.exit_event.is_set():
-                message = await self.queue.get()
+                message = await self.scheduler.get()
                 message.pre_run()
                 try:
                     async with asyncio.timeout(10):
                         async with transmitterLock:
-                            message.run(self.ser)
+                            frame = bytes(message)
+                            try:
+                                await self.io.write(frame)
+                            except TimeoutError:
+                                print(f"[SERIAL] Timeout writing {message}")
+                                _resolve(self._transmitted, message,
+                                         TimeoutError(
+                                             f"Timeout writing {message}"
+                                         ))
+                                continue
+                            except OSError as e:
+                                print(f"[SERIAL] Error writing {message}: "
+                                      f"{e}")
+                                _resolve(self._transmitted, message,
+                                         RuntimeError(
+                                             f"Error writing {message}: {e}"
+                                         ))
+                                continue
+                            if self.recorder:
+                                self.recorder.record_tx(frame)
                             try:
                                 async with asyncio.timeout(10):
                                     await finished_transmission.wait()
                             finally:
                                 finished_transmission.clear()
+                            if transmission_refused.is_set():
+                                transmission_refused.clear()
+                                print(f"[AIRTIME] Stick refused {message}")
+                                _resolve(
+                                    self._transmitted, message, RuntimeError(
+                                        f"Stick refused {message}"
+                                    )
+                                )
+                                continue
                             message.post_run()
+                            _resolve(self._transmitted, message)
                 except asyncio.TimeoutError:
-                    transmitterLock.release()
+                    # Held by the receive worker after a t1 without t0
+                    if transmitterLock.locked():
+                        transmitterLock.release()
                     print("Timeout in SendWorker")
+                    _resolve(self._transmitted, message, TimeoutError(
+                        f"Timeout transmitting {message}"
+                    ))
         except asyncio.CancelledError:
             print("SendWorker cancelled")
             raise
 
-    async def send(self, message: OutgoingSchellenbergMessage):
-        await self.queue.put(message)
+    async def send(
+        self,
+        message: OutgoingSchellenbergMessage,
+        priority: int = PRIORITY_INTERACTIVE,
+    ):
+        """
+        Queue a message. STOP goes first unless ``KEEP_ORDER`` is set in
+        ``priority``; ``PRIORITY_BULK`` traffic is held back once it would
+        use the airtime reserved for interactive commands.
+        """
+        self.scheduler.put(message, priority)
+
+    async def send_and_wait(
+        self,
+        message: OutgoingSchellenbergMessage,
+        timeout: float | None = 30,
+        priority: int = PRIORITY_INTERACTIVE,
+    ):
+        """
+        Send a message and return once the stick reported ``t0`` for it.
+        Raises TimeoutError if that takes longer than ``timeout`` seconds,
+        queueing included, withdrawing it if it is still queued, and
+        RuntimeError if the stick refused it.
+        """
+        await _send_and_wait(self, message, timeout, priority)
+
+    def withdraw(self, message: OutgoingSchellenbergMessage) -> None:
+        """Drop a message that has not been sent yet."""
+        if self.scheduler.withdraw(message):
+            print(f"[SERIAL] Withdrew {message}")
+            _resolve(self._transmitted, message, TimeoutError(
+                f"Withdrew {message}"
+            ))
+
+    async def status(self) -> dict[str, object]:
+        """Airtime budget usage and the number of queued messages."""
+        return {**airtime.usage(), "queued": self.queue.qsize()}
 
     async def exit(self):
         self.exit_event.set()
@@ -62,10 +302,28 @@ class SendWorker:
 
 
 class ReceiveWorker:
-    def __init__(self, serial: Serial):
+    def __init__(
+        self,
+        serial: Serial | None,
+        recorder: FrameRecorder | None = None,
+        isolated: bool = False,
+    ):
         self.ser = serial
-        self.pairing_message_received = Event()
-        self.last_pairing_message: SchellenbergMessageReceived | None = None
+        self.io = SerialIO.of(serial) if serial is not None else None
+        self.recorder = recorder
+        # Transmitter state shared with the send worker, or with
+        # ``isolated`` (a replay) a budget, lock and events of its own
+        if isolated:
+            self.airtime = AirtimeBudget()
+            self.transmitter_lock = Lock()
+            self.finished_transmission = Event()
+            self.transmission_refused = Event()
+        else:
+            self.airtime = airtime
+            self.transmitter_lock = transmitterLock
+            self.finished_transmission = finished_transmission
+            self.transmission_refused = transmission_refused
+        self.pairing = PairingManager()
         self.receivedMessages: Queue[SchellenbergMessageReceived] = Queue()
         self.exit_event = Event()
         self.task = None
@@ -74,72 +332,64 @@ class ReceiveWorker:
         self.task = asyncio.create_task(self._run())
 
     async def _run(self):
-        loop = asyncio.get_event_loop()
+        if self.ser is None or self.io is None:
+            raise RuntimeError("ReceiveWorker started without serial port")
+        ser = self.ser
         try:
-            while self.ser.is_open and not self.exit_event.is_set():
+            while ser.is_open and not self.exit_event.is_set():
                 try:
-                    response = await loop.run_in_executor(
-                        None, lambda: self.ser.readline().strip()
-                    )
+                    response = await self.io.readline()
                 except Exception:
                     continue
                 if response:
-                    if response == b"t1":
-                        print("[SERIAL] transmitter lock")
-                        if not transmitterLock.locked():
-                            await transmitterLock.acquire()
-                        continue
-                    if response == b"t0":
-                        print("[SERIAL] transmitter unlock")
-                        finished_transmission.set()
-                        continue
-                    if response == b"tE":
-                        raise RuntimeError("Transmitter error")
-                    try:
-                        message = SchellenbergMessageReceived.from_bytes(
-                            response
-                        )
-                        await self.receivedMessages.put(message)
-                        print(f"[RECEIVED] {message}")
-                        if message.command == Command.ALLOW_PAIRING:
-                            self.last_pairing_message = message
-                            self.pairing_message_received.set()
-                    except ValueError as e:
-                        print(
-                            f"[RECEIVED] Error parsing message: "
-                            f"{e} ({response})"
-                        )
+                    if self.recorder:
+                        self.recorder.record_rx(response)
+                    await self.handle_line(response)
         except asyncio.CancelledError:
             print("ReceiveWorker cancelled")
             raise
 
+    async def handle_line(self, response: bytes):
+        """Process a single stripped line read from the stick."""
+        if response == b"t1":
+            print("[SERIAL] transmitter lock")
+            self.airtime.transmitter_on()
+            if not self.transmitter_lock.locked():
+                await self.transmitter_lock.acquire()
+            return
+        if response == b"t0":
+            print("[SERIAL] transmitter unlock")
+            self.airtime.transmitter_off()
+            self.finished_transmission.set()
+            return
+        if response == b"tE":
+            # Refused, most likely out of duty cycle: back off instead of
+            # letting the send worker wait for a t0 that never comes
+            print("[SERIAL] transmitter error, backing off")
+            self.airtime.refused()
+            self.transmission_refused.set()
+            self.finished_transmission.set()
+            return
+        await self.handle_frame(response)
+
+    async def handle_frame(self, response: bytes):
+        try:
+            message = SchellenbergMessageReceived.from_bytes(response)
+        except ValueError as e:
+            print(f"[RECEIVED] Error parsing message: {e} ({response})")
+            return
+        await self.handle_message(message)
+
+    async def handle_message(self, message: SchellenbergMessageReceived):
+        await self.receivedMessages.put(message)
+        print(f"[RECEIVED] {message}")
+        if message.command == Command.ALLOW_PAIRING:
+            self.pairing.dispatch(message)
+
     async def wait_for_pairing_message(
         self, device_id: str, timeout: float = 10
     ) -> SchellenbergMessageReceived | None:
-        self.pairing_message_received.clear()
-        print("Waiting for pairing message...")
-        while True:
-            try:
-                async with asyncio.timeout(timeout):
-                    await self.pairing_message_received.wait()
-            except asyncio.TimeoutError:
-                print("Timeout waiting for pairing message.")
-                return None
-            except KeyboardInterrupt:
-                return None
-            await asyncio.sleep(1)  # wait for finished sending
-            if self.last_pairing_message:
-                if self.last_pairing_message.sender.device_id != device_id:
-                    print(
-                        f"Received pairing message from unexpected device "
-                        f"{self.last_pairing_message.sender.device_id}, "
-                        f"expected {device_id}. Ignoring."
-                    )
-                    self.pairing_message_received.clear()
-                    continue
-            print("Pairing message received!")
-            self.pairing_message_received.clear()
-            return self.last_pairing_message
+        return await self.pairing.wait(device_id, timeout)
 
     async def exit(self):
         self.exit_event.set()
@@ -157,8 +407,10 @@ class MockSendWorker:
     def __init__(self, serial: Serial | None = None):
         self.ser = serial
         self.exit_event = Event()
-        self.queue: Queue[OutgoingSchellenbergMessage] = Queue()
+        self.scheduler = _Scheduler()
+        self.queue = self.scheduler.queue
         self.task = None
+        self._transmitted: dict[int, asyncio.Future[None]] = {}
         print("MockSendWorker initialized (no serial connection required)")
 
     def start(self):
@@ -167,7 +419,7 @@ class MockSendWorker:
     async def _run(self):
         try:
             while not self.exit_event.is_set():
-                message = await self.queue.get()
+                message = await self.scheduler.get()
                 message.pre_run()
                 print(f"[MOCK] Would send message: {message}")
 
@@ -175,18 +427,43 @@ class MockSendWorker:
                 async with asyncio.timeout(1):
                     async with transmitterLock:
                         # Simulate sending without actual serial
+                        airtime.transmitter_on()
                         await asyncio.sleep(0.1)  # Simulate transmission delay
+                        airtime.transmitter_off()
                         finished_transmission.set()
                         await asyncio.sleep(0.1)
                         finished_transmission.clear()
                         message.post_run()
+                        _resolve(self._transmitted, message)
                         print("[MOCK] Message sent successfully")
         except asyncio.CancelledError:
             print("MockSendWorker cancelled")
             raise
 
-    async def send(self, message: OutgoingSchellenbergMessage):
-        await self.queue.put(message)
+    async def send(
+        self,
+        message: OutgoingSchellenbergMessage,
+        priority: int = PRIORITY_INTERACTIVE,
+    ):
+        self.scheduler.put(message, priority)
+
+    async def send_and_wait(
+        self,
+        message: OutgoingSchellenbergMessage,
+        timeout: float | None = 30,
+        priority: int = PRIORITY_INTERACTIVE,
+    ):
+        await _send_and_wait(self, message, timeout, priority)
+
+    def withdraw(self, message: OutgoingSchellenbergMessage) -> None:
+        if self.scheduler.withdraw(message):
+            print(f"[MOCK] Withdrew {message}")
+            _resolve(self._transmitted, message, TimeoutError(
+                f"Withdrew {message}"
+            ))
+
+    async def status(self) -> dict[str, object]:
+        return {**airtime.usage(), "queued": self.queue.qsize()}
 
     async def exit(self):
         self.exit_event.set()
@@ -203,8 +480,7 @@ class MockReceiveWorker:
 
     def __init__(self, serial: Serial | None = None):
         self.ser = serial
-        self.pairing_message_received = Event()
-        self.last_pairing_message: SchellenbergMessageReceived | None = None
+        self.pairing = PairingManager()
         self.receivedMessages: Queue[SchellenbergMessageReceived] = Queue()
         self.exit_event = Event()
         self.task = None
@@ -231,23 +507,17 @@ class MockReceiveWorker:
         await self.receivedMessages.put(message)
         print(f"[MOCK] Simulated incoming message: {message}")
         if message.command == Command.ALLOW_PAIRING:
-            self.last_pairing_message = message
-            self.pairing_message_received.set()
+            self.pairing.dispatch(message)
 
     async def wait_for_pairing_message(
         self, device_id: str, timeout: float = 10
     ) -> SchellenbergMessageReceived | None:
-        """Mock pairing - simulates successful pairing."""
-        self.pairing_message_received.clear()
+        """
+        Mock pairing: waits for a frame from simulate_incoming_message(),
+        at most 2 seconds, and None means the simulation completed.
+        """
         print(f"[MOCK] Simulating pairing for device {device_id}...")
-
-        # Simulate a short wait
-        await asyncio.sleep(2)
-
-        # Create a mock pairing message
-        print(f"[MOCK] Pairing simulation complete for device {device_id}")
-        # Return None to indicate mock mode
-        return None
+        return await self.pairing.wait(device_id, min(timeout, 2))
 
     async def exit(self):
         self.exit_event.set()
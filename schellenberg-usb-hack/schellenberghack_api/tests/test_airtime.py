@@ -0,0 +1,95 @@
+import pytest
+
+from schellenberghack_api.airtime import (PRIORITY_BULK,
+                                          PRIORITY_INTERACTIVE,
+                                          PRIORITY_STOP, REFUSED_BACKOFF,
+                                          AirtimeBudget)
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def budget(clock: Clock) -> AirtimeBudget:
+    # 1% of an hour is 36 s, 27 s of them for bulk traffic
+    return AirtimeBudget(duty_cycle=0.01, reserve=0.25, clock=clock)
+
+
+def transmit(airtime: AirtimeBudget, clock: Clock, seconds: float,
+             count: int = 1) -> None:
+    for _ in range(count):
+        airtime.transmitter_on()
+        clock.now += seconds
+        airtime.transmitter_off()
+
+
+def test_interactive_commands_use_the_whole_limit():
+    clock = Clock()
+    airtime = budget(clock)
+    assert airtime.limit == pytest.approx(36.0)
+
+    first_end = clock.now + 1
+    transmit(airtime, clock, 1.0, count=35)
+    assert airtime.used() == pytest.approx(35.0)
+    assert airtime.delay(PRIORITY_INTERACTIVE) == 0.0
+
+    transmit(airtime, clock, 1.0)
+    # Until the oldest transmission leaves the window
+    assert airtime.delay(PRIORITY_INTERACTIVE) == pytest.approx(
+        first_end + 3600 - clock.now
+    )
+    clock.now = first_end + 3600
+    assert airtime.delay(PRIORITY_INTERACTIVE) == 0.0
+    assert airtime.used() == pytest.approx(35.0)
+
+
+def test_bulk_traffic_leaves_the_reserve_to_interactive_commands():
+    clock = Clock()
+    airtime = budget(clock)
+    transmit(airtime, clock, 1.0, count=26)
+    assert airtime.delay(PRIORITY_BULK) == 0.0
+
+    transmit(airtime, clock, 1.0)
+    assert airtime.delay(PRIORITY_BULK) > 0
+    assert airtime.delay(PRIORITY_INTERACTIVE) == 0.0
+
+
+def test_stop_never_waits():
+    clock = Clock()
+    airtime = budget(clock)
+    transmit(airtime, clock, 1.0, count=40)
+    assert airtime.delay(PRIORITY_INTERACTIVE) > 0
+    assert airtime.delay(PRIORITY_STOP) == 0.0
+
+
+def test_the_window_forgets_old_transmissions():
+    clock = Clock()
+    airtime = budget(clock)
+    transmit(airtime, clock, 2.0, count=3)
+    clock.now += 3600
+    assert airtime.used() == 0.0
+    assert airtime.usage()["transmissions"] == 3
+
+
+def test_refusal_blocks_all_but_stop_for_the_backoff():
+    clock = Clock()
+    airtime = budget(clock)
+    airtime.transmitter_on()
+    airtime.refused()
+    assert airtime.stats["refused"] == 1
+    assert airtime.delay(PRIORITY_INTERACTIVE) == REFUSED_BACKOFF
+    assert airtime.delay(PRIORITY_STOP) == 0.0
+
+    clock.now += REFUSED_BACKOFF / 2
+    assert airtime.delay(PRIORITY_BULK) == REFUSED_BACKOFF / 2
+    assert airtime.usage()["blocked_s"] == REFUSED_BACKOFF / 2
+
+    clock.now += REFUSED_BACKOFF / 2
+    assert airtime.delay(PRIORITY_INTERACTIVE) == 0.0
+    # The refused transmission used no airtime
+    airtime.transmitter_off()
+    assert airtime.used() == 0.0
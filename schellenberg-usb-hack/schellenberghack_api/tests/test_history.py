@@ -0,0 +1,97 @@
+import pytest
+from schellenberghack.commands import Command
+
+from schellenberghack_api.history import EventHistory
+
+SENDER_A = 0x123456
+SENDER_B = 0xABCDEF
+
+
+def append(history: EventHistory, sender: int, timestamp: float,
+           receiver: int = 1, command: Command = Command.UP) -> int:
+    return history.append(sender, receiver, command.value, 0, 0, 0,
+                          timestamp)
+
+
+def seqs(events: list[dict[str, object]]) -> list[object]:
+    return [event["seq"] for event in events]
+
+
+def test_capacity_must_be_positive():
+    with pytest.raises(ValueError):
+        EventHistory(0)
+
+
+def test_query_returns_newest_matches_oldest_first():
+    history = EventHistory(10)
+    for index in range(5):
+        append(history, SENDER_A, 100.0 + index)
+
+    assert seqs(history.query()) == [0, 1, 2, 3, 4]
+    assert seqs(history.query(limit=2)) == [3, 4]
+    event = history.query(limit=1)[0]
+    assert event["sender"] == "123456"
+    assert event["receiver"] == "01"
+    assert event["command"] == "UP"
+    assert event["timestamp"] == 104.0
+
+
+def test_wraparound_keeps_the_last_capacity_events():
+    history = EventHistory(4)
+    for index in range(10):
+        append(history, SENDER_A if index % 2 else SENDER_B, float(index))
+
+    assert len(history) == 4
+    assert history.oldest_seq == 6
+    assert history.last_seq == 9
+    assert seqs(history.query()) == [6, 7, 8, 9]
+    # The per-sender chains end at the oldest event still in the ring
+    assert seqs(history.query(sender="123456")) == [7, 9]
+    assert seqs(history.query(sender="ABCDEF")) == [6, 8]
+
+
+def test_sender_evicted_from_the_ring_has_no_events():
+    history = EventHistory(3)
+    append(history, SENDER_A, 0.0)
+    for index in range(3):
+        append(history, SENDER_B, float(index + 1))
+
+    assert history.query(sender="123456") == []
+    assert seqs(history.query(sender="ABCDEF")) == [1, 2, 3]
+
+
+def test_filters_by_sender_receiver_and_command():
+    history = EventHistory(10)
+    append(history, SENDER_A, 1.0, receiver=1, command=Command.UP)
+    append(history, SENDER_B, 2.0, receiver=1, command=Command.DOWN)
+    append(history, SENDER_A, 3.0, receiver=2, command=Command.DOWN)
+    append(history, SENDER_A, 4.0, receiver=1, command=Command.STOP)
+
+    assert seqs(history.query(sender="123456")) == [0, 2, 3]
+    assert seqs(history.query(receiver="01")) == [0, 1, 3]
+    assert seqs(history.query(command=Command.DOWN)) == [1, 2]
+    assert seqs(history.query(sender="123456", receiver="01",
+                              command=Command.STOP)) == [3]
+    assert history.query(sender="000001") == []
+
+
+def test_time_window():
+    history = EventHistory(10)
+    for index in range(5):
+        append(history, SENDER_A, 10.0 * index)
+
+    assert seqs(history.query(since=15.0)) == [2, 3, 4]
+    assert seqs(history.query(until=15.0)) == [0, 1]
+    assert seqs(history.query(since=10.0, until=30.0)) == [1, 2, 3]
+
+
+def test_time_window_survives_a_clock_stepping_back():
+    history = EventHistory(10)
+    append(history, SENDER_A, 100.0)
+    append(history, SENDER_A, 200.0)
+    # Wall clock set back by NTP: newer events carry older timestamps
+    append(history, SENDER_A, 50.0)
+    append(history, SENDER_A, 150.0)
+
+    assert seqs(history.query(since=120.0)) == [1, 3]
+    assert seqs(history.query(sender="123456", since=120.0)) == [1, 3]
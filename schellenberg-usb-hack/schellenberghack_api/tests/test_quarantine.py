@@ -0,0 +1,91 @@
+from schellenberghack.devices import device_key
+from schellenberghack.quarantine import SenderQuarantine
+from schellenberghack.settings import Settings
+
+SELF = 0xABCDEF
+NEIGHBOUR = 0x123456
+
+
+def in_memory_settings(promote_after: int = 3) -> Settings:
+    settings = Settings()
+    settings._quarantine = SenderQuarantine(promote_after=promote_after)
+    return settings
+
+
+def test_repeats_of_a_frame_count_once():
+    quarantine = SenderQuarantine()
+    key = device_key(NEIGHBOUR, 1)
+    for _ in range(4):
+        entry = quarantine.sight(key, counter=7)
+    assert entry.sightings == 1
+
+    quarantine.sight(key, counter=8)
+    entry = quarantine.sight(key, counter=8)
+    assert entry.sightings == 2
+
+
+def test_frames_without_a_counter_always_count():
+    quarantine = SenderQuarantine()
+    for _ in range(3):
+        entry = quarantine.sight(device_key(NEIGHBOUR, 1))
+    assert entry.sightings == 3
+
+
+def test_collects_the_receivers_a_sender_addressed():
+    quarantine = SenderQuarantine()
+    quarantine.sight(device_key(NEIGHBOUR, 1), 1)
+    entry = quarantine.sight(device_key(NEIGHBOUR, 0x0A), 2)
+    assert entry.to_dict()["receivers"] == ["01", "0A"]
+
+
+def test_least_recently_heard_sender_is_evicted():
+    quarantine = SenderQuarantine(capacity=2)
+    quarantine.sight(device_key(0x000001, 1))
+    quarantine.sight(device_key(0x000002, 1))
+    quarantine.sight(device_key(0x000001, 1))
+    quarantine.sight(device_key(0x000003, 1))
+
+    assert len(quarantine) == 2
+    assert quarantine.evicted == 1
+    assert quarantine.pop(0x000002) is None
+    assert [entry.record.key for entry in quarantine.entries()] == [
+        0x000003, 0x000001
+    ]
+
+
+def test_unknown_sender_is_promoted_after_enough_sightings():
+    settings = in_memory_settings(promote_after=3)
+    key = device_key(NEIGHBOUR, 2)
+
+    for counter in range(2):
+        settings.touch_device(key, counter)
+        # Repeats of the same frame do not bring the promotion closer
+        settings.touch_device(key, counter)
+    assert settings.get_sender_by_id("123456") is None
+    assert [entry.sightings for entry in settings.quarantined()] == [2]
+
+    version = settings.version
+    sender = settings.touch_device(key, 2)
+    assert settings.get_sender_by_id("123456") is sender
+    assert list(sender.devices) == [2]
+    assert settings.quarantined() == []
+    assert settings.version > version
+
+
+def test_known_sender_learns_new_devices_right_away():
+    settings = in_memory_settings()
+    settings.set_self_sender(f"{SELF:06X}")
+
+    sender = settings.touch_device(device_key(SELF, 5), 1)
+    assert settings.get_sender_by_id(f"{SELF:06X}") is sender
+    assert list(sender.devices) == [5]
+    assert settings.quarantined() == []
+
+
+def test_promote_sender_keeps_the_receivers_heard():
+    settings = in_memory_settings()
+    settings.touch_device(device_key(NEIGHBOUR, 3), 1)
+
+    sender = settings.promote_sender("123456")
+    assert list(sender.devices) == [3]
+    assert settings.quarantined() == []